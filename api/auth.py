@@ -1,25 +1,138 @@
 # api/auth.py
 
+import threading
+import time
+from concurrent.futures import Future
+
 import streamlit as st
-import requests
-from config.settings import AUTH_URL
+from api import client
+from config.settings import AUTH_URL, TOKEN_DEFAULT_TTL, TOKEN_REFRESH_MARGIN
+
+class TokenManager:
+    """
+    Token OAuth (client_credentials) único para todo el proceso.
+
+    Todas las sesiones y páginas comparten el mismo token. Un temporizador en
+    segundo plano lo renueva TOKEN_REFRESH_MARGIN segundos antes de que expire,
+    así ninguna carga de página espera al POST de OAuth. Si varias llamadas
+    necesitan token a la vez, solo una hace la petición y el resto espera a su
+    resultado (single-flight).
+    """
+
+    def __init__(self, refresh_margin=TOKEN_REFRESH_MARGIN):
+        self.refresh_margin = refresh_margin
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._credentials = None
+        self._token = None
+        self._expires_at = 0.0
+        self._inflight = None
+        self._timer = None
+
+    def configure(self, client_id, client_secret):
+        with self._lock:
+            if self._credentials != (client_id, client_secret):
+                self._credentials = (client_id, client_secret)
+                self._token = None
+
+    def get_token(self):
+        """Token vigente; solo bloquea si todavía no hay ninguno válido"""
+        with self._lock:
+            if self._token and time.time() < self._expires_at:
+                return self._token
+            future, owner = self._start_refresh()
+        if owner:
+            self._refresh(future)
+        return future.result()
+
+    def invalidate(self, token):
+        """Descarta `token` (p. ej. tras un 401) si sigue siendo el actual"""
+        with self._lock:
+            if token and token == self._token:
+                self._token = None
+
+    def _start_refresh(self):
+        """Devuelve (future, owner). Solo el owner hace el POST; debe llamarse con el lock"""
+        if self._inflight is not None:
+            return self._inflight, False
+        self._inflight = Future()
+        return self._inflight, True
+
+    def _refresh(self, future):
+        token, expires_in = None, 0
+        try:
+            token, expires_in = self._request_token()
+        finally:
+            with self._lock:
+                if token:
+                    self._token = token
+                    self._expires_at = time.time() + expires_in
+                    self._schedule(expires_in)
+                self._inflight = None
+            future.set_result(token)
+
+    def _background_refresh(self):
+        with self._lock:
+            future, owner = self._start_refresh()
+        if owner:
+            self._refresh(future)
+
+    def _schedule(self, expires_in):
+        """Programa la renovación antes de que caduque; debe llamarse con el lock"""
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(max(expires_in - self.refresh_margin, 1), self._background_refresh)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _request_token(self):
+        if not self._credentials:
+            self.last_error = "Faltan credenciales"
+            return None, 0
+        client_id, client_secret = self._credentials
+        data = {
+            "grant_type": "client_credentials",
+            "client_id": client_id,
+            "client_secret": client_secret,
+        }
+        try:
+            response = client.post(AUTH_URL, data=data)
+        except Exception as e:
+            self.last_error = f"Error de conexión: {str(e)}"
+            return None, 0
+        if response.status_code != 200:
+            self.last_error = f"Error de autenticación: {response.status_code}"
+            return None, 0
+        payload = response.json()
+        self.last_error = None
+        return payload.get("access_token"), float(payload.get("expires_in") or TOKEN_DEFAULT_TTL)
+
+_manager = TokenManager()
+
+def get_token_manager():
+    """Gestor de token compartido por todo el proceso"""
+    return _manager
 
-@st.cache_data(ttl=3500)
 def get_auth_token(client_id, client_secret):
     """Obtener token de acceso"""
-    data = {
-        "grant_type": "client_credentials",
-        "client_id": client_id,
-        "client_secret": client_secret,
-    }
-    
+    _manager.configure(client_id, client_secret)
+    token = _manager.get_token()
+    if not token:
+        st.error(f"❌ {_manager.last_error}")
+    return token
+
+def get_auth_headers(stale_headers=None):
+    """Cabeceras Authorization con el token compartido (credenciales de st.secrets).
+    Con `stale_headers` (las que recibieron un 401) se descarta ese token y se pide otro."""
+    if stale_headers:
+        _manager.invalidate(stale_headers.get("Authorization", "").removeprefix("Bearer "))
     try:
-        response = requests.post(AUTH_URL, data=data, timeout=10)
-        if response.status_code == 200:
-            return response.json().get("access_token")
-        else:
-            st.error(f"❌ Error de autenticación: {response.status_code}")
-            return None
-    except Exception as e:
-        st.error(f"❌ Error de conexión: {str(e)}")
+        credentials = st.secrets["api42"]
+        _manager.configure(credentials["client_id"], credentials["client_secret"])
+    except (KeyError, FileNotFoundError):
+        # Sin secrets (hilo de fondo): vale con las credenciales ya configuradas
+        pass
+    token = _manager.get_token()
+    if not token:
         return None
+    return {"Authorization": f"Bearer {token}"}
@@ -1,24 +1,28 @@
 # api/campus.py
 
 import streamlit as st
-import requests
-from config.settings import API_BASE_URL, DEFAULT_MAX_PAGES, DEFAULT_PAGE_SIZE
+from api import client
+from config.settings import API_BASE_URL, DEFAULT_MAX_PAGES, DEFAULT_PAGE_SIZE, HTTP_CACHE_TTLS
+
+def campus_url(page):
+    """Página del listado de campus (misma URL = misma entrada de caché)"""
+    return f"{API_BASE_URL}/v2/campus?page[size]={DEFAULT_PAGE_SIZE}&page[number]={page}"
 
-@st.cache_data(ttl=3600)
 def get_campus(headers, debug_mode=False):
-    """Obtener lista completa de campus con paginación"""
+    """Obtener lista completa de campus con paginación. Las páginas salen de la
+    caché HTTP (por URL, sin el token), así que repetirla no toca la red"""
     all_campus = []
     page = 1
     max_pages = DEFAULT_MAX_PAGES
     
     try:
         while page <= max_pages:
-            url = f"{API_BASE_URL}/v2/campus?page[size]={DEFAULT_PAGE_SIZE}&page[number]={page}"
+            url = campus_url(page)
             
             if debug_mode:
                 st.write(f"🔍 Obteniendo campus - Página {page}: {url}")
             
-            res = requests.get(url, headers=headers, timeout=15)
+            res = client.get(url, headers=headers, cache_ttl=HTTP_CACHE_TTLS["campus"])
             
             if res.status_code == 200:
                 data = res.json()
@@ -64,3 +68,17 @@ def get_campus(headers, debug_mode=False):
     except Exception as e:
         st.error(f"❌ Error obteniendo campus: {str(e)}")
         return []
+
+def warm_campus():
+    """Refresco de fondo (api.scheduler): revalida todas las páginas del listado
+    de campus en la caché HTTP. Sin UI ni sesión. Devuelve cuántos campus hay."""
+    total = 0
+    for page in range(1, DEFAULT_MAX_PAGES + 1):
+        response = client.get(campus_url(page), cache_ttl=0)
+        if response.status_code != 200:
+            break
+        data = response.json()
+        total += len(data)
+        if len(data) < DEFAULT_PAGE_SIZE:
+            break
+    return total
@@ -0,0 +1,86 @@
+# api/checkpoints.py
+
+import sqlite3
+import threading
+import time
+
+from api.decoding import dumps, loads
+from config.settings import SCAN_CHECKPOINT_DB, SCAN_CHECKPOINT_TTL
+
+class ScanCheckpoints:
+    """
+    Páginas ya descargadas de los escaneos largos, en disco (SQLite).
+
+    Cada página se guarda (ya proyectada) en cuanto llega, con la URL del
+    listado como clave. Si el escaneo se corta (rerun de Streamlit, navegador
+    desconectado, un 5xx), el siguiente intento de la misma URL recupera esas
+    páginas y solo pide las que faltan. Al terminar se borra. Un escaneo a
+    medias más antiguo que SCAN_CHECKPOINT_TTL se descarta.
+    """
+
+    def __init__(self, path=SCAN_CHECKPOINT_DB, ttl=SCAN_CHECKPOINT_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        self._conn().execute("""
+            CREATE TABLE IF NOT EXISTS pages (
+                scan_key TEXT NOT NULL,
+                number INTEGER NOT NULL,
+                total INTEGER,
+                body BLOB NOT NULL,
+                saved_at REAL NOT NULL,
+                PRIMARY KEY (scan_key, number)
+            )
+        """)
+        # Escaneos abandonados que ya nadie va a reanudar
+        self._conn().execute(
+            "DELETE FROM pages WHERE scan_key IN (SELECT scan_key FROM pages GROUP BY scan_key HAVING MIN(saved_at) < ?)",
+            (time.time() - ttl,),
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def load(self, key):
+        """(X-Total, {número: registros}) de un escaneo a medias; (None, {}) si no hay o caducó"""
+        conn = self._conn()
+        started = conn.execute("SELECT MIN(saved_at) FROM pages WHERE scan_key = ?", (key,)).fetchone()[0]
+        if started is None:
+            return None, {}
+        if time.time() - started > self.ttl:
+            self.discard(key)
+            return None, {}
+        total, pages = None, {}
+        for number, page_total, body in conn.execute(
+            "SELECT number, total, body FROM pages WHERE scan_key = ?", (key,)
+        ):
+            pages[number] = loads(body)
+            if number == 1:
+                total = page_total
+        return total, pages
+
+    def save(self, key, number, data, total):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?)",
+            (key, number, total, dumps(data), time.time()),
+        )
+
+    def discard(self, key):
+        self._conn().execute("DELETE FROM pages WHERE scan_key = ?", (key,))
+
+_checkpoints = None
+_checkpoints_lock = threading.Lock()
+
+def get_checkpoints():
+    """Almacén de checkpoints único del proceso"""
+    global _checkpoints
+    if _checkpoints is None:
+        with _checkpoints_lock:
+            if _checkpoints is None:
+                _checkpoints = ScanCheckpoints()
+    return _checkpoints
@@ -0,0 +1,181 @@
+# api/client.py
+
+import re
+import threading
+import time
+from concurrent.futures import Future
+from urllib.parse import urlencode, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from api.http_cache import get_cache
+from api.ratelimit import get_limiter, is_background
+from api.workers import thread_pool
+from config.settings import (
+    API_BASE_URL, DEFAULT_HEADERS, DEFAULT_RETRY_AFTER, DEFAULT_TIMEOUT, ENDPOINT_TIMEOUTS,
+    FANOUT_WORKERS, HTTP_POOL_SIZE, RATE_LIMIT_MAX_RETRIES,
+)
+
+_session = None
+_session_lock = threading.Lock()
+_timeout_patterns = [(re.compile(pattern), seconds) for pattern, seconds in ENDPOINT_TIMEOUTS]
+
+# GETs en vuelo, por (URL canónica, de fondo): los llamadores idénticos comparten la respuesta
+_inflight = {}
+_inflight_lock = threading.Lock()
+stats = {"sent": 0, "coalesced": 0}
+
+def get_session():
+    """Sesión HTTP única del proceso: keep-alive + pool de conexiones a api.intra.42.fr"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.headers.update(DEFAULT_HEADERS)
+                _session = session
+    return _session
+
+def build_url(path):
+    """Acepta un path (/v2/...) o una URL completa"""
+    if path.startswith("http://") or path.startswith("https://"):
+        return path
+    return f"{API_BASE_URL}{path}"
+
+def timeout_for(url):
+    """Timeout configurado para el endpoint (ENDPOINT_TIMEOUTS) o el de por defecto"""
+    path = urlsplit(url).path
+    for pattern, seconds in _timeout_patterns:
+        if pattern.search(path):
+            return seconds
+    return DEFAULT_TIMEOUT
+
+def retry_after(response):
+    """Segundos de Retry-After de un 429 (DEFAULT_RETRY_AFTER si no viene o no es un número)"""
+    try:
+        return max(float(response.headers.get("Retry-After", DEFAULT_RETRY_AFTER)), 0)
+    except (TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER
+
+def flight_key(url, params=None):
+    """URL canónica de un GET (parámetros ordenados), sin cabeceras ni token"""
+    if not params:
+        return url
+    query = urlencode(sorted(params.items()), safe="[],:")
+    return f"{url}{'&' if '?' in url else '?'}{query}"
+
+def get(path, params=None, headers=None, timeout=None, cache_ttl=None):
+    """GET a la API 42 reutilizando las conexiones del pool, al ritmo del limitador global.
+    Si ya hay en vuelo un GET idéntico (misma URL, parámetros y prioridad),
+    espera a esa respuesta y la comparte en lugar de lanzar otro (single-flight).
+    Con `cache_ttl` la respuesta pasa por la caché HTTP persistente: se sirve sin
+    red durante `cache_ttl` segundos y después se revalida con ETag / Last-Modified."""
+    url = build_url(path)
+    key = flight_key(url, params)
+    entry = None
+    if cache_ttl is not None:
+        cache = get_cache()
+        entry = cache.lookup(key)
+        if entry and time.time() - entry["stored_at"] < cache_ttl:
+            cache.record("hits", entry)
+            return cache.as_response(key, entry)
+    # Un GET de fondo puede esperar en el limitador hasta el reset horario:
+    # solo se comparten vuelos de la misma prioridad
+    flight = (key, is_background())
+    with _inflight_lock:
+        future = _inflight.get(flight)
+        owner = future is None
+        if owner:
+            future = _inflight[flight] = Future()
+            stats["sent"] += 1
+        else:
+            stats["coalesced"] += 1
+    if not owner:
+        return future.result()
+
+    try:
+        if cache_ttl is None:
+            response = _send(url, params, headers, timeout)
+        else:
+            response = _send_cached(key, entry, url, params, headers, timeout)
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(response)
+        return response
+    finally:
+        with _inflight_lock:
+            _inflight.pop(flight, None)
+
+def _send(url, params, headers, timeout, extra_headers=None):
+    """Un GET real: limitador, token compartido si no hay `headers`, un reintento
+    tras renovar el token ante un 401 y reintentos ante 429"""
+    from api.auth import get_auth_headers
+
+    if headers is None:
+        headers = get_auth_headers()
+    if extra_headers:
+        headers = {**(headers or {}), **extra_headers}
+    limiter = get_limiter()
+    refreshed = False
+    attempt = 0
+    while True:
+        limiter.acquire()
+        response = get_session().get(url, params=params, headers=headers, timeout=timeout or timeout_for(url))
+        limiter.observe(response.headers)
+        if response.status_code == 401 and not refreshed and headers and "Authorization" in headers:
+            refreshed = True
+            fresh = get_auth_headers(stale_headers=headers)
+            if fresh:
+                headers = {**headers, **fresh}
+                continue
+        if response.status_code != 429 or attempt >= RATE_LIMIT_MAX_RETRIES:
+            return response
+        attempt += 1
+        limiter.penalize(retry_after(response))
+
+def _send_cached(key, entry, url, params, headers, timeout):
+    """GET condicional: manda los validadores de `entry` y, ante un 304,
+    devuelve el cuerpo guardado; un 200 nuevo reemplaza la entrada"""
+    cache = get_cache()
+    response = _send(url, params, headers, timeout, cache.conditional_headers(entry))
+    if response.status_code == 304 and entry:
+        cache.touch(key)
+        cache.record("revalidated", entry, response.elapsed.total_seconds())
+        return cache.as_response(key, entry)
+    cache.record("misses")
+    if response.status_code == 200:
+        cache.store(key, response)
+    return response
+
+def post(path, data=None, headers=None, timeout=None):
+    """POST de formulario (OAuth) reutilizando las conexiones del pool"""
+    url = build_url(path)
+    # DEFAULT_HEADERS declara JSON; el endpoint de token espera un formulario
+    form_headers = {"Content-Type": "application/x-www-form-urlencoded"}
+    if headers:
+        form_headers.update(headers)
+    return get_session().post(url, data=data, headers=form_headers, timeout=timeout or timeout_for(url))
+
+def get_json(path, params=None, headers=None, default=None, cache_ttl=None):
+    """GET que devuelve el JSON decodificado, o `default` si la respuesta no es 200"""
+    try:
+        response = get(path, params=params, headers=headers, cache_ttl=cache_ttl)
+    except requests.RequestException:
+        return default
+    if response.status_code != 200:
+        return default
+    return response.json()
+
+def get_json_many(paths, params=None, headers=None, workers=FANOUT_WORKERS, cache_ttl=None):
+    """get_json concurrente sobre varios paths (bajo el mismo limitador global);
+    devuelve los resultados en el mismo orden que `paths`"""
+    paths = list(paths)
+    if not paths:
+        return []
+    with thread_pool(min(workers, len(paths))) as pool:
+        return list(pool.map(lambda path: get_json(path, params=params, headers=headers, cache_ttl=cache_ttl), paths))
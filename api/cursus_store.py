@@ -0,0 +1,380 @@
+# api/cursus_store.py
+
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from api.cursus_users import CursusDataset, CursusUser
+from config.settings import CURSUS_STORE_DB, DEFAULT_PAGE_SIZE
+
+# Filtro "solo estudiantes válidos" de la página de inactividad
+VALID_GRADES = ("Cadet", "Transcender", "Alumni")
+
+_COLUMNS = ("campus_id", "cursus_id") + CursusUser._fields
+_TYPES = {
+    "id": "INTEGER PRIMARY KEY", "campus_id": "INTEGER", "cursus_id": "INTEGER NOT NULL",
+    "user_id": "INTEGER", "active": "INTEGER", "correction_point": "INTEGER", "wallet": "INTEGER",
+    "level": "REAL", "grade": "TEXT NOT NULL DEFAULT ''", "updated_at": "TEXT NOT NULL DEFAULT ''",
+}
+
+# Columnas que cargan las vistas de actividad (no SELECT *: 100k filas)
+_ACTIVITY_COLUMNS = (
+    "user_id, login, displayname, kind, grade, active, blackholed_at, correction_point, level, "
+    "user_updated_at, activity_jd"
+)
+
+def _scope(campus_id, cursus_id):
+    return f"{'*' if campus_id is None else campus_id}/{cursus_id}"
+
+def _julian_now():
+    return time.time() / 86400 + 2440587.5
+
+def _julian(moment):
+    return moment.timestamp() / 86400 + 2440587.5
+
+def _utc(moment):
+    """datetime (sin zona = hora local) -> texto UTC ordenable, como valid_from / valid_to"""
+    return moment.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+
+def _version(campus_id, updated_at, user_updated_at):
+    """Lo que, si no cambia, permite no reescribir una fila"""
+    return f"{campus_id}|{updated_at}|{user_updated_at or ''}"
+
+def _records(rows):
+    """Filas de SQLite -> CursusUser (active vuelve a ser bool); sin _make ni _replace, son 100k"""
+    active = CursusUser._fields.index("active")
+    new = tuple.__new__
+    return [
+        new(CursusUser, (*row[:active], None if row[active] is None else row[active] == 1, *row[active + 1:]))
+        for row in rows
+    ]
+
+class CursusStore:
+    """
+    Copia local (SQLite) de los datasets de cursus_users: una fila por
+    cursus_user con columnas tipadas e índices por campus, cursus, grade,
+    kind y updated_at, para que las vistas agreguen en SQL en lugar de
+    cargar y recorrer el escaneo entero.
+
+    `save` es incremental: solo reescribe las filas cuyo updated_at (o el del
+    usuario) cambió, y tras un escaneo completo borra las que ya no están.
+    La tabla `scans` guarda qué (campus, cursus) se escaneó, hasta cuántas
+    páginas y cuándo; las consultas reproducen `CursusDataset.view`: los
+    max_pages*100 más recientes por updated_at del alcance.
+
+    Además guarda la historia (SCD tipo 2): cada versión de un cursus_user
+    con el intervalo [valid_from, valid_to) de escaneos en el que fue la
+    vigente. Solo se añade una versión cuando algo cambia entre escaneos, y
+    `as_of` reconstruye el estado en cualquier fecha con una consulta por
+    intervalo, sin requests.
+
+    En Streamlit Community Cloud el disco es efímero (se borra si la app se
+    duerme o se redespliega): evita re-escanear dentro de una sesión de la
+    app, no es una base de datos permanente. Lo que sobrevive a un reinicio
+    son los snapshots Parquet (api.snapshots) si SNAPSHOT_DIR es persistente.
+    """
+
+    def __init__(self, path=CURSUS_STORE_DB):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        columns = ", ".join(f"{name} {_TYPES.get(name, 'TEXT')}" for name in _COLUMNS)
+        # activity_jd: user_updated_at como día juliano, para restar sin parsear fechas en cada consulta
+        conn.execute(f"CREATE TABLE IF NOT EXISTS cursus_users ({columns}, activity_jd REAL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS cu_scope ON cursus_users (cursus_id, campus_id, updated_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS cu_cursus ON cursus_users (cursus_id, updated_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS cu_grade ON cursus_users (grade)")
+        conn.execute("CREATE INDEX IF NOT EXISTS cu_kind ON cursus_users (kind)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS scans (
+                scope TEXT PRIMARY KEY,
+                max_pages INTEGER NOT NULL,
+                complete INTEGER NOT NULL,
+                scanned_at TEXT NOT NULL,
+                saved_at TEXT NOT NULL
+            )
+        """)
+        # Historia: versión vigente con valid_to NULL
+        versioned = ", ".join(f"{name} {_TYPES.get(name, 'TEXT').replace('PRIMARY KEY', 'NOT NULL')}" for name in _COLUMNS)
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS cursus_users_history (
+                {versioned}, activity_jd REAL, valid_from TEXT NOT NULL, valid_to TEXT,
+                PRIMARY KEY (id, valid_from)
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS cuh_scope ON cursus_users_history (cursus_id, campus_id, valid_from)")
+        conn.execute("CREATE INDEX IF NOT EXISTS cuh_open ON cursus_users_history (id) WHERE valid_to IS NULL")
+        # Cada escaneo guardado (alcance, hora UTC), para saber de cuándo es un as_of
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS scan_log (
+                scope TEXT NOT NULL,
+                scanned_at TEXT NOT NULL,
+                PRIMARY KEY (scope, scanned_at)
+            )
+        """)
+        if conn.execute("SELECT NOT EXISTS (SELECT 1 FROM cursus_users_history)").fetchone()[0]:
+            # Store de antes de la historia: lo que ya había empieza a contar desde ahora
+            conn.execute(
+                f"INSERT INTO cursus_users_history SELECT {', '.join(_COLUMNS)}, activity_jd, ?, NULL FROM cursus_users",
+                (_utc(datetime.now(timezone.utc)),),
+            )
+
+    def _conn(self):
+        """Una conexión por hilo, reutilizada entre llamadas"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def scan_info(self, campus_id, cursus_id):
+        """{"max_pages", "complete", "scanned_at", "saved_at"} del último escaneo guardado, o None"""
+        row = self._conn().execute(
+            "SELECT max_pages, complete, scanned_at, saved_at FROM scans WHERE scope = ?", (_scope(campus_id, cursus_id),)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "max_pages": row[0], "complete": bool(row[1]),
+            "scanned_at": datetime.fromisoformat(row[2]), "saved_at": datetime.fromisoformat(row[3]),
+        }
+
+    def covers(self, campus_id, cursus_id, max_pages, max_age_hours):
+        """Hay un escaneo guardado de ese alcance que cubre `max_pages` y no es más viejo que `max_age_hours`"""
+        info = self.scan_info(campus_id, cursus_id)
+        if info is None or not (info["complete"] or info["max_pages"] >= max_pages):
+            return False
+        age = (datetime.now(timezone.utc) - info["saved_at"]).total_seconds() / 3600
+        return age <= max_age_hours
+
+    def save(self, dataset, max_pages, at=None):
+        """Guarda (incremental) un CursusDataset sin filtros, tal como estaba en
+        `at` (por defecto su scanned_at; tras un delta, la hora del delta).
+        Devuelve False si eso mismo ya estaba guardado"""
+        if dataset.filters:
+            raise ValueError("Solo se guardan datasets sin filtros")
+        scope = _scope(dataset.campus_id, dataset.cursus_id)
+        observed = at or dataset.scanned_at
+        scanned_at = observed.isoformat()
+        conn = self._conn()
+        row = conn.execute("SELECT max_pages, scanned_at FROM scans WHERE scope = ?", (scope,)).fetchone()
+        if row is not None and row[1] == scanned_at and row[0] >= max_pages:
+            return False
+
+        where, params = "cursus_id = ?", [dataset.cursus_id]
+        if dataset.campus_id is not None:
+            where, params = where + " AND campus_id = ?", params + [dataset.campus_id]
+        # Incremental: solo se escriben las filas nuevas o cuyo updated_at (del
+        # cursus_user o del usuario) cambió
+        # Un escaneo de todos los campus no trae el campus: se compara sin él
+        stored_campus = "''" if dataset.campus_id is None else "COALESCE(campus_id, '')"
+        stored = dict(conn.execute(
+            f"SELECT id, {stored_campus} || '|' || updated_at || '|' || COALESCE(user_updated_at, '') "
+            f"FROM cursus_users WHERE {where}", params,
+        ))
+        campus = "" if dataset.campus_id is None else dataset.campus_id
+        changed = [r for r in dataset.records if stored.get(r.id) != _version(campus, r.updated_at, r.user_updated_at)]
+
+        names = ", ".join(_COLUMNS)
+        updates = ", ".join(
+            f"{name} = excluded.{name}" if name != "campus_id" else "campus_id = COALESCE(excluded.campus_id, campus_id)"
+            for name in _COLUMNS[1:] + ("activity_jd",) if name != "id"
+        )
+        valid_from = _utc(observed)
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(
+                f"""INSERT INTO cursus_users ({names}, activity_jd)
+                    VALUES ({', '.join('?' * len(_COLUMNS))}, julianday(?))
+                    ON CONFLICT(id) DO UPDATE SET campus_id = COALESCE(excluded.campus_id, campus_id), {updates}
+                    WHERE excluded.updated_at >= cursus_users.updated_at""",
+                ((dataset.campus_id, dataset.cursus_id) + tuple(r) + (r.user_updated_at,) for r in changed),
+            )
+            # Historia: se cierra la versión vigente de lo que cambió y se abre la nueva
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS changed (id INTEGER PRIMARY KEY)")
+            conn.execute("DELETE FROM changed")
+            conn.executemany("INSERT OR IGNORE INTO changed VALUES (?)", ((r.id,) for r in changed))
+            conn.execute(
+                "UPDATE cursus_users_history SET valid_to = ? WHERE valid_to IS NULL AND id IN (SELECT id FROM changed)",
+                (valid_from,),
+            )
+            conn.execute(
+                f"INSERT OR REPLACE INTO cursus_users_history SELECT {names}, activity_jd, ?, NULL "
+                "FROM cursus_users WHERE id IN (SELECT id FROM changed)",
+                (valid_from,),
+            )
+            if dataset.complete:
+                # Escaneo completo: lo que no vino ya no existe (bajas, cambios de campus)
+                conn.execute("CREATE TEMP TABLE IF NOT EXISTS seen (id INTEGER PRIMARY KEY)")
+                conn.execute("DELETE FROM seen")
+                conn.executemany("INSERT OR IGNORE INTO seen VALUES (?)", ((r.id,) for r in dataset.records))
+                conn.execute(
+                    f"UPDATE cursus_users_history SET valid_to = ? "
+                    f"WHERE valid_to IS NULL AND {where} AND id NOT IN (SELECT id FROM seen)",
+                    [valid_from] + params,
+                )
+                conn.execute(f"DELETE FROM cursus_users WHERE {where} AND id NOT IN (SELECT id FROM seen)", params)
+            conn.execute(
+                "INSERT OR REPLACE INTO scans VALUES (?, ?, ?, ?, ?)",
+                (scope, max_pages, int(dataset.complete), scanned_at, datetime.now(timezone.utc).isoformat()),
+            )
+            conn.execute("INSERT OR IGNORE INTO scan_log VALUES (?, ?)", (scope, valid_from))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return True
+
+    def _scoped(self, campus_id, cursus_id, max_pages, valid_only, as_of=None):
+        """CTE `scoped` con la vista del alcance (como CursusDataset.view) y los días sin actividad,
+        ahora o, con `as_of`, tal como estaba en ese momento"""
+        where, params = "cursus_id = ?", [cursus_id]
+        if campus_id is not None:
+            where, params = where + " AND campus_id = ?", params + [campus_id]
+        outer = "user_id IS NOT NULL AND activity_jd IS NOT NULL"
+        if valid_only:
+            outer += (
+                f" AND kind = 'student' AND grade IN ({', '.join('?' * len(VALID_GRADES))})"
+                " AND NOT (active = 0 AND COALESCE(blackholed_at, '') != '')"
+            )
+            outer_params = list(VALID_GRADES)
+        else:
+            outer_params = []
+        limit = max_pages * DEFAULT_PAGE_SIZE
+        if as_of is not None:
+            moment = _utc(as_of)
+            source = (
+                f"(SELECT * FROM {self._history(where, params)} WHERE {where} AND valid_from <= ? "
+                f"AND (valid_to IS NULL OR valid_to > ?) ORDER BY updated_at DESC LIMIT ?) WHERE {outer}"
+            )
+            params = params + [moment, moment, limit]
+            now = _julian(as_of)
+        else:
+            source, params, now = self._current_source(where, params, outer, limit)
+        sql = f"""
+            WITH scoped AS (
+                SELECT {_ACTIVITY_COLUMNS}, CAST(? - activity_jd AS INTEGER) AS days FROM {source}
+            )
+        """
+        return sql, [now] + params + outer_params
+
+    def _history(self, where, params):
+        """La historia, sin índice si el alcance es buena parte de ella (como en _current_source)"""
+        conn = self._conn()
+        in_scope = conn.execute(f"SELECT COUNT(*) FROM cursus_users WHERE {where}", params).fetchone()[0]
+        total = conn.execute("SELECT COUNT(*) FROM cursus_users").fetchone()[0]
+        return "cursus_users_history NOT INDEXED" if in_scope * 4 >= total else "cursus_users_history"
+
+    def _current_source(self, where, params, outer, limit):
+        in_scope = self._conn().execute(f"SELECT COUNT(*) FROM cursus_users WHERE {where}", params).fetchone()[0]
+        if in_scope <= limit:
+            # Cabe entero (lo normal tras un escaneo completo): recorrer la tabla
+            # en orden es mucho más rápido que 100k saltos desde el índice
+            source = f"cursus_users NOT INDEXED WHERE {where} AND {outer}"
+        else:
+            source = f"(SELECT * FROM cursus_users WHERE {where} ORDER BY updated_at DESC LIMIT ?) WHERE {outer}"
+            params = params + [limit]
+        return source, params, _julian_now()
+
+    def activity_buckets(self, campus_id, cursus_id, max_pages, thresholds, valid_only=False, as_of=None):
+        """
+        Estudiantes por tramo de inactividad, agregados en SQL. `thresholds`
+        [(etiqueta, días), …]: cada uno cae solo en el tramo más alto que
+        alcanza. DataFrame con label, days, n, avg_points, avg_level (todos
+        los tramos, también vacíos) y el total con fecha de actividad válida.
+        Con `as_of` (datetime), sobre el estado y los días de ese momento.
+        """
+        sql, params = self._scoped(campus_id, cursus_id, max_pages, valid_only, as_of)
+        ordered = sorted(thresholds, key=lambda t: t[1], reverse=True)
+        case = " ".join("WHEN days >= ? THEN ?" for _ in ordered)
+        case_params = [value for label, days in ordered for value in (days, label)]
+        # Una sola pasada: los de menos de un tramo quedan en label NULL y solo cuentan para el total
+        rows = self._conn().execute(
+            sql + f"""
+            SELECT label, COUNT(*), AVG(correction_point), AVG(level) FROM (
+                SELECT CASE {case} END AS label, correction_point, level FROM scoped
+            ) GROUP BY label
+            """,
+            params + case_params,
+        ).fetchall()
+        total = sum(n for _, n, _, _ in rows)
+        found = {label: (n, points, level) for label, n, points, level in rows if label is not None}
+        buckets = pd.DataFrame(
+            [(label, days) + found.get(label, (0, None, None)) for label, days in thresholds],
+            columns=["label", "days", "n", "avg_points", "avg_level"],
+        )
+        return buckets, total
+
+    def activity_members(self, campus_id, cursus_id, max_pages, min_days, max_days=None, valid_only=False,
+                         as_of=None):
+        """Estudiantes con min_days <= días sin actividad < max_days (None = sin tope), más inactivos primero"""
+        sql, params = self._scoped(campus_id, cursus_id, max_pages, valid_only, as_of)
+        where, extra = "days >= ?", [min_days]
+        if max_days is not None:
+            where, extra = where + " AND days < ?", extra + [max_days]
+        return pd.read_sql_query(
+            sql + f"""
+            SELECT login, displayname, CASE WHEN grade = '' THEN '(vacío/null)' ELSE grade END AS grade,
+                   level, correction_point, days, user_updated_at
+            FROM scoped WHERE {where} ORDER BY days DESC
+            """,
+            self._conn(), params=params + extra,
+        )
+
+    def first_scan(self, campus_id, cursus_id):
+        """Hora (UTC) del primer escaneo guardado de ese mismo alcance (campus, cursus), o None"""
+        row = self._conn().execute(
+            "SELECT MIN(scanned_at) FROM scan_log WHERE scope = ?", (_scope(campus_id, cursus_id),),
+        ).fetchone()
+        return datetime.fromisoformat(row[0]).replace(tzinfo=timezone.utc) if row[0] else None
+
+    def as_of(self, campus_id, cursus_id, moment, filters=()):
+        """
+        CursusDataset de (campus, cursus) tal como estaba en `moment` (datetime;
+        sin zona = hora local), sacado de la historia sin requests, con los
+        registros que cumplen `filters`. Su scanned_at es el del último escaneo
+        guardado hasta ese momento; None si no hay ninguno.
+        Solo cuentan los escaneos de ese mismo alcance: uno de todos los campus
+        no trae el campus de cada registro (campus_id NULL) y el filtro por
+        campus se dejaría fuera parte de lo que vio.
+        """
+        at = _utc(moment)
+        row = self._conn().execute(
+            "SELECT MAX(scanned_at) FROM scan_log WHERE scope = ? AND scanned_at <= ?",
+            (_scope(campus_id, cursus_id), at),
+        ).fetchone()
+        if row[0] is None:
+            return None
+        where, params = "cursus_id = ?", [cursus_id]
+        if campus_id is not None:
+            where, params = where + " AND campus_id = ?", params + [campus_id]
+        # Intervalo [valid_from, valid_to) que contiene el momento: una versión por cursus_user
+        rows = self._conn().execute(
+            f"SELECT {', '.join(CursusUser._fields)} FROM {self._history(where, params)} "
+            f"WHERE {where} AND valid_from <= ? AND (valid_to IS NULL OR valid_to > ?)",
+            params + [at, at],
+        ).fetchall()
+        dataset = CursusDataset(campus_id, cursus_id, filters)
+        dataset.records = [r for r in _records(rows) if dataset.accepts(r)]
+        dataset.records.sort(key=lambda r: r.updated_at, reverse=True)
+        dataset.pages = -(-len(dataset.records) // DEFAULT_PAGE_SIZE)
+        dataset.complete = True
+        dataset.scanned_at = datetime.fromisoformat(row[0]).replace(tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+        return dataset
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_cursus_store():
+    """Store local de cursus_users único del proceso"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = CursusStore()
+    return _store
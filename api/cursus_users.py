@@ -0,0 +1,971 @@
+# api/cursus_users.py
+
+import copy
+import heapq
+import math
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, wait
+from datetime import datetime, timezone
+
+import streamlit as st
+from api import client, filters as spec, snapshots
+from api.campus import get_campus
+from api.checkpoints import get_checkpoints
+from api.decoding import CURSUS_USER_FIELDS, decode_json, projection
+from api.registry import get_registry
+from api.pagination import (
+    KEYSET_END, iter_id_ranges, iter_pages, keyset_url, page_url, planned_pages, split_ids, total_records, PageError,
+)
+from api.workers import thread_pool
+from config.settings import (
+    API_BASE_URL, CAMPUS_SCAN_WORKERS, CURSUS_DATASET_TTL, CURSUS_DELTA_MAX_PAGES, CURSUS_FULL_SYNC_INTERVAL,
+    DEFAULT_PAGE_SIZE, HTTP_CACHE_TTLS, KEYSET_MIN_PAGES, KEYSET_RANGES_PER_WORKER, SCAN_WORKERS,
+)
+
+# Un cursus_user con todos los campos que usan las páginas, ya tipados
+CursusUser = namedtuple("CursusUser", [
+    "id", "user_id", "login", "displayname", "kind", "active", "correction_point", "wallet",
+    "pool_month", "pool_year", "user_updated_at",
+    "grade", "level", "begin_at", "end_at", "blackholed_at", "updated_at",
+])
+
+_SESSION_KEY = "cursus_datasets"
+
+def parse_dt(raw):
+    """Fecha ISO de la API (…Z) a datetime con zona, o None"""
+    if not raw:
+        return None
+    try:
+        return datetime.fromisoformat(raw.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+def to_record(cu):
+    """cursus_user (dict proyectado) -> CursusUser (user_id None si no trae usuario)"""
+    user = cu.get("user") or {}
+    return CursusUser(
+        id=cu.get("id"),
+        user_id=user.get("id"),
+        login=user.get("login") or "",
+        displayname=user.get("displayname") or "",
+        kind=user.get("kind") or "",
+        active=user.get("active?"),
+        correction_point=int(user.get("correction_point") or 0),
+        wallet=int(user.get("wallet") or 0),
+        pool_month=user.get("pool_month"),
+        pool_year=user.get("pool_year"),
+        user_updated_at=user.get("updated_at"),
+        grade=(cu.get("grade") or "").strip(),
+        level=round(float(cu.get("level") or 0), 2),
+        begin_at=cu.get("begin_at"),
+        end_at=cu.get("end_at"),
+        blackholed_at=cu.get("blackholed_at"),
+        updated_at=cu.get("updated_at") or "",
+    )
+
+def cursus_users_url(campus_id, cursus_id, filters=(), sort="-updated_at"):
+    """Listado de cursus_users de un cursus (campus_id None = todos los campus),
+    con los `filters` que la API acepta ya como parámetros"""
+    base = f"{API_BASE_URL}/v2/cursus/{cursus_id}/cursus_users"
+    params = [] if campus_id is None else [f"filter[campus_id]={campus_id}"]
+    params += [f"sort={sort}"] + spec.query(filters)
+    return f"{base}?{'&'.join(params)}"
+
+class CursusDataset:
+    """
+    Escaneo de /v2/cursus/:id/cursus_users de un (campus, cursus), ordenado
+    como lo da la API (-updated_at). Las páginas no vuelven a escanear: derivan
+    su vista de `view(max_pages)`, que devuelve los mismos registros que habría
+    dado un escaneo de esas páginas.
+
+    Tras el escaneo completo se mantiene al día con deltas: solo se piden los
+    registros con updated_at posterior a la marca de agua y se fusionan por id.
+    Las bajas no aparecen en un delta, así que cada CURSUS_FULL_SYNC_INTERVAL
+    se vuelve a hacer el escaneo completo.
+
+    Con `filters` (api.filters.Filter) el escaneo es solo del subconjunto: lo
+    traducible va como parámetros de la API y todo se vuelve a aplicar en
+    local en `view`. Un registro que deja de cumplir el filtro no sale en el
+    delta; igual que las bajas, desaparece en la reconciliación completa.
+    """
+
+    def __init__(self, campus_id, cursus_id, filters=()):
+        self.campus_id = campus_id
+        self.cursus_id = cursus_id
+        self.filters = tuple(filters)
+        self.records = []
+        self.pages = 0
+        # Páginas que tiene el listado según X-Total (None hasta la primera)
+        self.total_pages = None
+        self.complete = False
+        self.error = None
+        self.scanned_at = None
+        self.last_sync = None
+        # Bytes descargados y X-Total del último escaneo (para el debug de filtros)
+        self.nbytes = 0
+        self.total_records = None
+        # Páginas que el último escaneo recuperó de un checkpoint en lugar de pedirlas
+        self.resumed_pages = 0
+        # Páginas que ya tenía el escaneo que se amplió (ver _extend), o 0
+        self.extended_from = 0
+        self._fetched_at = 0.0
+        self._full_at = 0.0
+
+    @property
+    def url(self):
+        return cursus_users_url(self.campus_id, self.cursus_id, self.filters)
+
+    def accepts(self, record):
+        return record.user_id is not None and spec.matches(record, self.filters)
+
+    def covers(self, max_pages):
+        return self.complete or self.pages >= max_pages
+
+    def fresh(self, ttl=CURSUS_DATASET_TTL):
+        return time.time() - self._fetched_at < ttl
+
+    def needs_full_sync(self, interval=CURSUS_FULL_SYNC_INTERVAL):
+        return time.time() - self._full_at >= interval
+
+    @property
+    def watermark(self):
+        """updated_at más reciente del dataset (los registros van ordenados)"""
+        return self.records[0].updated_at if self.records else None
+
+    def view(self, max_pages):
+        """
+        Registros (con usuario y que cumplen los filtros) de las primeras
+        `max_pages` páginas del listado que se pide a la API (con los filtros
+        que se mandan): como `pages`, cuentan lo que se descarga. Los filtros
+        solo locales se aplican después de cortar.
+        """
+        return [r for r in self.records[:max_pages * DEFAULT_PAGE_SIZE] if self.accepts(r)]
+
+    def add_page(self, data):
+        self.records.extend(to_record(cu) for cu in data)
+        self.pages += 1
+
+    def upsert(self, data):
+        """Fusiona registros nuevos o cambiados por id, manteniendo el orden -updated_at"""
+        changed = [to_record(cu) for cu in data]
+        ids = {r.id for r in changed}
+        self.records = sorted(
+            changed + [r for r in self.records if r.id not in ids],
+            key=lambda r: r.updated_at, reverse=True,
+        )
+        return len(changed)
+
+    def dedupe(self):
+        """Un registro que cambia durante el escaneo puede salir en dos páginas: queda el primero"""
+        seen = set()
+        records = []
+        for r in self.records:
+            if r.id not in seen:
+                seen.add(r.id)
+                records.append(r)
+        self.records = records
+
+    def clone(self):
+        """Copia para actualizar sin tocar el publicado: comparten los registros (inmutables), no la lista"""
+        other = copy.copy(self)
+        other.records = list(self.records)
+        return other
+
+    def mark_fetched(self, full):
+        self._fetched_at = time.time()
+        if full:
+            self._full_at = self._fetched_at
+        self.scanned_at = datetime.now()
+
+def _handles():
+    """Handles de esta sesión al registro de datasets del proceso, por clave"""
+    return st.session_state.setdefault(_SESSION_KEY, {})
+
+def _lookup(key):
+    """Dataset compartido de `key` (o None); la sesión se queda con un handle a él"""
+    handles = _handles()
+    if key not in handles:
+        handles[key] = get_registry().handle(key)
+    return handles[key].get() or _restore(key)
+
+def _publish(key, dataset):
+    """Publica `dataset` para todas las sesiones (no se vuelve a modificar)"""
+    get_registry().put(key, dataset)
+
+def _publish_scan(key, dataset):
+    """Publica un escaneo completo recién hecho y lo deja también en snapshot
+    y, sin filtros, en el store local (con su historia para las vistas a fecha)"""
+    _publish(key, dataset)
+    snapshots.write_snapshot(dataset)
+    if not dataset.filters:
+        from api.cursus_store import get_cursus_store  # importa este módulo
+        get_cursus_store().save(dataset, dataset.pages)
+
+def _publish_delta(key, dataset):
+    """Publica un dataset puesto al día con un delta y, sin filtros, lo guarda
+    también en el store local a la hora del delta"""
+    _publish(key, dataset)
+    if not dataset.filters:
+        from api.cursus_store import get_cursus_store  # importa este módulo
+        get_cursus_store().save(dataset, dataset.pages, at=datetime.now())
+
+def _restore(key):
+    """
+    Si el registro no tiene `key` (proceso recién arrancado), el dataset del
+    último snapshot en disco, publicado tal cual: con su hora de escaneo, así
+    que si ya no está fresco la siguiente carga lo pone al día con un delta
+    en lugar de escanear de cero. None si no hay snapshot (o pyarrow).
+    """
+    if len(key) != 2 or not snapshots.available():
+        return None
+    path = snapshots.latest_snapshot(*key)
+    if path is None:
+        return None
+    table = snapshots.read_snapshot(path)
+    info = snapshots.snapshot_info(path)
+    dataset = CursusDataset(*key)
+    dataset.records = [CursusUser._make(row) for row in zip(*(table.column(f).to_pylist() for f in CursusUser._fields))]
+    dataset.pages = info["pages"]
+    dataset.total_pages = info["total_pages"]
+    dataset.total_records = info["total_records"]
+    dataset.complete = info["complete"]
+    dataset.scanned_at = datetime.fromisoformat(info["scanned_at"])
+    dataset._fetched_at = info["fetched_at"]
+    dataset._full_at = info["full_at"]
+    _publish(key, dataset)
+    return dataset
+
+def snapshot_frame(campus_id, cursus_id, max_pages, columns, filters=()):
+    """
+    Para vistas que solo agregan unos pocos campos: las `columns` de los
+    registros que cumplen `filters` del último snapshot completo sin filtros
+    de (campus, cursus), leídas del Parquet por columnas y filtradas al leer,
+    sin reconstruir el dataset. Devuelve (DataFrame de las primeras
+    `max_pages` páginas del listado pedido, orden -updated_at, como
+    CursusDataset.view; scanned_at)
+    o (None, None) si el dataset ya está en memoria (sale más barato de
+    ahí), no hay snapshot completo o no hay pyarrow.
+    """
+    if not snapshots.available():
+        return None, None
+    registry = get_registry()
+    if registry.get(_key(campus_id, cursus_id)) is not None or registry.get(_key(campus_id, cursus_id, filters)) is not None:
+        return None, None
+    path = snapshots.latest_snapshot(campus_id, cursus_id)
+    if path is None:
+        return None, None
+    info = snapshots.snapshot_info(path)
+    if not info["complete"]:
+        return None, None
+    local = spec.local_only(filters)
+    wanted = list(dict.fromkeys([*columns, "user_id", "updated_at", *(f.field for f in local)]))
+    table = snapshots.read_snapshot(path, wanted, spec.pushed(filters))
+    table = table.sort_by([("updated_at", "descending")]).slice(0, max_pages * DEFAULT_PAGE_SIZE)
+    df = snapshots.filter_table(table, local).to_pandas()
+    return df[df["user_id"].notna()].reset_index(drop=True), datetime.fromisoformat(info["scanned_at"])
+
+def _key(campus_id, cursus_id, filters=()):
+    if not filters:
+        return (campus_id, cursus_id)
+    return (campus_id, cursus_id, spec.spec_key(filters))
+
+def _subset(campus_id, cursus_id, filters):
+    """
+    Dataset filtrado sacado sin requests del mejor escaneo fresco del mismo
+    (campus, cursus) cuyos filtros abarcan los pedidos (api.filters.subsumes;
+    el escaneo sin filtros los abarca todos), o None.
+
+    Queda igual que si se hubiera escaneado: con los registros del listado
+    que se pediría a la API (los filtros que se mandan) y sus páginas, y los
+    filtros solo locales aplicados en `view`. De uno completo sale completo.
+    De uno parcial también vale si su listado contiene el pedido: va
+    ordenado por -updated_at, así que lo que cumple los filtros en sus
+    primeras páginas es el principio exacto del listado pedido; solo cuentan
+    las páginas enteras y el resultado queda sin completar, listo para
+    ampliarlo pidiendo solo las siguientes (ver _extend).
+    """
+    if not filters:
+        return None
+    pushed = spec.pushed(filters)
+    # El escaneo sin filtros puede estar solo en snapshot: _lookup lo restaura
+    _lookup(_key(campus_id, cursus_id))
+    best = None
+    for key in get_registry().keys():
+        if key[:2] != (campus_id, cursus_id) or key == _key(campus_id, cursus_id, filters):
+            continue
+        if not spec.subsumes(key[2] if len(key) > 2 else (), filters):
+            continue
+        source = _lookup(key)
+        if source is None or source.error is not None or not source.fresh():
+            continue
+        if not source.complete and not spec.subsumes(spec.pushed(source.filters), pushed):
+            # Un filtro que solo se aplica en local aquí y que la fuente sí
+            # mandó: sus páginas no son un principio del listado pedido
+            continue
+        if best is None or (source.complete, source.pages) > (best.complete, best.pages):
+            best = source
+    if best is None:
+        return None
+    dataset = CursusDataset(campus_id, cursus_id, filters)
+    listed = [r for r in best.records if spec.matches(r, pushed)]
+    if best.complete:
+        dataset.records = listed
+        dataset.pages = dataset.total_pages = -(-len(listed) // DEFAULT_PAGE_SIZE)
+        dataset.total_records = len(listed)
+        dataset.complete = True
+    else:
+        dataset.pages = len(listed) // DEFAULT_PAGE_SIZE
+        dataset.records = listed[:dataset.pages * DEFAULT_PAGE_SIZE]
+        if set(spec.pushed(best.filters)) == set(pushed):
+            # Mismo listado de la API: su X-Total vale tal cual
+            dataset.total_records = best.total_records
+            dataset.total_pages = best.total_pages
+            dataset.complete = best.total_records is not None and len(listed) >= best.total_records
+    dataset.scanned_at = best.scanned_at
+    dataset._fetched_at = best._fetched_at
+    dataset._full_at = best._full_at
+    return dataset
+
+def cached_cursus_users(campus_id, cursus_id, max_pages, filters=()):
+    """Dataset ya escaneado en esta sesión que cubre `max_pages` y sigue fresco, o None"""
+    dataset = _lookup(_key(campus_id, cursus_id, filters))
+    if dataset is not None and dataset.covers(max_pages) and dataset.fresh():
+        return dataset
+    subset = _subset(campus_id, cursus_id, filters)
+    if subset is not None and subset.covers(max_pages):
+        return subset
+    return None
+
+def _prefix(campus_id, cursus_id, max_pages, filters=()):
+    """
+    Lo más largo que ya hay, fresco y sin error, del listado de (campus,
+    cursus, filtros) aunque no llegue a `max_pages`: el dataset de la clave o
+    uno sacado de un escaneo más amplio (_subset). None si no hay nada.
+    """
+    dataset = _lookup(_key(campus_id, cursus_id, filters))
+    if dataset is None or dataset.error is not None or not dataset.fresh():
+        dataset = None
+    subset = _subset(campus_id, cursus_id, filters)
+    if subset is not None and (dataset is None or (subset.complete, subset.pages) > (dataset.complete, dataset.pages)):
+        dataset = subset
+    return dataset
+
+class _Silent:
+    """Barra / texto que no pintan nada (escaneos de fondo, sin sesión)"""
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+def _scan(url, headers, max_pages, debug, on_page, dataset=None, ui=True, stop=None, workers=SCAN_WORKERS,
+          resume=False, pages=None):
+    """Recorre `url` con la barra de progreso de siempre. Devuelve (última página, PageError o None).
+    Si se pasa `dataset` se le anotan los bytes descargados y el X-Total.
+    Si `stop()` da True tras una página se deja de escanear (y se cancelan las pendientes).
+    Con `resume` cada página descargada se guarda en disco (api.checkpoints) y
+    las que ya guardó un intento anterior de la misma URL no se vuelven a pedir.
+    `pages` sustituye al recorrido por número de página (ver _keyset_scan)."""
+    if ui:
+        bar    = st.progress(0, text="Escaneando…")
+        status = st.empty()
+    else:
+        bar = status = _Silent()
+
+    checkpoints = get_checkpoints() if resume else None
+    saved_total, done = checkpoints.load(url) if resume else (None, {})
+    if resume and dataset is not None:
+        dataset.resumed_pages = len(done)
+    if done:
+        status.info(f"♻️ Reanudando un escaneo a medias: {len(done)} página(s) ya descargadas")
+
+    last, error, total = None, None, 0
+    try:
+        if pages is None:
+            keep = (lambda number, data, total: checkpoints.save(url, number, data, total)) if resume else None
+            pages = iter_pages(url, lambda u: client.get(u, headers=headers), max_pages, workers=workers,
+                               decode=projection(CURSUS_USER_FIELDS), done=done, total=saved_total, keep=keep)
+        for p in pages:
+            if debug:
+                st.code(p.url)
+            on_page(p.data)
+            if dataset is not None:
+                dataset.nbytes += p.nbytes
+                dataset.total_records = p.total
+            last = p
+            total += len(p.data)
+            status.text(f"📄 Página {p.number} · {total} registros escaneados")
+            bar.progress(min(p.number / p.total_pages, 1.0), text=f"Página {p.number}/{p.total_pages} · {total} registros")
+            if stop is not None and stop():
+                break
+    except PageError as e:
+        error = e
+        kept = " · las páginas ya descargadas se conservan: al volver a escanear se reanuda desde ahí" if resume else ""
+        status.error(f"❌ Error API {e.response.status_code}: {e.response.text[:200]}{kept}")
+
+    bar.empty()
+    if error is None:
+        status.empty()
+    return last, error
+
+def _reached_end(last, max_pages):
+    """Acabó antes de max_pages (o con una página corta): no hay más registros"""
+    return last is None or last.number < max_pages or len(last.data) < DEFAULT_PAGE_SIZE
+
+def sync_cursus_users(dataset, headers, debug=False, ui=True):
+    """
+    Delta: pide solo range[updated_at]=<marca de agua>,<ahora> y lo fusiona.
+    Devuelve False si no se pudo (error de la API o más cambios de los que
+    caben en CURSUS_DELTA_MAX_PAGES); entonces toca escaneo completo.
+    """
+    watermark = dataset.watermark
+    if watermark is None:
+        return False
+    now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    url = f"{dataset.url}&range[updated_at]={watermark},{now}"
+
+    changes = []
+    last, error = _scan(url, headers, CURSUS_DELTA_MAX_PAGES, debug, changes.extend, ui=ui)
+    if error is not None or not _reached_end(last, CURSUS_DELTA_MAX_PAGES):
+        return False
+    dataset.upsert(changes)
+    dataset.last_sync = {"pages": last.number if last else 0, "changed": len(changes)}
+    if debug:
+        st.caption(f"🔄 Delta desde {watermark}: {len(changes)} cambios en {dataset.last_sync['pages']} página(s)")
+    dataset.mark_fetched(full=False)
+    return True
+
+def _next_page(dataset, headers, debug=False):
+    """Descarga la página siguiente a las que ya tiene `dataset` y la añade"""
+    number = dataset.pages + 1
+    url = page_url(dataset.url, number)
+    if debug:
+        st.code(url)
+    resp = client.get(url, headers=headers)
+    if resp.status_code != 200:
+        raise PageError(number, resp)
+    data = projection(CURSUS_USER_FIELDS)(resp)
+    dataset.total_pages = planned_pages(resp, 10**9) or dataset.total_pages
+    dataset.total_records = total_records(resp)
+    dataset.nbytes += len(resp.content)
+    if dataset.pages == 0:
+        dataset.mark_fetched(full=True)
+    dataset.add_page(data)
+    if len(data) < DEFAULT_PAGE_SIZE or (dataset.total_pages and number >= dataset.total_pages):
+        dataset.complete = True
+    return dataset.records[-len(data):] if data else []
+
+def _reject_params(dataset, headers, error):
+    """
+    La API rechazó (400/422) la primera página de un escaneo filtrado: prueba
+    cada parámetro de filtro por separado (una request de un registro) y marca
+    los que falla para aplicarlos en local. Si ninguno falla solo, quedan
+    todos en local. Devuelve True si hay que reintentar el escaneo.
+    """
+    sent = spec.pushed(dataset.filters)
+    if error.number != 1 or error.response.status_code not in (400, 422) or not sent:
+        return False
+    base = cursus_users_url(dataset.campus_id, dataset.cursus_id)
+    failed = []
+    for f in sent:
+        name, value = spec.api_param(f)
+        resp = client.get(page_url(f"{base}&{name}={value}", 1, page_size=1), headers=headers)
+        if resp.status_code in (400, 422):
+            failed.append(name)
+    failed = failed or [spec.api_param(f)[0] for f in sent]
+    for name in failed:
+        spec.reject(name)
+    st.caption(f"⚠️ La API no acepta {', '.join(failed)}: se filtra en local")
+    return True
+
+def _report_filters(dataset, headers, requests_made):
+    """Debug: qué filtros fueron a la API y cuánto se ahorró frente a escanear sin ellos"""
+    if not dataset.filters:
+        return
+    st.caption(
+        f"🔎 Filtros en la API: {spec.describe(spec.pushed(dataset.filters))} · "
+        f"en local: {spec.describe(spec.local_only(dataset.filters))}"
+        + (f" · rechazados por la API: {spec.describe(spec.rejected(dataset.filters))}" if spec.rejected(dataset.filters) else "")
+    )
+    # Una request de un registro para saber el tamaño del listado sin filtros
+    resp = client.get(page_url(cursus_users_url(dataset.campus_id, dataset.cursus_id), 1, page_size=1),
+                      headers=headers, cache_ttl=CURSUS_DATASET_TTL)
+    unfiltered = total_records(resp) if resp.status_code == 200 else None
+    filtered = dataset.total_records
+    if unfiltered is None or filtered is None or not dataset.records:
+        return
+    per_record = dataset.nbytes / len(dataset.records)
+    full_pages = -(-unfiltered // DEFAULT_PAGE_SIZE)
+    saved_pages = full_pages - (-(-filtered // DEFAULT_PAGE_SIZE))
+    saved_bytes = max(unfiltered - filtered, 0) * per_record
+    st.caption(
+        f"📉 {requests_made} request(s), {dataset.nbytes / 2**10:.0f} KiB · listado filtrado {filtered} "
+        f"de {unfiltered} registros: ~{saved_pages} de {full_pages} páginas y "
+        f"~{saved_bytes / 2**20:.1f} MiB ahorrados frente a escanearlo entero"
+    )
+
+def top_n_cursus_users(campus_id, cursus_id, headers, n, predicate, max_pages, debug=False, filters=()):
+    """
+    Los `n` registros más recientes (orden -updated_at) que cumplen `predicate`
+    (y `filters`, que se piden a la API en lo posible).
+
+    Como el listado viene ordenado por -updated_at, en cuanto hay `n`
+    coincidencias ninguna página posterior puede cambiar la respuesta (si el
+    criterio de orden de la vista es updated_at): se deja de escanear ahí. El
+    escaneo parcial queda en la sesión, así que si luego se pide un `n` mayor
+    se continúa desde la página siguiente en lugar de empezar de cero; y si ya
+    hay un dataset fresco que lo cubre, no se hace ninguna request.
+    Devuelve (coincidencias, stats) con stats = {"pages", "planned", "saved"}.
+    """
+    key = _key(campus_id, cursus_id, filters)
+    dataset = _prefix(campus_id, cursus_id, max_pages, filters) or CursusDataset(campus_id, cursus_id, filters)
+
+    matches = [r for r in dataset.view(max_pages) if predicate(r)]
+    if len(matches) < n and not dataset.covers(max_pages):
+        # Se amplía una copia y se publica al final: el compartido no cambia a medias
+        dataset = dataset.clone()
+        bar    = st.progress(0, text="Escaneando…")
+        status = st.empty()
+        pages_before = dataset.pages
+        try:
+            while len(matches) < n and not dataset.covers(max_pages):
+                try:
+                    new = _next_page(dataset, headers, debug)
+                except PageError as e:
+                    if not _reject_params(dataset, headers, e):
+                        raise
+                    continue
+                matches.extend(r for r in new if dataset.accepts(r) and predicate(r))
+                planned = min(max_pages, dataset.total_pages or max_pages)
+                status.text(f"📄 Página {dataset.pages} · {len(matches)}/{n} encontrados")
+                bar.progress(min(dataset.pages / planned, 1.0), text=f"Página {dataset.pages}/{planned} · {len(matches)}/{n} encontrados")
+            status.empty()
+        except PageError as e:
+            dataset.error = e
+            status.error(f"❌ Error API {e.response.status_code}: {e.response.text[:200]}")
+        bar.empty()
+        # Un registro que cambió durante el escaneo puede haber salido en dos páginas
+        dataset.dedupe()
+        matches = [r for r in dataset.view(max_pages) if predicate(r)]
+        if debug:
+            _report_filters(dataset, headers, dataset.pages - pages_before)
+        if dataset.error is None:
+            _publish(key, dataset)
+
+    planned = min(max_pages, dataset.total_pages or max_pages)
+    scanned = min(dataset.pages, max_pages)
+    return matches, {"pages": scanned, "planned": planned, "saved": max(planned - scanned, 0)}
+
+def load_cursus_users(campus_id, cursus_id, headers, max_pages, debug=False, force=False, filters=()):
+    """
+    Dataset de cursus_users de (campus, cursus) que cubre `max_pages`.
+    Reutiliza el de la sesión si está fresco (cero requests); si ya existe pero
+    caducó, lo pone al día con un delta (una o dos páginas); si no, o toca
+    reconciliación completa, escanea entero. Un error de la API deja el dataset
+    parcial en `dataset.error` (y no se reutiliza).
+    Con `filters` se escanea solo ese subconjunto (`max_pages` cuenta páginas
+    del listado que se pide a la API, con los filtros que se mandan); si hay un escaneo fresco cuyos filtros lo abarcan
+    (o sin filtros) y llega a cubrirlo, se saca de él sin requests.
+    Un escaneo fresco que se quedó corto (de la clave o sacado de uno más
+    amplio) no se repite: se piden solo las páginas que le faltan (_extend).
+    """
+    key = _key(campus_id, cursus_id, filters)
+    dataset = _lookup(key)
+    if not force and dataset is not None and dataset.covers(max_pages):
+        if dataset.fresh():
+            return dataset
+        if not dataset.needs_full_sync():
+            updated = dataset.clone()
+            if sync_cursus_users(updated, headers, debug):
+                _publish_delta(key, updated)
+                return updated
+    prefix = None if force else _prefix(campus_id, cursus_id, max_pages, filters)
+    if prefix is not None and prefix.covers(max_pages):
+        return prefix
+
+    # Una sola sesión escanea cada clave; las demás esperan y se llevan su resultado
+    with get_registry().scan_lock(key):
+        dataset = _lookup(key)
+        if not force and dataset is not None and dataset.covers(max_pages) and dataset.fresh():
+            return dataset
+        if campus_id is None:
+            dataset = _scan_all_campuses(cursus_id, headers, max_pages, debug, filters, restart=force)
+        elif prefix is not None and prefix.pages:
+            dataset = _extend(prefix, headers, max_pages, debug)
+        else:
+            dataset = _full_scan(campus_id, cursus_id, headers, max_pages, debug, filters, restart=force)
+        if debug:
+            _report_filters(dataset, headers, dataset.pages - dataset.extended_from)
+        if dataset.error is None:
+            _publish_scan(key, dataset)
+    return dataset
+
+def _full_scan(campus_id, cursus_id, headers, max_pages, debug=False, filters=(), ui=True, on_page=None, stop=None,
+               workers=SCAN_WORKERS, restart=False):
+    """
+    Escaneo completo de un (campus, cursus) hasta `max_pages`, reintentando
+    sin los filtros que la API rechace. `on_page(dataset, nuevos)` tras cada página;
+    si `stop(dataset)` da True se para ahí (y el dataset no queda completo).
+
+    Es un trabajo reanudable: cada página queda en disco y, si el escaneo se
+    corta, el siguiente intento solo pide las que faltan (`restart` lo tira y
+    empieza de cero). Lo que se actualizó entretanto sube a la página 1, que
+    ya no se vuelve a pedir: al reanudar se recoge con un delta desde la marca
+    de agua del primer intento.
+    """
+    if restart:
+        get_checkpoints().discard(cursus_users_url(campus_id, cursus_id, filters))
+    # El tamaño real del listado lo decide _keyset_plan con el X-Total de su primera página
+    if stop is None and max_pages >= KEYSET_MIN_PAGES:
+        dataset = _keyset_scan(campus_id, cursus_id, headers, max_pages, debug, filters, ui, workers, restart)
+        if dataset is not None:
+            return dataset
+    while True:
+        dataset = CursusDataset(campus_id, cursus_id, filters)
+        stopped = []
+
+        def add_page(data, dataset=dataset):
+            dataset.add_page(data)
+            if on_page is not None and data:
+                on_page(dataset, dataset.records[-len(data):])
+
+        def should_stop(dataset=dataset, stopped=stopped):
+            if stop is not None and stop(dataset):
+                stopped.append(True)
+            return bool(stopped)
+
+        last, error = _scan(dataset.url, headers, max_pages, debug, add_page, dataset, ui=ui, stop=should_stop,
+                            workers=workers, resume=True)
+        if error is None or not _reject_params(dataset, headers, error):
+            break
+    dataset.dedupe()
+    if error is not None:
+        dataset.error = error
+        dataset.scanned_at = datetime.now()
+        return dataset
+    get_checkpoints().discard(dataset.url)
+    dataset.complete = not stopped and _reached_end(last, max_pages)
+    dataset.mark_fetched(full=True)
+    if dataset.resumed_pages and not sync_cursus_users(dataset, headers, debug, ui=ui):
+        # Demasiados cambios para un delta: la próxima carga reconcilia entero
+        dataset._full_at = 0.0
+    return dataset
+
+def _extend(prefix, headers, max_pages, debug=False, ui=True, on_page=None, stop=None, workers=SCAN_WORKERS):
+    """
+    Amplía un escaneo fresco que se quedó corto (`prefix`, ver _prefix) hasta
+    `max_pages` pidiendo solo las páginas que le faltan, sobre una copia.
+    Mismo contrato que _full_scan (`on_page`, `stop`, `dataset.error`). La
+    hora de escaneo no cambia: las primeras páginas siguen siendo las de
+    entonces, y su delta o reconciliación toca cuando tocaba.
+    """
+    dataset = prefix.clone()
+    dataset.extended_from = prefix.pages
+    dataset.nbytes = 0
+    stopped = []
+
+    def add_page(data):
+        dataset.add_page(data)
+        if on_page is not None and data:
+            on_page(dataset, dataset.records[-len(data):])
+
+    def should_stop():
+        if stop is not None and stop(dataset):
+            stopped.append(True)
+        return bool(stopped)
+
+    # Las páginas que ya están no se piden: a iter_pages solo le cuenta que
+    # existen (y llenas), sus registros ya están en el dataset
+    done = {number: [None] * DEFAULT_PAGE_SIZE for number in range(1, prefix.pages + 1)}
+    pages = (p for p in iter_pages(dataset.url, lambda u: client.get(u, headers=headers), max_pages, workers=workers,
+                                   decode=projection(CURSUS_USER_FIELDS), done=done, total=prefix.total_records)
+             if p.number > prefix.pages)
+    last, error = _scan(dataset.url, headers, max_pages, debug, add_page, dataset, ui=ui, stop=should_stop, pages=pages)
+    dataset.dedupe()
+    if error is not None and error.response.status_code in (400, 422):
+        # Un filtro que la API no acepta cambia el listado: el prefijo ya no vale
+        return _full_scan(prefix.campus_id, prefix.cursus_id, headers, max_pages, debug, prefix.filters, ui,
+                          on_page, stop, workers)
+    if error is not None:
+        dataset.error = error
+        return dataset
+    dataset.complete = not stopped and (last is None or _reached_end(last, max_pages))
+    if debug:
+        st.caption(f"➕ Ampliado desde la página {prefix.pages}: {dataset.pages - prefix.pages} página(s) nuevas")
+    return dataset
+
+def _keyset_plan(url, headers, max_pages, debug, workers):
+    """
+    Primera página por id (range[id] desde 0) y reparto del resto en rangos.
+    Devuelve (plan, primera página) o (None, None) si el listado no cabe en
+    `max_pages` o la API falla (entonces va el escaneo por páginas, que ya
+    sabe reintentar sin filtros y mostrar el error).
+    """
+    first_url = keyset_url(url, 0)
+    if debug:
+        st.code(first_url)
+    first = client.get(first_url, headers=headers)
+    total = total_records(first) if first.status_code == 200 else None
+    if total is None or math.ceil(total / DEFAULT_PAGE_SIZE) > max_pages:
+        return None, None
+    data = projection(CURSUS_USER_FIELDS)(first)
+    ranges = []
+    remaining = math.ceil(total / DEFAULT_PAGE_SIZE) - 1
+    if len(data) >= DEFAULT_PAGE_SIZE and remaining < KEYSET_MIN_PAGES:
+        # Listado corto: una sola cadena desde aquí, sin la request del id más
+        # alto ni rangos que costarían al menos una request cada uno
+        ranges = [(data[-1]["id"] + 1, KEYSET_END)]
+    elif len(data) >= DEFAULT_PAGE_SIZE:
+        # El id más alto, para repartir lo que queda entre los hilos
+        newest = client.get(page_url(url.replace("sort=id", "sort=-id"), 1, page_size=1), headers=headers)
+        if newest.status_code != 200:
+            return None, None
+        start = data[-1]["id"] + 1
+        top = (decode_json(newest) or [{"id": start}])[0]["id"]
+        # Nunca más rangos que páginas quedan: cada rango cuesta al menos una request
+        ranges = split_ids(start, max(top, start), min(workers * KEYSET_RANGES_PER_WORKER, remaining))
+    return {"total": total, "ranges": ranges, "nbytes": len(first.content)}, data
+
+def _keyset_remaining(plan, saved):
+    """Lo que falta de cada rango del plan: sigue desde el mayor id ya guardado;
+    un rango cuya última página guardada fue corta ya está completo"""
+    remaining = []
+    for lo, hi in plan["ranges"]:
+        tails = [page for page in saved.values() if lo <= page[-1]["id"] <= hi]
+        if not tails:
+            remaining.append((lo, hi))
+            continue
+        tail = max(tails, key=lambda page: page[-1]["id"])
+        if len(tail) >= DEFAULT_PAGE_SIZE and tail[-1]["id"] < hi:
+            remaining.append((tail[-1]["id"] + 1, hi))
+    return remaining
+
+def _keyset_scan(campus_id, cursus_id, headers, max_pages, debug=False, filters=(), ui=True, workers=SCAN_WORKERS,
+                 restart=False):
+    """
+    Escaneo completo por rangos de id (sort=id + range[id], ver
+    api.pagination.iter_id_ranges) en lugar de por número de página: sin
+    páginas profundas, con los rangos en paralelo, y sin duplicados ni huecos
+    por registros que cambian a mitad de escaneo. Al terminar se ordena
+    -updated_at como el resto de datasets.
+
+    El orden por id no da "las N más recientes", así que solo vale cuando el
+    listado entero cabe en `max_pages`; si no, devuelve None y _full_scan
+    escanea por páginas. Reanudable como aquel: el plan de rangos (página 0)
+    y cada página quedan en disco y al reintentar cada rango sigue desde el
+    mayor id guardado.
+    """
+    # Un escaneo anterior ya vio que el listado no cabe: no se gasta la request de prueba
+    # y si es corto, el escaneo por páginas pide lo mismo o menos
+    known = get_registry().get(_key(campus_id, cursus_id, filters))
+    if known is not None and known.total_records:
+        known_pages = math.ceil(known.total_records / DEFAULT_PAGE_SIZE)
+        if known_pages > max_pages or known_pages < KEYSET_MIN_PAGES:
+            return None
+
+    dataset = CursusDataset(campus_id, cursus_id, filters)
+    url = cursus_users_url(campus_id, cursus_id, filters, sort="id")
+    checkpoints = get_checkpoints()
+    if restart:
+        checkpoints.discard(url)
+    _, saved = checkpoints.load(url)
+    plan = saved.pop(0, None)
+    if plan is None:
+        plan, first = _keyset_plan(url, headers, max_pages, debug, workers)
+        if plan is None:
+            return None
+        checkpoints.save(url, 0, plan, plan["total"])
+        checkpoints.save(url, 1, first, plan["total"])
+        dataset.nbytes += plan["nbytes"]
+        saved = {1: first}
+    else:
+        dataset.resumed_pages = len(saved)
+        if ui and saved:
+            st.info(f"♻️ Reanudando un escaneo a medias: {len(saved)} página(s) ya descargadas")
+    for number in sorted(saved):
+        dataset.add_page(saved[number])
+
+    total, total_pages = plan["total"], math.ceil(plan["total"] / DEFAULT_PAGE_SIZE)
+    pages = iter_id_ranges(
+        url, _keyset_remaining(plan, saved), lambda u: client.get(u, headers=headers), workers=workers,
+        decode=projection(CURSUS_USER_FIELDS), keep=lambda number, data, total: checkpoints.save(url, number, data, total),
+        first_number=max(saved, default=0) + 1, total_pages=total_pages, total=total, received=len(dataset.records),
+    )
+    _, error = _scan(url, headers, max_pages, debug, dataset.add_page, dataset, ui=ui, workers=workers, pages=pages)
+    if error is not None:
+        dataset.error = error
+        dataset.scanned_at = datetime.now()
+        return dataset
+
+    checkpoints.discard(url)
+    dataset.records.sort(key=lambda r: r.updated_at, reverse=True)
+    dataset.pages = math.ceil(len(dataset.records) / DEFAULT_PAGE_SIZE)
+    dataset.total_pages = total_pages
+    dataset.total_records = total
+    dataset.complete = True
+    dataset.mark_fetched(full=True)
+    if dataset.resumed_pages and not sync_cursus_users(dataset, headers, debug, ui=ui):
+        dataset._full_at = 0.0
+    return dataset
+
+class _Newest:
+    """Los `k` updated_at más recientes vistos entre varios escaneos concurrentes"""
+
+    def __init__(self, k):
+        self.k = k
+        self._heap = []
+        self._lock = threading.Lock()
+
+    def add(self, records):
+        with self._lock:
+            for r in records:
+                if len(self._heap) < self.k:
+                    heapq.heappush(self._heap, r.updated_at)
+                elif r.updated_at > self._heap[0]:
+                    heapq.heapreplace(self._heap, r.updated_at)
+
+    def threshold(self):
+        """updated_at del k-ésimo más reciente (None hasta haber k)"""
+        with self._lock:
+            return self._heap[0] if len(self._heap) >= self.k else None
+
+def _scan_all_campuses(cursus_id, headers, max_pages, debug=False, filters=(), restart=False):
+    """
+    "Todos los campus" como una partición por campus (ids de get_campus)
+    escaneadas a la vez bajo el limitador global, en lugar de un único
+    listado de hasta 1000 páginas cuyas páginas profundas son cada vez más
+    lentas. La vista necesita los max_pages*100 registros más recientes de
+    toda la red: en cuanto hay tantos, un campus cuya última página ya es más
+    antigua que el último de ellos deja de escanear (sus páginas siguientes no
+    pueden entrar). Los campus pequeños van primero, así que terminan antes.
+    Los datasets por campus quedan en el registro y se reutilizan si siguen
+    frescos y cubren `max_pages`; si se quedaron cortos se amplían. Si hay más campus que páginas pedidas se
+    usa el listado único de siempre.
+    """
+    # Un campus sin usuarios no puede tener cursus_users: no se gasta una request en él
+    campuses = sorted((c for c in get_campus(headers) if c.get("users_count") != 0),
+                      key=lambda c: c.get("users_count") or 0)
+    if len(campuses) >= max_pages:
+        # Escaneo corto: no llega a las páginas profundas y repartirlo costaría
+        # al menos una request por campus, más que el listado único
+        return _full_scan(None, cursus_id, headers, max_pages, debug, filters, restart=restart)
+    progress = {c["id"]: {"Campus": c.get("name", c["id"]), "Páginas": "0", "Registros": 0, "Estado": "⏳"}
+                for c in campuses}
+    parts = {}
+    pending = []
+    newest = _Newest(max_pages * DEFAULT_PAGE_SIZE)
+    for campus in campuses:
+        part = None if restart else _prefix(campus["id"], cursus_id, max_pages, filters)
+        if part is not None and part.covers(max_pages):
+            parts[campus["id"]] = part
+            newest.add(part.records)
+            progress[campus["id"]].update({"Páginas": str(part.pages), "Registros": len(part.records), "Estado": "💾"})
+        else:
+            # Lo que ya haya de este campus (p. ej. un escaneo que se paró antes) se amplía
+            if part is not None:
+                newest.add(part.records)
+            pending.append((campus["id"], part))
+
+    def on_page(dataset, records):
+        newest.add(records)
+        planned = -(-(dataset.total_records or 0) // DEFAULT_PAGE_SIZE)
+        progress[dataset.campus_id].update({
+            "Páginas": f"{dataset.pages}/{min(planned, max_pages) or '?'}",
+            "Registros": len(dataset.records),
+            "Estado": "📄",
+        })
+
+    def past_threshold(dataset):
+        threshold = newest.threshold()
+        return threshold is not None and bool(dataset.records) and dataset.records[-1].updated_at < threshold
+
+    def scan_one(campus_id, prefix):
+        # Páginas de cada campus en secuencia: el paralelismo va entre campus y
+        # así un campus que ya no aporta se para sin tener páginas adelantadas
+        if prefix is not None and prefix.pages:
+            return _extend(prefix, headers, max_pages, False, ui=False, on_page=on_page, stop=past_threshold, workers=1)
+        return _full_scan(campus_id, cursus_id, headers, max_pages, False, filters,
+                          ui=False, on_page=on_page, stop=past_threshold, workers=1, restart=restart)
+
+    bar   = st.progress(0, text="Escaneando campus…")
+    table = st.empty()
+    with thread_pool(CAMPUS_SCAN_WORKERS, name="api42-campus") as pool:
+        futures = {pool.submit(scan_one, campus_id, prefix): campus_id for campus_id, prefix in pending}
+        remaining = set(futures)
+        while remaining:
+            done, remaining = wait(remaining, timeout=0.5, return_when=FIRST_COMPLETED)
+            for future in done:
+                part = future.result()
+                parts[futures[future]] = part
+                progress[part.campus_id]["Estado"] = "❌" if part.error is not None else "✅"
+                # Uno que se paró antes también se publica: es el principio del
+                # listado del campus y otra carga lo amplía en lugar de repetirlo
+                if part.error is None and part.covers(max_pages):
+                    _publish_scan(_key(part.campus_id, cursus_id, filters), part)
+                elif part.error is None:
+                    _publish(_key(part.campus_id, cursus_id, filters), part)
+            finished = len(parts)
+            bar.progress(finished / max(len(campuses), 1), text=f"Campus {finished}/{len(campuses)}")
+            running = [row for row in progress.values() if row["Estado"] in ("⏳", "📄")]
+            table.dataframe(running[:20], use_container_width=True, hide_index=True)
+    bar.empty()
+    table.empty()
+
+    dataset = CursusDataset(None, cursus_id, filters)
+    records = [r for part in parts.values() for r in part.records]
+    dataset.records = sorted(records, key=lambda r: r.updated_at, reverse=True)
+    dataset.dedupe()
+    dataset.nbytes = sum(part.nbytes for part in parts.values())
+    dataset.total_records = sum(part.total_records or 0 for part in parts.values())
+    dataset.complete = all(part.complete for part in parts.values())
+    if dataset.complete:
+        dataset.pages = -(-len(dataset.records) // DEFAULT_PAGE_SIZE)
+    else:
+        # Más allá de los max_pages*100 más recientes cada campus aporta lo que
+        # tenía al pararse: esa cola no es el principio del listado de la red
+        dataset.records = dataset.records[:max_pages * DEFAULT_PAGE_SIZE]
+        dataset.pages = max_pages
+    errors = [part.error for part in parts.values() if part.error is not None]
+    if errors:
+        dataset.error = errors[0]
+        dataset.scanned_at = datetime.now()
+        st.error(f"❌ {len(errors)} campus con error de la API; el resultado está incompleto")
+        return dataset
+    dataset.mark_fetched(full=True)
+    return dataset
+
+def warm_cursus_users(campus_id, cursus_id, max_pages):
+    """
+    Refresco de fondo (api.scheduler), sin UI ni sesión: delta sobre el
+    dataset publicado si se puede, escaneo completo si no. Las sesiones lo
+    ven en su próxima lectura. Devuelve el dataset, o None si la API falló
+    o si una sesión está escaneando la clave y aún no hay nada publicado.
+    """
+    key = _key(campus_id, cursus_id)
+    registry = get_registry()
+    current = registry.get(key) or _restore(key)
+    if current is not None and current.covers(max_pages) and not current.needs_full_sync():
+        dataset = current.clone()
+        if sync_cursus_users(dataset, None, ui=False):
+            _publish_delta(key, dataset)
+            return dataset
+
+    # Si una sesión ya escanea esta clave no se la hace esperar: el
+    # precalentado se salta y vuelve en el siguiente intervalo
+    lock = registry.scan_lock(key)
+    if not lock.acquire(blocking=False):
+        return current
+    try:
+        dataset = _full_scan(campus_id, cursus_id, None, max_pages, ui=False)
+        if dataset.error is not None:
+            return None
+        _publish_scan(key, dataset)
+    finally:
+        lock.release()
+    return dataset
+
+def fetch_raw_cursus_user(cursus_id, user_id, headers):
+    """cursus_user completo (sin proyectar) de un usuario, pedido solo cuando se necesita"""
+    data = client.get_json(f"/v2/cursus/{cursus_id}/cursus_users", params={"filter[user_id]": user_id},
+                           headers=headers, default=[], cache_ttl=HTTP_CACHE_TTLS["user"])
+    return data[0] if data else None
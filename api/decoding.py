@@ -0,0 +1,77 @@
+# api/decoding.py
+
+import json
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional: sin él se usa el json de la stdlib
+    orjson = None
+
+# Campos de un cursus_user que usan las páginas de escaneo
+CURSUS_USER_FIELDS = [
+    "id", "grade", "level", "begin_at", "end_at", "blackholed_at", "updated_at",
+    "user.id", "user.login", "user.displayname", "user.kind", "user.active?",
+    "user.correction_point", "user.wallet", "user.pool_month", "user.pool_year",
+    "user.updated_at",
+]
+
+# Campos de un cursus_user para el nivel de los usuarios activos (api.users)
+CURSUS_LEVEL_FIELDS = ["user.id", "cursus_id", "level", "cursus.name", "cursus.slug"]
+
+DECODER = "orjson" if orjson else "json"
+
+def loads(data):
+    """Decodifica JSON (bytes o str) con el decodificador más rápido disponible"""
+    if orjson:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def dumps(value):
+    """Serializa a JSON (bytes) con el codificador más rápido disponible"""
+    if orjson:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(",", ":")).encode("utf-8")
+
+def decode_json(response):
+    """Decodificador por defecto de los escaneos: el JSON completo de la respuesta"""
+    return loads(response.content)
+
+def _compile(fields):
+    """["user.login", "grade"] -> {"user": {"login": None}, "grade": None}"""
+    tree = {}
+    for field in fields:
+        node = tree
+        parts = field.split(".")
+        for part in parts[:-1]:
+            if node.get(part) is None:
+                node[part] = {}
+            node = node[part]
+        node.setdefault(parts[-1], None)
+    return tree
+
+def _project(value, tree):
+    if isinstance(value, list):
+        return [_project(item, tree) for item in value]
+    if not isinstance(value, dict):
+        return value
+    out = {}
+    for key, subtree in tree.items():
+        if key in value:
+            out[key] = value[key] if subtree is None else _project(value[key], subtree)
+    return out
+
+def projection(fields):
+    """
+    Decodificador para iter_pages que se queda solo con `fields` (rutas con
+    puntos) manteniendo la forma anidada, así `cu.get("user").get("login")`
+    sigue funcionando. El resto de cada página se libera nada más decodificarla.
+    """
+    tree = _compile(fields)
+
+    def decode(response):
+        records = loads(response.content)
+        if not isinstance(records, list):
+            return records
+        return [_project(record, tree) for record in records]
+
+    return decode
@@ -0,0 +1,141 @@
+# api/filters.py
+
+import threading
+from collections import namedtuple
+
+# Un criterio sobre un campo de CursusUser:
+#   op "eq"      -> campo == value
+#   op "in"      -> campo in value (tupla)
+#   op "range"   -> value[0] <= campo <= value[1] (fechas ISO o números)
+#   op "present" -> campo no vacío (value se ignora)
+Filter = namedtuple("Filter", ["field", "op", "value"])
+
+# Cómo se pide cada campo a /v2/cursus/:id/cursus_users: (tipo, nombre en la API).
+# Lo que no está aquí se filtra siempre en local. kind y active son del usuario
+# embebido (active?): filter[active] existe pero es el del propio cursus_user,
+# así que la API lo acepta y filtraría otra cosa; van en local.
+API_FIELDS = {
+    "grade":         ("filter", "grade"),
+    "user_id":       ("filter", "user_id"),
+    "level":         ("range", "level"),
+    "begin_at":      ("range", "begin_at"),
+    "end_at":        ("range", "end_at"),
+    "blackholed_at": ("range", "blackholed_at"),
+}
+
+# range[...] que abarca cualquier fecha: deja fuera solo los null
+ANY_DATE = ("1970-01-01T00:00:00Z", "2100-01-01T00:00:00Z")
+
+# Parámetros que la API ha rechazado en este proceso (400/422): ya no se envían
+_rejected = set()
+_lock = threading.Lock()
+
+def _api_value(value):
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+def api_param(f):
+    """Filter -> (parámetro, valor) de la API, o None si solo se puede aplicar en local"""
+    kind, name = API_FIELDS.get(f.field, (None, None))
+    if kind == "filter" and f.op == "eq":
+        return f"filter[{name}]", _api_value(f.value)
+    if kind == "filter" and f.op == "in":
+        return f"filter[{name}]", ",".join(_api_value(v) for v in f.value)
+    if kind == "range" and f.op == "eq":
+        return f"range[{name}]", f"{f.value},{f.value}"
+    if kind == "range" and f.op == "range":
+        return f"range[{name}]", f"{f.value[0]},{f.value[1]}"
+    if kind == "range" and f.op == "present" and f.field.endswith("_at"):
+        return f"range[{name}]", f"{ANY_DATE[0]},{ANY_DATE[1]}"
+    return None
+
+def pushed(filters):
+    """Filtros que se mandan a la API (traducibles y no rechazados)"""
+    result = []
+    for f in filters:
+        param = api_param(f)
+        if param is not None and param[0] not in _rejected:
+            result.append(f)
+    return result
+
+def local_only(filters):
+    """Filtros que solo se pueden aplicar en local"""
+    sent = pushed(filters)
+    return [f for f in filters if f not in sent]
+
+def query(filters):
+    """Parámetros de la API de los filtros que se mandan, listos para una URL"""
+    return [f"{name}={value}" for name, value in map(api_param, pushed(filters))]
+
+def reject(param):
+    """Marca un parámetro como no soportado por la API (se aplicará en local)"""
+    with _lock:
+        _rejected.add(param)
+
+def rejected(filters):
+    """Filtros traducibles cuyo parámetro rechazó la API"""
+    return [f for f in filters if api_param(f) is not None and api_param(f)[0] in _rejected]
+
+def _match(record, f):
+    value = getattr(record, f.field)
+    if f.op == "eq":
+        return value == f.value
+    if f.op == "in":
+        return value in f.value
+    if f.op == "range":
+        return value is not None and value != "" and f.value[0] <= value <= f.value[1]
+    if f.op == "present":
+        return bool(value)
+    raise ValueError(f"Operador de filtro desconocido: {f.op}")
+
+def matches(record, filters):
+    """El registro cumple todos los filtros. Se aplican siempre en local, también
+    los que ya filtró la API: así da igual si la API ignora alguno"""
+    return all(_match(record, f) for f in filters)
+
+def _implies(f, g):
+    """Todo registro que cumple `f` cumple también `g` (mismo campo)"""
+    if f == g:
+        return True
+    if f.field != g.field:
+        return False
+    if g.op == "present":
+        return (f.op == "eq" and bool(f.value)) or (f.op == "in" and all(f.value))
+    if g.op == "in":
+        return (f.op == "eq" and f.value in g.value) or (f.op == "in" and set(f.value) <= set(g.value))
+    if g.op == "range":
+        if f.op == "range":
+            return g.value[0] <= f.value[0] and f.value[1] <= g.value[1]
+        if f.op == "eq":
+            return f.value is not None and f.value != "" and g.value[0] <= f.value <= g.value[1]
+    return False
+
+def subsumes(general, specific):
+    """
+    Lo que deja pasar `specific` es un subconjunto de lo que deja pasar
+    `general`: cada filtro de `general` lo implica alguno de `specific`
+    (p. ej. grade=Member ⊂ grade in (Member, Learner), o un rango de level
+    dentro de otro). Sin filtros `general` lo abarca todo.
+    """
+    return all(any(_implies(f, g) for f in specific) for g in general)
+
+def spec_key(filters):
+    """Clave hashable e independiente del orden de una especificación"""
+    return frozenset(filters)
+
+def describe(filters):
+    """Texto corto de una lista de filtros, para debug"""
+    if not filters:
+        return "—"
+    parts = []
+    for f in filters:
+        if f.op == "present":
+            parts.append(f"{f.field}≠null")
+        elif f.op == "range":
+            parts.append(f"{f.field}∈[{f.value[0]}, {f.value[1]}]")
+        elif f.op == "in":
+            parts.append(f"{f.field}∈{{{', '.join(map(str, f.value))}}}")
+        else:
+            parts.append(f"{f.field}={f.value}")
+    return ", ".join(parts)
@@ -0,0 +1,240 @@
+# api/http_cache.py
+
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from config.settings import HTTP_CACHE_DB, HTTP_CACHE_DISK_BYTES, HTTP_CACHE_MEMORY_BYTES
+
+# Una respuesta mayor que esta fracción del presupuesto de memoria solo va a disco
+_MEMORY_MAX_ENTRY = 8
+
+class HttpCache:
+    """
+    Caché HTTP de dos niveles para recursos que cambian poco, única del proceso.
+
+    Guarda el cuerpo de cada 200 junto a sus validadores (ETag / Last-Modified).
+    Dentro del TTL se sirve sin tocar la red; pasado el TTL se revalida con
+    If-None-Match / If-Modified-Since y, ante un 304, se reutiliza el cuerpo
+    guardado. Si el servidor no mandó validadores se vuelve a descargar entero.
+    El TTL lo elige cada llamada según la clase de recurso (HTTP_CACHE_TTLS).
+
+    Arriba, un LRU en memoria de hasta `memory_bytes`; debajo, SQLite de hasta
+    `disk_bytes`, que sobrevive a reinicios y desaloja por último uso. Lo que
+    se sale de memoria sigue en disco y vuelve a subir en su próximo uso. La
+    clave es la URL canónica (client.flight_key), sin cabeceras: un token
+    nuevo no invalida nada.
+    """
+
+    def __init__(self, path=HTTP_CACHE_DB, memory_bytes=HTTP_CACHE_MEMORY_BYTES, disk_bytes=HTTP_CACHE_DISK_BYTES):
+        self.path = path
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.stats = {
+            "hits": 0, "memory_hits": 0, "misses": 0, "revalidated": 0, "evictions": 0, "disk_evictions": 0,
+            "bytes_saved": 0, "seconds_saved": 0.0,
+        }
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # key -> entrada; orden LRU (la más reciente al final)
+        self._memory = OrderedDict()
+        self._in_memory = 0
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                cache_key TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                headers_json TEXT,
+                body BLOB,
+                elapsed REAL,
+                stored_at REAL,
+                size INTEGER,
+                used_at REAL
+            )
+        """)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(responses)")}
+        for column, kind in (("size", "INTEGER"), ("used_at", "REAL")):
+            if column not in columns:
+                # Caché creada por una versión anterior
+                conn.execute(f"ALTER TABLE responses ADD COLUMN {column} {kind}")
+        conn.execute("UPDATE responses SET size = LENGTH(body), used_at = stored_at WHERE size IS NULL")
+        conn.execute("CREATE INDEX IF NOT EXISTS responses_used ON responses (used_at)")
+        self._on_disk = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def lookup(self, key):
+        """Entrada guardada (dict) o None; la de disco sube a memoria"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                return entry
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT etag, last_modified, headers_json, body, elapsed, stored_at FROM responses WHERE cache_key = ?",
+            (key,),
+        ).fetchone()
+        if not row:
+            return None
+        conn.execute("UPDATE responses SET used_at = ? WHERE cache_key = ?", (time.time(), key))
+        etag, last_modified, headers_json, body, elapsed, stored_at = row
+        entry = {
+            "etag": etag,
+            "last_modified": last_modified,
+            "headers": json.loads(headers_json),
+            "body": body,
+            "elapsed": elapsed or 0.0,
+            "stored_at": stored_at,
+            "tier": "disk",
+        }
+        self._remember(key, entry)
+        return entry
+
+    def _remember(self, key, entry):
+        """Sube una entrada al nivel de memoria, desalojando por LRU lo que no quepa"""
+        size = len(entry["body"] or b"")
+        if size > self.memory_bytes // _MEMORY_MAX_ENTRY:
+            return
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self._in_memory -= len(old["body"] or b"")
+            self._memory[key] = {**entry, "tier": "memory"}
+            self._in_memory += size
+            while self._in_memory > self.memory_bytes and self._memory:
+                _, evicted = self._memory.popitem(last=False)
+                self._in_memory -= len(evicted["body"] or b"")
+                self.stats["evictions"] += 1
+
+    def store(self, key, response):
+        """Guarda un 200 con sus validadores en los dos niveles"""
+        now = time.time()
+        entry = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "headers": dict(response.headers),
+            "body": response.content,
+            "elapsed": response.elapsed.total_seconds() if response.elapsed else 0.0,
+            "stored_at": now,
+        }
+        size = len(entry["body"] or b"")
+        self._remember(key, entry)
+        conn = self._conn()
+        old = conn.execute("SELECT size FROM responses WHERE cache_key = ?", (key,)).fetchone()
+        conn.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, entry["etag"], entry["last_modified"], json.dumps(entry["headers"]), entry["body"],
+             entry["elapsed"], now, size, now),
+        )
+        with self._lock:
+            self._on_disk += size - ((old[0] or 0) if old else 0)
+            over = self._on_disk - self.disk_bytes
+        if over > 0:
+            self._evict_disk(over)
+
+    def _evict_disk(self, over):
+        """Borra de disco las entradas usadas hace más tiempo hasta liberar `over` bytes"""
+        conn = self._conn()
+        freed, evicted = 0, 0
+        while freed < over:
+            oldest = conn.execute("SELECT cache_key, size FROM responses ORDER BY used_at LIMIT 50").fetchall()
+            if not oldest:
+                break
+            for key, size in oldest:
+                if freed >= over:
+                    break
+                conn.execute("DELETE FROM responses WHERE cache_key = ?", (key,))
+                freed += size or 0
+                evicted += 1
+        with self._lock:
+            self._on_disk -= freed
+            self.stats["disk_evictions"] += evicted
+
+    def touch(self, key):
+        """Reinicia el TTL de una entrada revalidada con un 304"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                entry["stored_at"] = now
+        self._conn().execute("UPDATE responses SET stored_at = ?, used_at = ? WHERE cache_key = ?", (now, now, key))
+
+    def expire(self):
+        """Fuerza a revalidar todas las entradas en su próximo uso (se conservan
+        los validadores, así lo que no cambió vuelve como un 304 barato)"""
+        with self._lock:
+            for entry in self._memory.values():
+                entry["stored_at"] = 0
+        self._conn().execute("UPDATE responses SET stored_at = 0")
+
+    def clear_memory(self):
+        """Vacía el nivel de memoria (el disco se conserva)"""
+        with self._lock:
+            self._memory.clear()
+            self._in_memory = 0
+
+    def summary(self):
+        """Estadísticas y ocupación de cada nivel, para debug"""
+        with self._lock:
+            return {
+                "memory_entries": len(self._memory), "memory_bytes": self._in_memory,
+                "disk_bytes": self._on_disk, **self.stats,
+            }
+
+    @staticmethod
+    def conditional_headers(entry):
+        """Cabeceras If-None-Match / If-Modified-Since para revalidar (vacío si no hay validadores)"""
+        headers = {}
+        if entry and entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    @staticmethod
+    def as_response(url, entry):
+        """Reconstruye un requests.Response 200 a partir de una entrada"""
+        response = requests.Response()
+        response.status_code = 200
+        response._content = entry["body"]
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        response.url = url
+        response.encoding = "utf-8"
+        return response
+
+    def record(self, outcome, entry=None, elapsed=0.0):
+        """Contabiliza un hit / miss / revalidated y lo que se ahorró"""
+        with self._lock:
+            self.stats[outcome] += 1
+            if outcome == "hits" and entry and entry.get("tier") == "memory":
+                self.stats["memory_hits"] += 1
+            if outcome == "hits" and entry:
+                self.stats["bytes_saved"] += len(entry["body"] or b"")
+                self.stats["seconds_saved"] += entry["elapsed"]
+            elif outcome == "revalidated" and entry:
+                self.stats["bytes_saved"] += len(entry["body"] or b"")
+                self.stats["seconds_saved"] += max(entry["elapsed"] - elapsed, 0.0)
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    """Caché HTTP única del proceso"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = HttpCache()
+    return _cache
@@ -0,0 +1,247 @@
+# api/pagination.py
+
+import math
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from api import client
+from api.decoding import decode_json
+from api.workers import thread_pool
+from config.settings import DEFAULT_PAGE_SIZE, SCAN_WORKERS
+
+# nbytes: tamaño de la respuesta; total: registros del listado según X-Total (None si no viene)
+Page = namedtuple("Page", ["number", "data", "total_pages", "url", "nbytes", "total"], defaults=(0, None))
+
+class PageError(Exception):
+    """Respuesta no recuperable (≠ 200) durante un escaneo paginado"""
+
+    def __init__(self, number, response):
+        super().__init__(f"Página {number}: HTTP {response.status_code}")
+        self.number = number
+        self.response = response
+
+def page_url(url, number, page_size=DEFAULT_PAGE_SIZE):
+    """Añade page[size] y page[number] a una URL que puede traer ya otros parámetros"""
+    sep = "&" if "?" in url else "?"
+    return f"{url}{sep}page[size]={page_size}&page[number]={number}"
+
+# Cota superior de range[id] para el último rango: recoge también los ids creados durante el escaneo
+KEYSET_END = 2**31 - 1
+
+def keyset_url(url, lo, hi=KEYSET_END, page_size=DEFAULT_PAGE_SIZE):
+    """Añade range[id]=lo,hi y page[size] a una URL ordenada por id (siempre la primera página)"""
+    sep = "&" if "?" in url else "?"
+    return f"{url}{sep}range[id]={lo},{hi}&page[size]={page_size}"
+
+def split_ids(lo, hi, parts):
+    """Reparte [lo, hi] en `parts` rangos de id contiguos y disjuntos; el último llega a KEYSET_END"""
+    parts = max(1, min(parts, hi - lo + 1))
+    step = math.ceil((hi - lo + 1) / parts)
+    bounds = [(start, start + step - 1) for start in range(lo, hi + 1, step)]
+    bounds[-1] = (bounds[-1][0], KEYSET_END)
+    return bounds
+
+def total_records(response):
+    """Registros del listado según X-Total (None si no viene)"""
+    try:
+        return int(response.headers["X-Total"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def planned_pages(response, max_pages):
+    """Total de páginas según X-Total / X-Per-Page, acotado a max_pages (None si no vienen)"""
+    try:
+        total = int(response.headers["X-Total"])
+        per_page = int(response.headers["X-Per-Page"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if per_page <= 0:
+        return None
+    return min(max_pages, max(1, math.ceil(total / per_page)))
+
+def iter_pages(url, fetch=None, max_pages=1, page_size=DEFAULT_PAGE_SIZE, workers=SCAN_WORKERS, decode=None,
+               done=None, total=None, keep=None):
+    """
+    Recorre un listado paginado de la API y devuelve `Page`s en orden.
+
+    La primera página se pide sola; con sus cabeceras X-Total / X-Per-Page se
+    planifican todas las restantes y se descargan a la vez en un pool acotado
+    de `workers` hilos. Si la API no manda esas cabeceras (o workers == 1) se
+    cae al recorrido secuencial de siempre, parando en la primera página corta.
+    Lanza PageError con la primera respuesta ≠ 200, después de haber
+    devuelto todas las páginas anteriores.
+    `decode(response)` convierte cada respuesta en la lista de registros (por
+    defecto el JSON completo; ver api.decoding.projection).
+    `done` ({número: registros}) son páginas ya descargadas en un intento
+    anterior (ver api.checkpoints): se devuelven tal cual, sin request
+    (nbytes 0). Con la página 1 hace falta también su X-Total en `total`;
+    si no se sabe, se saca de la primera página que falta en lugar de volver
+    a pedir la 1.
+    `keep(número, registros, total)` recibe cada página descargada con éxito,
+    también las que llegaron en paralelo por detrás de un error (o de que el
+    llamador deje de iterar), para poder guardarlas y no volver a pedirlas.
+    """
+    fetch = fetch or client.get
+    decode = decode or decode_json
+    done = done or {}
+
+    first_url = page_url(url, 1, page_size)
+    # Bytes de la página que se pidió solo para saber el X-Total (ya en `done`)
+    probed = {}
+    if 1 in done and total is None:
+        number = next(n for n in range(1, max_pages + 2) if n not in done)
+        if number <= max_pages:
+            probe = fetch(page_url(url, number, page_size))
+            if probe.status_code != 200:
+                raise PageError(number, probe)
+            total = total_records(probe)
+            data = decode(probe)
+            if total is not None and data:
+                done = {**done, number: data}
+                probed[number] = len(probe.content)
+                if keep is not None:
+                    keep(number, data, total)
+    if 1 in done and total is not None:
+        data = done[1]
+        total_pages = min(max_pages, max(1, math.ceil(total / page_size)))
+        nbytes = 0
+    else:
+        first = fetch(first_url)
+        if first.status_code != 200:
+            raise PageError(1, first)
+        data = decode(first)
+        total_pages = planned_pages(first, max_pages)
+        total = total_records(first)
+        nbytes = len(first.content)
+        if keep is not None and data:
+            keep(1, data, total)
+    if not data:
+        return
+
+    yield Page(1, data, total_pages or max_pages, first_url, nbytes, total)
+
+    if total_pages is None or workers <= 1:
+        number = 1
+        while len(data) >= page_size and number < max_pages:
+            number += 1
+            next_url = page_url(url, number, page_size)
+            if number in done:
+                data, nbytes = done[number], probed.get(number, 0)
+            else:
+                resp = fetch(next_url)
+                if resp.status_code != 200:
+                    raise PageError(number, resp)
+                data, nbytes = decode(resp), len(resp.content)
+                if keep is not None and data:
+                    keep(number, data, total)
+            if not data:
+                return
+            yield Page(number, data, total_pages or max_pages, next_url, nbytes, total)
+        return
+
+    urls = {number: page_url(url, number, page_size) for number in range(2, total_pages + 1)}
+    with thread_pool(workers) as pool:
+        futures = {number: pool.submit(fetch, u) for number, u in urls.items() if number not in done}
+        consumed = set()
+        failed = False
+        try:
+            for number in range(2, total_pages + 1):
+                consumed.add(number)
+                if number in done:
+                    data, nbytes = done[number], probed.get(number, 0)
+                else:
+                    resp = futures[number].result()
+                    if resp.status_code != 200:
+                        failed = True
+                        raise PageError(number, resp)
+                    data, nbytes = decode(resp), len(resp.content)
+                    if keep is not None and data:
+                        keep(number, data, total)
+                if not data:
+                    return
+                yield Page(number, data, total_pages, urls[number], nbytes, total)
+        finally:
+            for number, future in futures.items():
+                if number in consumed or future.cancel() or keep is None:
+                    continue
+                # Ya pedida: tras un error se espera a que llegue; si el llamador
+                # simplemente dejó de iterar, solo se guardan las que ya llegaron
+                if not failed and not future.done():
+                    continue
+                try:
+                    resp = future.result()
+                except Exception:
+                    continue
+                if resp.status_code == 200:
+                    data = decode(resp)
+                    if data:
+                        keep(number, data, total)
+
+def iter_id_ranges(url, ranges, fetch=None, page_size=DEFAULT_PAGE_SIZE, workers=SCAN_WORKERS, decode=None,
+                   keep=None, first_number=1, total_pages=None, total=None, received=0):
+    """
+    Recorre por rangos de id (keyset) un listado cuya `url` ya va con sort=id.
+
+    Cada rango (lo, hi) de `ranges` es una cadena de requests
+    range[id]=<último id + 1>,hi que acaba en la primera página corta. Los
+    rangos son disjuntos y se descargan a la vez en un pool de `workers`
+    hilos. Sin page[number] no hay páginas profundas, y un registro que cambia
+    durante el escaneo no se mueve: cada id sale exactamente una vez.
+    Devuelve `Page`s según llegan (no en orden de id), numeradas desde
+    `first_number`; `total_pages` y `total` se copian a cada Page para el
+    progreso. Con `total` (X-Total) y `received` (registros que ya se tenían),
+    una cadena que es la última en vuelo no pide la página siguiente si ya
+    han llegado todos: se ahorra la request vacía de un listado que acaba
+    justo en una página llena (igual que el plan por X-Total de iter_pages).
+    Lanza PageError con la primera respuesta ≠ 200.
+    `decode` y `keep` como en iter_pages.
+    """
+    fetch = fetch or client.get
+    decode = decode or decode_json
+    number = first_number - 1
+    with thread_pool(workers) as pool:
+        pending = {}
+
+        def submit(lo, hi):
+            chunk_url = keyset_url(url, lo, hi, page_size)
+            pending[pool.submit(fetch, chunk_url)] = (chunk_url, hi)
+
+        for lo, hi in ranges:
+            if lo <= hi:
+                submit(lo, hi)
+        failed = False
+        try:
+            while pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    chunk_url, hi = pending.pop(future)
+                    resp = future.result()
+                    if resp.status_code != 200:
+                        failed = True
+                        raise PageError(number + 1, resp)
+                    data = decode(resp)
+                    if not data:
+                        continue
+                    number += 1
+                    received += len(data)
+                    if keep is not None:
+                        keep(number, data, total)
+                    last_id = data[-1]["id"]
+                    done = total is not None and received >= total and not pending
+                    if len(data) >= page_size and last_id < hi and not done:
+                        submit(last_id + 1, hi)
+                    yield Page(number, data, max(total_pages or 0, number), chunk_url, len(resp.content), total)
+        finally:
+            # Igual que iter_pages: se guardan las que ya venían en camino
+            for future in pending:
+                if future.cancel() or keep is None or (not failed and not future.done()):
+                    continue
+                try:
+                    resp = future.result()
+                except Exception:
+                    continue
+                if resp.status_code == 200:
+                    data = decode(resp)
+                    if data:
+                        number += 1
+                        keep(number, data, total)
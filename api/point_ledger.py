@@ -0,0 +1,180 @@
+# api/point_ledger.py
+
+import sqlite3
+import threading
+import time
+from concurrent.futures import as_completed
+
+import pandas as pd
+import requests
+
+from api import client
+from api.workers import thread_pool
+from config.settings import FANOUT_WORKERS, POINT_LEDGER_DB, POINT_LEDGER_TTL
+
+# Variables por consulta que admite SQLite sin tocar su configuración
+_SQL_CHUNK = 500
+# Tope superior de range[created_at] (la API pide los dos extremos)
+_FAR_FUTURE = "2100-01-01T00:00:00.000Z"
+_COLUMNS = ["id", "user_id", "created_at", "sum", "total", "reason", "scale_team_id"]
+
+class PointLedger:
+    """
+    Copia local (SQLite), solo de añadir, de /v2/users/:id/correction_point_historics.
+
+    Cada usuario se descarga entero una vez; después solo se piden los
+    movimientos con created_at posterior al último guardado. La tabla `synced`
+    recuerda cuándo se puso al día cada usuario: dentro de `max_age` no se
+    pide nada.
+    """
+
+    def __init__(self, path=POINT_LEDGER_DB):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS historics (
+                id INTEGER PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                created_at TEXT NOT NULL,
+                sum INTEGER,
+                total INTEGER,
+                reason TEXT,
+                scale_team_id INTEGER
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS historics_user ON historics (user_id, created_at)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS synced (
+                user_id INTEGER PRIMARY KEY,
+                synced_at REAL NOT NULL,
+                newest TEXT
+            )
+        """)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _state(self, user_ids):
+        """{user_id: (synced_at, newest created_at)} de los ya descargados"""
+        state = {}
+        for start in range(0, len(user_ids), _SQL_CHUNK):
+            chunk = user_ids[start:start + _SQL_CHUNK]
+            rows = self._conn().execute(
+                f"SELECT user_id, synced_at, newest FROM synced WHERE user_id IN ({','.join('?' * len(chunk))})",
+                chunk,
+            )
+            state.update((user_id, rest) for user_id, *rest in rows)
+        return state
+
+    def _append(self, user_id, records, newest):
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO historics VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(r.get("id"), user_id, r.get("created_at") or r.get("updated_at") or "", r.get("sum"), r.get("total"),
+                  r.get("reason"), r.get("scale_team_id")) for r in records],
+            )
+            conn.execute("INSERT OR REPLACE INTO synced (user_id, synced_at, newest) VALUES (?, ?, ?)",
+                         (user_id, time.time(), newest))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def sync(self, user_ids, headers=None, max_age=POINT_LEDGER_TTL, progress=None):
+        """
+        Pone al día el historial de `user_ids`, en paralelo: los que no se
+        han puesto al día en `max_age` segundos piden solo lo posterior a su
+        último movimiento guardado. `progress(hechos, total)` se llama desde
+        este hilo. Devuelve {"users", "requests", "errors"} de lo que hubo que pedir.
+        """
+        user_ids = list(dict.fromkeys(int(u) for u in user_ids))
+        state = self._state(user_ids)
+        now = time.time()
+        pending = [
+            user_id for user_id in user_ids
+            if user_id not in state or now - state[user_id][0] >= max_age
+        ]
+
+        summary = {"users": len(pending), "requests": 0, "errors": 0}
+        if not pending:
+            return summary
+        with thread_pool(min(FANOUT_WORKERS, len(pending)), name="api42-points") as pool:
+            futures = {
+                pool.submit(_fetch_since, user_id, (state.get(user_id) or (None, None))[1], headers): user_id
+                for user_id in pending
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                user_id = futures[future]
+                records, requests, ok = future.result()
+                summary["requests"] += requests
+                if ok:
+                    newest = (state.get(user_id) or (None, None))[1]
+                    if records:
+                        newest = max(r.get("created_at") or "" for r in records) or newest
+                    self._append(user_id, records, newest)
+                else:
+                    summary["errors"] += 1
+                if progress:
+                    progress(done, len(pending))
+        return summary
+
+    def histories(self, user_ids):
+        """
+        {user_id: DataFrame del historial, más reciente primero, con
+        created_at_dt (UTC sin zona)}; solo de usuarios con movimientos.
+        """
+        user_ids = list(dict.fromkeys(int(u) for u in user_ids))
+        frames = []
+        for start in range(0, len(user_ids), _SQL_CHUNK):
+            chunk = user_ids[start:start + _SQL_CHUNK]
+            frames.append(pd.read_sql_query(
+                f"SELECT {', '.join(_COLUMNS)} FROM historics WHERE user_id IN ({','.join('?' * len(chunk))}) "
+                "ORDER BY user_id, created_at DESC, id DESC",
+                self._conn(), params=chunk,
+            ))
+        if not frames:
+            return {}
+        df = pd.concat(frames, ignore_index=True)
+        df["created_at_dt"] = pd.to_datetime(df["created_at"], utc=True, errors="coerce").dt.tz_localize(None)
+        return {int(user_id): group.reset_index(drop=True) for user_id, group in df.groupby("user_id", sort=False)}
+
+def _fetch_since(user_id, newest, headers):
+    """Movimientos de un usuario posteriores a `newest` (todos si None), en
+    orden de created_at. Devuelve (registros, requests, sin errores)"""
+    url = f"/v2/users/{user_id}/correction_point_historics?page[size]=100&sort=created_at"
+    if newest:
+        # range es inclusivo: el último guardado vuelve y se sobrescribe igual
+        url += f"&range[created_at]={newest},{_FAR_FUTURE}"
+    records, page = [], 1
+    while True:
+        try:
+            response = client.get(f"{url}&page[number]={page}", headers=headers)
+        except requests.RequestException:
+            return records, page, False
+        if response.status_code != 200:
+            return records, page, False
+        data = response.json()
+        records.extend(data)
+        if len(data) < 100:
+            return records, page, True
+        page += 1
+
+_ledger = None
+_ledger_lock = threading.Lock()
+
+def get_point_ledger():
+    """Historial de correction points local único del proceso"""
+    global _ledger
+    if _ledger is None:
+        with _ledger_lock:
+            if _ledger is None:
+                _ledger = PointLedger()
+    return _ledger
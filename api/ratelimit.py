@@ -0,0 +1,182 @@
+# api/ratelimit.py
+
+import math
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from config.settings import (
+    RATE_LIMIT_BACKGROUND_RESERVE, RATE_LIMIT_DB, RATE_LIMIT_HOURLY_RESERVE, RATE_LIMIT_PER_SECOND,
+)
+
+# Prioridad del hilo actual: los hilos de fondo solo usan huecos que nadie quiere
+_priority = threading.local()
+
+def is_background():
+    return getattr(_priority, "background", False)
+
+def set_background(flag):
+    _priority.background = flag
+
+@contextmanager
+def background_priority():
+    """Las peticiones de este hilo (y de los pools que abra) van a baja prioridad"""
+    previous = is_background()
+    set_background(True)
+    try:
+        yield
+    finally:
+        set_background(previous)
+
+def _header_int(headers, name):
+    try:
+        return int(headers[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+class RateLimiter:
+    """
+    Limitador global compartido por todas las sesiones y procesos de la app.
+
+    El estado vive en una única fila de SQLite y cada acquire() reserva, dentro
+    de una transacción BEGIN IMMEDIATE, el siguiente hueco libre de una cola
+    común. Los huecos se separan lo justo para no pasar ni del límite por
+    segundo ni del presupuesto horario que queda (X-Secondly-/X-Hourly-
+    RateLimit-*), así las peticiones se espacian antes de llegar al 429 y las
+    sesiones concurrentes se reparten la cuota por orden de llegada en lugar de
+    dormir todas a la vez tras un 429.
+    """
+
+    def __init__(self, path=RATE_LIMIT_DB, per_second=RATE_LIMIT_PER_SECOND):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS rate_limit (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                next_slot REAL NOT NULL,
+                per_second REAL NOT NULL,
+                hourly_remaining INTEGER,
+                hourly_reset REAL
+            )
+        """)
+        conn.execute("INSERT OR IGNORE INTO rate_limit VALUES (1, 0, ?, NULL, NULL)", (per_second,))
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self, fn):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            state = conn.execute(
+                "SELECT next_slot, per_second, hourly_remaining, hourly_reset FROM rate_limit WHERE id = 1"
+            ).fetchone()
+            result, updates = fn(time.time(), *state)
+            conn.execute(
+                "UPDATE rate_limit SET next_slot = ?, per_second = ?, hourly_remaining = ?, hourly_reset = ? WHERE id = 1",
+                updates,
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+    @staticmethod
+    def interval(now, per_second, hourly_remaining, hourly_reset):
+        """Separación entre peticiones: la del límite por segundo mientras sobre
+        cuota horaria; cuando solo queda la reserva, se reparte hasta el reset"""
+        spacing = 1.0 / per_second
+        if (hourly_remaining is not None and hourly_remaining <= RATE_LIMIT_HOURLY_RESERVE
+                and hourly_reset and hourly_reset > now):
+            spacing = max(spacing, (hourly_reset - now) / max(hourly_remaining, 1))
+        return spacing
+
+    def acquire(self):
+        """Reserva el siguiente hueco de la cola global y espera hasta él.
+        Devuelve los segundos esperados. En un hilo de baja prioridad
+        (background_priority) solo se reserva con la cola vacía y con más de
+        RATE_LIMIT_BACKGROUND_RESERVE peticiones horarias por delante; si no,
+        se espera y se vuelve a mirar, así nunca retrasa a un usuario más de
+        un hueco."""
+        def reserve(now, next_slot, per_second, hourly_remaining, hourly_reset):
+            slot = max(now, next_slot)
+            spacing = self.interval(now, per_second, hourly_remaining, hourly_reset)
+            if hourly_remaining is not None:
+                hourly_remaining = max(hourly_remaining - 1, 0)
+            return slot - now, (slot + spacing, per_second, hourly_remaining, hourly_reset)
+
+        def reserve_idle(now, next_slot, per_second, hourly_remaining, hourly_reset):
+            state = (next_slot, per_second, hourly_remaining, hourly_reset)
+            if (hourly_remaining is not None and hourly_remaining <= RATE_LIMIT_BACKGROUND_RESERVE
+                    and hourly_reset and hourly_reset > now):
+                return -(hourly_reset - now), state
+            if next_slot > now:
+                return -(next_slot - now + 1.0 / per_second), state
+            return reserve(now, next_slot, per_second, hourly_remaining, hourly_reset)
+
+        if not is_background():
+            wait = self._transaction(reserve)
+            if wait > 0:
+                time.sleep(wait)
+            return wait
+
+        waited = 0.0
+        while True:
+            # Negativo: la cola está ocupada o sin cuota, reintentar pasado ese tiempo
+            wait = self._transaction(reserve_idle)
+            if wait >= 0:
+                break
+            time.sleep(-wait)
+            waited -= wait
+        if wait > 0:
+            time.sleep(wait)
+        return waited + wait
+
+    def observe(self, headers):
+        """Ajusta el ritmo con las cabeceras de rate limit de una respuesta"""
+        per_second = _header_int(headers, "X-Secondly-RateLimit-Limit")
+        second_remaining = _header_int(headers, "X-Secondly-RateLimit-Remaining")
+        hourly_remaining = _header_int(headers, "X-Hourly-RateLimit-Remaining")
+        if per_second is None and second_remaining is None and hourly_remaining is None:
+            return
+
+        def update(now, next_slot, current_per_second, current_hourly, hourly_reset):
+            if per_second:
+                current_per_second = per_second
+            if second_remaining == 0:
+                # Ventana del segundo agotada: nadie sale antes del siguiente segundo
+                next_slot = max(next_slot, math.floor(now) + 1)
+            if hourly_remaining is not None:
+                current_hourly = hourly_remaining
+                # La cuota horaria de la API se renueva al empezar cada hora
+                hourly_reset = math.floor(now / 3600) * 3600 + 3600
+            return None, (next_slot, current_per_second, current_hourly, hourly_reset)
+
+        self._transaction(update)
+
+    def penalize(self, retry_after):
+        """Tras un 429 nadie vuelve a salir hasta pasado Retry-After"""
+        def update(now, next_slot, per_second, hourly_remaining, hourly_reset):
+            return None, (max(next_slot, now + retry_after), per_second, hourly_remaining, hourly_reset)
+
+        self._transaction(update)
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+def get_limiter():
+    """Limitador único del proceso (el estado real se comparte vía SQLite)"""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = RateLimiter()
+    return _limiter
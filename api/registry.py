@@ -0,0 +1,139 @@
+# api/registry.py
+
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+from config.settings import DATASET_REGISTRY_IDLE_TTL, DATASET_REGISTRY_MAX_BYTES
+
+def estimate_size(dataset, sample=100):
+    """Bytes aproximados de los registros de un dataset (muestreando `sample`)"""
+    records = dataset.records
+    if not records:
+        return 0
+    step = max(len(records) // sample, 1)
+    picked = records[::step][:sample]
+    per_record = sum(sys.getsizeof(r) + sum(sys.getsizeof(v) for v in r) for r in picked) / len(picked)
+    return int(per_record * len(records) + sys.getsizeof(records))
+
+class DatasetHandle:
+    """Referencia ligera de una sesión a una clave del registro. Mientras vive,
+    la entrada cuenta como en uso; al liberarse la sesión se descuenta sola"""
+
+    def __init__(self, registry, key):
+        self.key = key
+        self._registry = registry
+        registry._acquire(key)
+        weakref.finalize(self, registry._release, key)
+
+    def get(self):
+        return self._registry.get(self.key)
+
+class DatasetRegistry:
+    """
+    Registro de datasets escaneados compartido por todas las sesiones del proceso.
+
+    Cada (campus, cursus, tipo de escaneo) existe una sola vez en memoria; las
+    sesiones guardan un DatasetHandle y leen el mismo objeto. Los datasets
+    publicados no se modifican: quien los actualiza trabaja sobre un clone() y
+    publica el resultado con put(), así nadie ve uno a medias. scan_lock(key)
+    serializa los escaneos de una clave: si veinte sesiones piden lo mismo a
+    la vez, una escanea y el resto se encuentra el resultado al entrar.
+
+    Memoria acotada a `max_bytes`: se desalojan primero, por LRU, las
+    entradas sin handles vivos y, si no basta, las menos usadas aunque tengan
+    handles (esas sesiones volverán a escanear). Una entrada sin handles que
+    lleva `idle_ttl` segundos sin leerse se desaloja también.
+    """
+
+    def __init__(self, max_bytes=DATASET_REGISTRY_MAX_BYTES, idle_ttl=DATASET_REGISTRY_IDLE_TTL):
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        # key -> [dataset, bytes, último uso]; orden LRU (el más reciente al final)
+        self._entries = OrderedDict()
+        self._refs = {}
+        self._scan_locks = {}
+        self._lock = threading.Lock()
+
+    def handle(self, key):
+        return DatasetHandle(self, key)
+
+    def _acquire(self, key):
+        with self._lock:
+            self._refs[key] = self._refs.get(key, 0) + 1
+
+    def _release(self, key):
+        with self._lock:
+            self._refs[key] = self._refs.get(key, 1) - 1
+            if self._refs[key] <= 0:
+                del self._refs[key]
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            entry[2] = time.time()
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[0]
+
+    def put(self, key, dataset):
+        """Publica (o reemplaza) el dataset de `key`"""
+        size = estimate_size(dataset)
+        with self._lock:
+            self._entries[key] = [dataset, size, time.time()]
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def keys(self):
+        """Claves publicadas ahora mismo (copia: no cuenta como uso ni bloquea)"""
+        with self._lock:
+            return list(self._entries)
+
+    def scan_lock(self, key):
+        with self._lock:
+            return self._scan_locks.setdefault(key, threading.Lock())
+
+    def _evict(self):
+        """Debe llamarse con el lock"""
+        now = time.time()
+        for key, (_, _, used) in list(self._entries.items()):
+            if not self._refs.get(key) and now - used > self.idle_ttl:
+                del self._entries[key]
+                self.stats["evictions"] += 1
+        total = sum(entry[1] for entry in self._entries.values())
+        for pinned in (False, True):
+            for key in list(self._entries):
+                if total <= self.max_bytes:
+                    return
+                if bool(self._refs.get(key)) != pinned:
+                    continue
+                total -= self._entries.pop(key)[1]
+                self.stats["evictions"] += 1
+
+    def summary(self):
+        """Entradas, bytes y sesiones que las usan, para debug"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": sum(entry[1] for entry in self._entries.values()),
+                "handles": sum(self._refs.values()),
+                **self.stats,
+            }
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_registry():
+    """Registro de datasets único del proceso"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = DatasetRegistry()
+    return _registry
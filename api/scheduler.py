@@ -0,0 +1,95 @@
+# api/scheduler.py
+
+import threading
+import time
+
+from api.auth import get_auth_headers
+from api.campus import warm_campus
+from api.cursus_users import warm_cursus_users
+from api.ratelimit import background_priority
+from api.users import warm_locations
+from config.settings import WARM_INTERVALS, WARM_MAX_PAGES, WARM_TARGETS
+
+# Espera antes de reintentar si aún no hay token (ninguna sesión ha configurado credenciales)
+AUTH_RETRY_SECONDS = 5
+
+def _warm_cursus(campus_id, cursus_id, max_pages):
+    dataset = warm_cursus_users(campus_id, cursus_id, max_pages)
+    if dataset is None:
+        raise RuntimeError("error de la API o escaneo de una sesión en curso")
+    return len(dataset.records)
+
+class WarmScheduler:
+    """
+    Precalentado en segundo plano, un hilo por proceso de la app.
+
+    Mantiene frescos, cada uno a su intervalo (WARM_INTERVALS), el listado de
+    campus, las locations activas de los campus de WARM_TARGETS y los
+    datasets de cursus_users de cada (campus, cursus). Todo va a baja
+    prioridad en el limitador global: solo usa huecos que ninguna sesión
+    quiere y se para antes de comerse la reserva horaria. Las páginas no
+    cambian: leen de la caché HTTP y del registro de datasets como siempre,
+    solo que ya lo encuentran fresco.
+    """
+
+    def __init__(self, targets=WARM_TARGETS, intervals=WARM_INTERVALS, max_pages=WARM_MAX_PAGES):
+        self.jobs = {"campus": (intervals["campus"], warm_campus)}
+        for campus_id in dict.fromkeys(campus_id for campus_id, _ in targets):
+            self.jobs[f"locations {campus_id}"] = (
+                intervals["locations"], lambda campus_id=campus_id: warm_locations(campus_id),
+            )
+        for campus_id, cursus_id in targets:
+            self.jobs[f"cursus_users {campus_id}/{cursus_id}"] = (
+                intervals["cursus_users"],
+                lambda campus_id=campus_id, cursus_id=cursus_id: _warm_cursus(campus_id, cursus_id, max_pages),
+            )
+        # Por tarea: {"at", "seconds", "result", "error"} de la última ejecución
+        self.status = {}
+        self._next_run = dict.fromkeys(self.jobs, 0.0)
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="api42-warm", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        with background_priority():
+            while not self._stop.is_set():
+                # La más atrasada primero: un escaneo largo no deja sin turno a las locations
+                name = min(self._next_run, key=self._next_run.get)
+                delay = self._next_run[name] - time.time()
+                if delay > 0:
+                    self._stop.wait(delay)
+                    continue
+                if get_auth_headers() is None:
+                    self._stop.wait(AUTH_RETRY_SECONDS)
+                    continue
+                interval, job = self.jobs[name]
+                started = time.time()
+                try:
+                    result, error = job(), None
+                except Exception as e:  # una tarea que falla no para al resto
+                    result, error = None, str(e)
+                self.status[name] = {
+                    "at": started, "seconds": time.time() - started, "result": result, "error": error,
+                }
+                self._next_run[name] = started + interval
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def start_scheduler():
+    """Arranca (una sola vez por proceso) el precalentado de fondo y lo devuelve"""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = WarmScheduler()
+    _scheduler.start()
+    return _scheduler
@@ -0,0 +1,136 @@
+# api/snapshots.py
+
+import json
+import os
+import shutil
+import threading
+from datetime import datetime, timedelta
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow es opcional (llega con streamlit): sin él no se guardan snapshots
+    pa = pq = None
+
+from config.settings import SNAPSHOT_COMPRESSION, SNAPSHOT_DIR, SNAPSHOT_RETENTION_DAYS
+
+# Tipo Arrow de cada campo de CursusUser (las fechas se quedan en el texto ISO
+# de la API, como en memoria; el resto es string)
+_TYPES = {
+    "id": "int64", "user_id": "int64", "active": "bool_", "correction_point": "int64", "wallet": "int64",
+    "level": "float64",
+}
+# Metadatos del escaneo guardados en el esquema del fichero
+_META_KEY = b"api42"
+
+_write_lock = threading.Lock()
+
+def available():
+    return pq is not None
+
+def _partition(campus_id, cursus_id):
+    campus = "all" if campus_id is None else campus_id
+    return os.path.join(SNAPSHOT_DIR, f"campus={campus}", f"cursus={cursus_id}")
+
+def _schema(fields, meta):
+    columns = [pa.field(name, getattr(pa, _TYPES.get(name, "string"))()) for name in fields]
+    return pa.schema(columns, metadata={_META_KEY: json.dumps(meta).encode()})
+
+def write_snapshot(dataset):
+    """
+    Guarda un escaneo completo (sin filtros) como Parquet columnar comprimido en
+    SNAPSHOT_DIR/campus=…/cursus=…/date=AAAA-MM-DD/HHMMSS.parquet. Los metadatos
+    del escaneo (páginas, completo, X-Total, hora) van en el esquema. Devuelve
+    la ruta, o None si no hay pyarrow, el dataset está filtrado o falla el disco.
+    """
+    if pq is None or dataset.filters or not dataset.records:
+        return None
+    fields = dataset.records[0]._fields
+    meta = {
+        "campus_id": dataset.campus_id, "cursus_id": dataset.cursus_id,
+        "pages": dataset.pages, "total_pages": dataset.total_pages, "total_records": dataset.total_records,
+        "complete": dataset.complete, "scanned_at": dataset.scanned_at.isoformat(),
+        "fetched_at": dataset._fetched_at, "full_at": dataset._full_at,
+    }
+    schema = _schema(fields, meta)
+    # Columnar: una lista por campo en lugar de 100k tuplas
+    columns = zip(*dataset.records)
+    table = pa.Table.from_arrays([pa.array(column, type=f.type) for column, f in zip(columns, schema)], schema=schema)
+
+    folder = os.path.join(_partition(dataset.campus_id, dataset.cursus_id), f"date={dataset.scanned_at:%Y-%m-%d}")
+    path = os.path.join(folder, f"{dataset.scanned_at:%H%M%S}.parquet")
+    try:
+        os.makedirs(folder, exist_ok=True)
+        # Se escribe aparte y se renombra: quien lea nunca ve un fichero a medias
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        pq.write_table(table, tmp, compression=SNAPSHOT_COMPRESSION)
+        os.replace(tmp, path)
+        with _write_lock:
+            prune_snapshots()
+    except (OSError, pa.ArrowException):
+        return None
+    return path
+
+def list_snapshots(campus_id, cursus_id):
+    """Rutas de los snapshots de (campus, cursus), del más antiguo al más reciente"""
+    base = _partition(campus_id, cursus_id)
+    if not os.path.isdir(base):
+        return []
+    paths = []
+    for day in sorted(os.listdir(base)):
+        folder = os.path.join(base, day)
+        if day.startswith("date=") and os.path.isdir(folder):
+            paths += [os.path.join(folder, name) for name in sorted(os.listdir(folder)) if name.endswith(".parquet")]
+    return paths
+
+def latest_snapshot(campus_id, cursus_id):
+    """Ruta del snapshot más reciente de (campus, cursus), o None"""
+    paths = list_snapshots(campus_id, cursus_id)
+    return paths[-1] if paths else None
+
+def snapshot_info(path):
+    """Metadatos del escaneo guardados con el snapshot (solo lee el pie del fichero)"""
+    return json.loads(pq.read_schema(path).metadata[_META_KEY])
+
+def _arrow_filters(filters):
+    """api.filters.Filter -> filtros de pyarrow (una conjunción), o None sin filtros"""
+    conditions = []
+    for f in filters:
+        if f.op == "eq":
+            conditions.append((f.field, "==", f.value))
+        elif f.op == "in":
+            conditions.append((f.field, "in", list(f.value)))
+        elif f.op == "range":
+            conditions += [(f.field, ">=", f.value[0]), (f.field, "<=", f.value[1])]
+        elif f.op == "present":
+            # Un nulo no pasa ninguna comparación
+            conditions.append((f.field, "!=", "" if _TYPES.get(f.field, "string") == "string" else 0))
+        else:
+            raise ValueError(f"Operador de filtro desconocido: {f.op}")
+    return conditions or None
+
+def read_snapshot(path, columns=None, filters=()):
+    """
+    Tabla Arrow de un snapshot, mapeada en memoria y con solo las `columns`
+    pedidas (None = todas): las demás columnas ni se leen ni se descomprimen.
+    `filters` (api.filters.Filter) se aplican al leer, sin pasar por Python.
+    `.to_pandas()` para un DataFrame.
+    """
+    return pq.read_table(path, columns=list(columns) if columns else None, filters=_arrow_filters(filters),
+                         memory_map=True)
+
+def filter_table(table, filters):
+    """Aplica `filters` (api.filters.Filter) a una tabla ya leída, como read_snapshot"""
+    conditions = _arrow_filters(filters)
+    return table.filter(pq.filters_to_expression(conditions)) if conditions else table
+
+def prune_snapshots(retention_days=SNAPSHOT_RETENTION_DAYS):
+    """Borra las carpetas de día de más de `retention_days` días"""
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return
+    oldest = f"date={(datetime.now() - timedelta(days=retention_days)):%Y-%m-%d}"
+    for root, dirs, _ in os.walk(SNAPSHOT_DIR):
+        for day in [d for d in dirs if d.startswith("date=")]:
+            if day < oldest:
+                shutil.rmtree(os.path.join(root, day), ignore_errors=True)
+        dirs[:] = [d for d in dirs if not d.startswith("date=")]
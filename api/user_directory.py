@@ -0,0 +1,123 @@
+# api/user_directory.py
+
+import sqlite3
+import threading
+import time
+
+from api import client
+from api.decoding import dumps, loads
+from config.settings import HTTP_CACHE_TTLS, USER_DIRECTORY_DB, USER_LOOKUP_BATCH
+
+# Variables por consulta que admite SQLite sin tocar su configuración
+_SQL_CHUNK = 500
+
+class UserDirectory:
+    """
+    Mapa persistente (SQLite) login -> id -> perfil de /v2/users.
+
+    El par login / id no caduca; el perfil (wallet, correction_point…) se da
+    por fresco durante el `max_age` que pida cada consulta. Se llena a lotes
+    (ver resolve_logins / resolve_ids): un listado /v2/users filtrado por
+    hasta USER_LOOKUP_BATCH logins o ids en lugar de una request por usuario.
+    El perfil es el del listado: no trae cursus_users ni campus.
+    """
+
+    def __init__(self, path=USER_DIRECTORY_DB):
+        self.path = path
+        self._local = threading.local()
+        self._conn().execute("""
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY,
+                login TEXT NOT NULL UNIQUE,
+                profile BLOB NOT NULL,
+                fetched_at REAL NOT NULL
+            )
+        """)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def lookup(self, column, values):
+        """{valor: (perfil, fetched_at)} de los `values` de `column` ("login" o "id") que ya están"""
+        found = {}
+        values = list(values)
+        for start in range(0, len(values), _SQL_CHUNK):
+            chunk = values[start:start + _SQL_CHUNK]
+            rows = self._conn().execute(
+                f"SELECT id, login, profile, fetched_at FROM users WHERE {column} IN ({','.join('?' * len(chunk))})",
+                chunk,
+            )
+            for user_id, login, profile, fetched_at in rows:
+                found[user_id if column == "id" else login] = (loads(profile), fetched_at)
+        return found
+
+    def store(self, profiles):
+        """Guarda perfiles recién descargados (un login reasignado reemplaza al anterior)"""
+        now = time.time()
+        self._conn().executemany(
+            "INSERT OR REPLACE INTO users VALUES (?, ?, ?, ?)",
+            [(p["id"], p["login"].lower(), dumps(p), now) for p in profiles if p.get("id") and p.get("login")],
+        )
+
+_directory = None
+_directory_lock = threading.Lock()
+
+def get_user_directory():
+    """Mapa de usuarios único del proceso"""
+    global _directory
+    if _directory is None:
+        with _directory_lock:
+            if _directory is None:
+                _directory = UserDirectory()
+    return _directory
+
+def _fetch(column, values, headers):
+    """Perfiles de /v2/users?filter[column]=v1,v2,… a lotes de USER_LOOKUP_BATCH, en paralelo"""
+    values = sorted(set(values), key=str)
+    paths = [
+        f"/v2/users?filter[{column}]={','.join(map(str, values[start:start + USER_LOOKUP_BATCH]))}"
+        f"&page[size]={USER_LOOKUP_BATCH}"
+        for start in range(0, len(values), USER_LOOKUP_BATCH)
+    ]
+    profiles = []
+    for batch in client.get_json_many(paths, headers=headers):
+        profiles.extend(batch or [])
+    return profiles
+
+def _resolve(column, values, headers, max_age):
+    directory = get_user_directory()
+    known = directory.lookup(column, values)
+    now = time.time()
+    result = {
+        v: known[v][0] for v in values
+        if v in known and (max_age is None or now - known[v][1] < max_age)
+    }
+    missing = [v for v in values if v not in result]
+    if missing:
+        fetched = _fetch(column, missing, headers)
+        directory.store(fetched)
+        for profile in fetched:
+            key = profile["login"].lower() if column == "login" else profile["id"]
+            result[key] = profile
+    # Si el lote falló, un perfil caducado es mejor que ninguno
+    return {v: result.get(v) or known.get(v, (None,))[0] for v in values}
+
+def resolve_logins(logins, headers=None, max_age=HTTP_CACHE_TTLS["user"]):
+    """
+    {login en minúsculas: perfil de /v2/users, o None si no existe} para
+    todos los `logins`, con una request por cada USER_LOOKUP_BATCH que no
+    estén ya en el mapa (o cuyo perfil tenga más de `max_age` segundos;
+    None = vale cualquiera, p. ej. si solo hace falta el id).
+    """
+    logins = list(dict.fromkeys(str(login).strip().lower() for login in logins if str(login).strip()))
+    return _resolve("login", logins, headers, max_age)
+
+def resolve_ids(ids, headers=None, max_age=HTTP_CACHE_TTLS["user"]):
+    """Como resolve_logins, por id: {id: perfil o None}"""
+    ids = list(dict.fromkeys(int(user_id) for user_id in ids))
+    return _resolve("id", ids, headers, max_age)
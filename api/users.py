@@ -1,22 +1,19 @@
 # api/users.py
 
 import streamlit as st
-import requests
+import pandas as pd
 import time
+from api import client
+from api.campus import get_campus
+from api.decoding import CURSUS_LEVEL_FIELDS, projection
+from api.pagination import iter_pages, PageError
+from api.user_directory import resolve_logins
+from api.workers import thread_pool
 from datetime import datetime, timedelta, timezone
-from config.settings import API_BASE_URL, DEFAULT_RETRY_AFTER, DEFAULT_PAGE_SIZE, DETAIL_LIMIT
-
-def get_user_details(user_id, headers):
-    """Obtener detalles completos de un usuario incluyendo cursus"""
-    try:
-        url = f"{API_BASE_URL}/v2/users/{user_id}?filter[cursus]=on"
-        response = requests.get(url, headers=headers, timeout=10)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            return None
-    except Exception as e:
-        return None
+from config.settings import (
+    API_BASE_URL, DEFAULT_RETRY_AFTER, DEFAULT_PAGE_SIZE, FANOUT_WORKERS, HTTP_CACHE_TTLS, MAIN_CURSUS_ID,
+    USER_LOOKUP_BATCH,
+)
 
 def handle_rate_limit(response, status_text, debug_mode=False):
     """Manejar rate limiting de la API"""
@@ -82,7 +79,7 @@ def get_users_by_activity(campus_id, headers, days_back, max_users, status_text,
                 if debug_mode:
                     st.code(f"URL: {url}")
                 
-                response = requests.get(url, headers=headers, timeout=20)
+                response = client.get(url, headers=headers)
                 
                 # Manejar rate limiting
                 if handle_rate_limit(response, status_text, debug_mode):
@@ -173,6 +170,48 @@ def get_users_by_activity(campus_id, headers, days_back, max_users, status_text,
     
     return users[:max_users]
 
+def locations_url(campus_id, page):
+    """Página de locations activas de un campus (misma URL = misma entrada de caché)"""
+    return f"{API_BASE_URL}/v2/campus/{campus_id}/locations?filter[active]=true&page[size]={DEFAULT_PAGE_SIZE}&page[number]={page}"
+
+def fetch_cursus_users(user_ids, headers=None):
+    """
+    cursus_users de todos los `user_ids` con /v2/cursus_users?filter[user_id]=…,
+    a lotes de USER_LOOKUP_BATCH ids (con sus páginas si un lote no cabe en
+    una) y los lotes en paralelo. Un lote que falla se queda sin niveles.
+    """
+    ids = sorted(set(user_ids))
+    batches = [ids[start:start + USER_LOOKUP_BATCH] for start in range(0, len(ids), USER_LOOKUP_BATCH)]
+    decode = projection(CURSUS_LEVEL_FIELDS)
+
+    def fetch_batch(batch):
+        url = f"{API_BASE_URL}/v2/cursus_users?filter[user_id]={','.join(map(str, batch))}"
+        records = []
+        try:
+            for page in iter_pages(url, lambda u: client.get(u, headers=headers), max_pages=len(batch), decode=decode):
+                records.extend(page.data)
+        except PageError:
+            pass
+        return records
+
+    if not batches:
+        return []
+    with thread_pool(min(FANOUT_WORKERS, len(batches))) as pool:
+        return [cu for records in pool.map(fetch_batch, batches) for cu in records]
+
+def main_levels(cursus_users, main_cursus_id=MAIN_CURSUS_ID):
+    """Nivel de cada usuario (Series por user_id): el del cursus principal si
+    lo cursa, si no el más alto. En un DataFrame, sin bucle por usuario"""
+    if not cursus_users:
+        return pd.Series(dtype=float)
+    df = pd.json_normalize(cursus_users)
+    df["level"] = pd.to_numeric(df["level"], errors="coerce").fillna(0.0)
+    df["main"] = df["cursus_id"].eq(main_cursus_id)
+    if "cursus.slug" in df:
+        df["main"] |= df["cursus.slug"].str.contains("42cursus", na=False)
+    best = df.sort_values(["main", "level"], ascending=False).drop_duplicates("user.id")
+    return best.set_index("user.id")["level"].round(2)
+
 def get_users_by_locations(campus_id, headers, status_text, debug_mode=False):
     """Obtener usuarios actualmente en el campus usando el endpoint de locations"""
     users = []
@@ -185,12 +224,12 @@ def get_users_by_locations(campus_id, headers, status_text, debug_mode=False):
         all_location_logins = {}
         
         while True:
-            url = f"{API_BASE_URL}/v2/campus/{campus_id}/locations?filter[active]=true&page[size]=100&page[number]={page}"
+            url = locations_url(campus_id, page)
             
             if debug_mode:
                 st.write(f"🔍 Locations URL: {url}")
             
-            response = requests.get(url, headers=headers, timeout=20)
+            response = client.get(url, headers=headers, cache_ttl=HTTP_CACHE_TTLS["locations"])
             
             if response.status_code != 200:
                 if debug_mode:
@@ -222,21 +261,34 @@ def get_users_by_locations(campus_id, headers, status_text, debug_mode=False):
         if debug_mode:
             st.success(f"✅ Total usuarios con location activa: {len(all_location_logins)}")
         
-        # Ahora obtener los datos completos de cada usuario
-        for login, loc_data in all_location_logins.items():
-            try:
-                url = f"{API_BASE_URL}/v2/users/{login}"
-                resp = requests.get(url, headers=headers, timeout=10)
-                if resp.status_code == 200:
-                    user_data = resp.json()
-                    user_data["location"] = loc_data["location"]
-                    user_data["location_active"] = True
-                    user_data["last_location"] = loc_data["last_location"]
-                    users.append(user_data)
-            except Exception as e:
+        # Perfiles a lotes de 100 (api.user_directory) y una sola etapa de
+        # enriquecimiento con los cursus_users de todos, también a lotes
+        logins = list(all_location_logins)
+        profiles = resolve_logins(logins, headers)
+        status_text.text(f"📚 Obteniendo niveles de {len(logins)} usuarios...")
+        ids = [p["id"] for p in profiles.values() if p]
+        cursus_users = fetch_cursus_users(ids, headers)
+        levels = main_levels(cursus_users)
+        cursus_by_user = {}
+        for cu in cursus_users:
+            cursus_by_user.setdefault(cu["user"]["id"], []).append(cu)
+        campus = next((c for c in get_campus(headers) if c.get("id") == campus_id), {"id": campus_id, "name": "N/A"})
+        
+        for login in logins:
+            profile = profiles.get(login.lower())
+            if not profile:
                 if debug_mode:
-                    st.error(f"❌ Error obteniendo usuario {login}: {e}")
+                    st.error(f"❌ Error obteniendo usuario {login}")
                 continue
+            user_data = dict(profile)
+            user_data["level"] = float(levels.get(profile["id"], 0.0))
+            user_data["cursus_users"] = cursus_by_user.get(profile["id"], [])
+            user_data["campus"] = [campus]
+            loc_data = all_location_logins[login]
+            user_data["location"] = loc_data["location"]
+            user_data["location_active"] = True
+            user_data["last_location"] = loc_data["last_location"]
+            users.append(user_data)
         
     except Exception as e:
         if debug_mode:
@@ -244,6 +296,28 @@ def get_users_by_locations(campus_id, headers, status_text, debug_mode=False):
     
     return users
 
+def warm_locations(campus_id):
+    """
+    Refresco de fondo (api.scheduler): vuelve a pedir las locations activas
+    del campus (revalidando la caché HTTP) y pone al día sus perfiles en el
+    mapa de usuarios (a lotes), así la página principal abre sin esperar.
+    Sin UI ni sesión.
+    Devuelve el número de usuarios con location activa.
+    """
+    logins = []
+    page = 1
+    while True:
+        response = client.get(locations_url(campus_id, page), cache_ttl=0)
+        if response.status_code != 200:
+            break
+        data = response.json()
+        logins.extend(loc["user"]["login"] for loc in data if (loc.get("user") or {}).get("login"))
+        if len(data) < DEFAULT_PAGE_SIZE:
+            break
+        page += 1
+    resolve_logins(logins)
+    return len(logins)
+
 def get_active_users(campus_id, headers, days_back=1, max_users=200, search_method="Solo ubicaciones activas", debug_mode=False):
     """Obtener usuarios activos usando solo ubicaciones activas para máxima velocidad"""
     progress_bar = st.progress(0)
@@ -259,39 +333,12 @@ def get_active_users(campus_id, headers, days_back=1, max_users=200, search_meth
         progress_bar.progress(0.6)
         status_text.text(f"✅ Encontrados {len(location_users)} usuarios en campus")
         
-        # Limitar a max_users
-        final_users = location_users[:max_users]
-        
-        # Obtener datos completos para usuarios seleccionados (solo los primeros 50 para velocidad)
-        progress_bar.progress(0.8)
-        status_text.text("🔍 Obteniendo datos completos...")
-        
-        enhanced_users = []
-        detail_limit = min(50, len(final_users))  # Límite reducido para velocidad
-        
-        for i, user in enumerate(final_users):
-            if i < detail_limit:
-                detailed_user = get_user_details(user.get('id'), headers)
-                if detailed_user:
-                    # Preservar información de ubicación
-                    detailed_user['location_active'] = True
-                    detailed_user['last_location'] = user.get('last_location')
-                    enhanced_users.append(detailed_user)
-                else:
-                    enhanced_users.append(user)
-            else:
-                # Para el resto, usar datos básicos (más rápido)
-                user['location_active'] = True
-                enhanced_users.append(user)
-            
-            # Actualizar progreso cada 10 usuarios
-            if i % 10 == 0:
-                progress = 0.8 + (i / len(final_users)) * 0.2
-                progress_bar.progress(min(progress, 1.0))
+        # Limitar a max_users. Los niveles ya vienen de la etapa de
+        # enriquecimiento a lotes: todos los usuarios tienen el suyo
+        enhanced_users = location_users[:max_users]
         
         progress_bar.progress(1.0)
         status_text.text(f"✅ Completado: {len(enhanced_users)} usuarios activos en campus")
-        time.sleep(1)
         
         return enhanced_users
         
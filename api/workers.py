@@ -0,0 +1,25 @@
+# api/workers.py
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from api.ratelimit import is_background, set_background
+
+try:
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+except ImportError:  # fuera de Streamlit (benchmarks, scripts)
+    add_script_run_ctx = get_script_run_ctx = None
+
+def thread_pool(max_workers, name="api42"):
+    """ThreadPoolExecutor cuyos hilos heredan el contexto de Streamlit del llamador,
+    para que st.session_state / st.secrets sigan funcionando dentro de los workers,
+    y su prioridad en el limitador"""
+    ctx = get_script_run_ctx() if get_script_run_ctx else None
+    background = is_background()
+
+    def attach_ctx():
+        if ctx is not None:
+            add_script_run_ctx(threading.current_thread(), ctx)
+        set_background(background)
+
+    return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name, initializer=attach_ctx)
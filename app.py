@@ -14,6 +14,7 @@ try:
     # Imports locales
     from config.settings import MAIN_CSS, APP_CONFIG, AUTO_REFRESH_INTERVAL
     from api.users import get_active_users
+    from api.scheduler import start_scheduler
     from ui.sidebar import render_sidebar
     from ui.charts import render_charts
     from ui.user_table import render_metrics, render_user_table, render_raw_data, render_info_section, render_help_section
@@ -34,6 +35,8 @@ st.markdown('<h1 class="main-header">🚀 42 Network - Finding Your Evaluator</h
 try:
     # Renderizar sidebar y obtener configuración
     sidebar_config = render_sidebar()
+    # Precalentado de fondo (una vez por proceso) con el token que acaba de configurar el sidebar
+    start_scheduler()
     
     # Extraer valores del sidebar
     headers = sidebar_config['headers']
@@ -143,46 +146,9 @@ try:
                                 "Evaluation Points": user.get("correction_point", 0)
                             }
                             
-                            # Obtener nivel del cursus de manera más robusta
-                            user_info["Nivel"] = 0.0  # Valor por defecto
-                            
+                            # Nivel del cursus principal (get_active_users ya lo une a cada usuario)
+                            user_info["Nivel"] = round(float(user.get("level") or 0.0), 2)
                             cursus_users = user.get("cursus_users", [])
-                            if cursus_users and isinstance(cursus_users, list):
-                                max_level = 0.0
-                                found_42cursus = False
-                                
-                                # Buscar 42cursus por ID (21) o nombre
-                                for cursus in cursus_users:
-                                    if isinstance(cursus, dict):
-                                        cursus_info = cursus.get("cursus", {})
-                                        level = float(cursus.get("level", 0))
-                                        cursus_id_check = cursus.get("cursus_id")
-                                        
-                                        # Verificar si es 42cursus por ID o nombre
-                                        if cursus_id_check == 21 or \
-                                           (isinstance(cursus_info, dict) and 
-                                            ("42cursus" in str(cursus_info.get("name", "")).lower() or
-                                             "42cursus" in str(cursus_info.get("slug", "")).lower())):
-                                            user_info["Nivel"] = round(level, 2)
-                                            found_42cursus = True
-                                            break
-                                        
-                                        # Guardar el nivel más alto como backup
-                                        if level > max_level:
-                                            max_level = level
-                                
-                                # Si no encontró 42cursus, usar el nivel más alto
-                                if not found_42cursus and max_level > 0:
-                                    user_info["Nivel"] = round(max_level, 2)
-                            
-                            # Verificar si el usuario tiene level directamente (algunos casos especiales)
-                            elif user.get("level") is not None:
-                                try:
-                                    direct_level = float(user.get("level", 0))
-                                    if direct_level > 0:
-                                        user_info["Nivel"] = round(direct_level, 2)
-                                except (ValueError, TypeError):
-                                    pass
                             
                             # Obtener campus
                             campus_info = user.get("campus", [])
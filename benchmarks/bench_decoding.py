@@ -0,0 +1,126 @@
+# benchmarks/bench_decoding.py
+#
+# Memoria y CPU de decodificar un escaneo de cursus_users: resp.json() completo
+# frente a api.decoding.projection (orjson si está instalado + solo los campos
+# que usan las páginas). Usa un fixture sintético de N registros con la forma
+# real de /v2/cursus/:id/cursus_users, troceado en páginas de 100. Sin red.
+#
+#   python benchmarks/bench_decoding.py [n_records]
+
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import decoding  # noqa: E402
+from config.settings import DEFAULT_PAGE_SIZE  # noqa: E402
+
+class FakeResponse:
+    def __init__(self, content):
+        self.content = content
+
+    def json(self):
+        return json.loads(self.content)
+
+def make_record(i):
+    login = f"user{i:06d}"
+    image = f"https://cdn.intra.42.fr/users/{i:x}/{login}.jpg"
+    return {
+        "id": 500000 + i,
+        "begin_at": "2023-10-02T07:00:00.000Z",
+        "end_at": None if i % 7 else "2024-06-01T10:00:00.000Z",
+        "grade": ["Learner", "Member", None][i % 3],
+        "level": round((i % 2100) / 100, 2),
+        "skills": [{"id": s, "name": f"Skill {s}", "level": (i * s) % 13 / 2} for s in range(1, 8)],
+        "cursus_id": 21,
+        "has_coalition": True,
+        "blackholed_at": "2025-01-15T10:00:00.000Z" if i % 5 == 0 else None,
+        "created_at": "2023-10-02T07:00:00.000Z",
+        "updated_at": "2025-09-30T12:00:00.000Z",
+        "user": {
+            "id": 100000 + i,
+            "email": f"{login}@student.42.fr",
+            "login": login,
+            "first_name": "Nombre",
+            "last_name": f"Apellido {i}",
+            "usual_full_name": f"Nombre Apellido {i}",
+            "usual_first_name": None,
+            "url": f"https://api.intra.42.fr/v2/users/{login}",
+            "phone": "hidden",
+            "displayname": f"Nombre Apellido {i}",
+            "kind": "student",
+            "image": {
+                "link": image,
+                "versions": {"large": image, "medium": image, "small": image, "micro": image},
+            },
+            "staff?": False,
+            "correction_point": i % 20,
+            "pool_month": "september",
+            "pool_year": "2023",
+            "location": None,
+            "wallet": i % 500,
+            "anonymize_date": "2028-10-02T00:00:00.000+02:00",
+            "data_erasure_date": "2028-10-02T00:00:00.000+02:00",
+            "created_at": "2023-08-01T09:00:00.000Z",
+            "updated_at": "2025-09-30T12:00:00.000Z",
+            "alumnized_at": None,
+            "alumni?": False,
+            "active?": i % 11 != 0,
+        },
+        "cursus": {
+            "id": 21,
+            "created_at": "2019-07-29T08:45:17.896Z",
+            "name": "42cursus",
+            "slug": "42cursus",
+            "kind": "main",
+        },
+    }
+
+def make_pages(n_records):
+    records = [make_record(i) for i in range(n_records)]
+    return [
+        json.dumps(records[start:start + DEFAULT_PAGE_SIZE]).encode("utf-8")
+        for start in range(0, n_records, DEFAULT_PAGE_SIZE)
+    ]
+
+def decode_all(pages, decode):
+    kept = []
+    for content in pages:
+        # Copia de los bytes, como una respuesta recién descargada: así cuentan
+        # en la memoria retenida si el decodificador se queda con ellos
+        kept.extend(decode(FakeResponse(content + b" ")))
+    return kept
+
+def measure(label, pages, decode):
+    """CPU de decodificar todas las páginas quedándose con los registros (como
+    hacen los escaneos) y, en una segunda pasada con tracemalloc, la memoria
+    retenida y el pico"""
+    gc.collect()
+    cpu = time.process_time()
+    kept = decode_all(pages, decode)
+    cpu = time.process_time() - cpu
+    del kept
+    gc.collect()
+    tracemalloc.start()
+    kept = decode_all(pages, decode)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {label:<34} CPU {cpu:6.2f} s · retenido {current / 2**20:7.1f} MiB · pico {peak / 2**20:7.1f} MiB")
+    del kept
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    pages = make_pages(n)
+    size = sum(len(p) for p in pages)
+    print(f"Fixture: {n} cursus_users en {len(pages)} páginas ({size / 2**20:.1f} MiB de JSON) · decodificador: {decoding.DECODER}")
+
+    measure("resp.json() completo", pages, lambda r: r.json())
+    measure(f"{decoding.DECODER} completo", pages, decoding.decode_json)
+    measure("proyección CURSUS_USER_FIELDS", pages, decoding.projection(decoding.CURSUS_USER_FIELDS))
+
+if __name__ == "__main__":
+    main()
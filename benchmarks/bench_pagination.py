@@ -0,0 +1,135 @@
+# benchmarks/bench_pagination.py
+#
+# Escaneo completo de un listado grande: por número de página (sort=-updated_at,
+# api.pagination.iter_pages) frente a por rangos de id (sort=id + range[id],
+# api.pagination.iter_id_ranges). Servidor falso en memoria, sin red: cada
+# request tarda una latencia base más un coste proporcional al OFFSET (como
+# una base de datos que salta filas), y entre request y request se actualizan
+# registros al azar, que en el orden -updated_at saltan a la página 1. Se
+# cuentan tiempo, requests y registros duplicados / perdidos frente a lo que
+# había al empezar. Las requests salen al ritmo de RATE_LIMIT_PER_SECOND,
+# como con api.ratelimit: con el límite de la API lo que manda es cuántas
+# requests hace cada escaneo, no cuántas van a la vez. Se mide también un
+# listado corto, donde repartir en rangos no compensa.
+#
+#   python benchmarks/bench_pagination.py [n_records] [updates_por_request]
+
+import json
+import math
+import os
+import random
+import re
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.pagination import KEYSET_END, iter_id_ranges, iter_pages, keyset_url, page_url, split_ids  # noqa: E402
+from config.settings import (  # noqa: E402
+    DEFAULT_PAGE_SIZE, KEYSET_MIN_PAGES, KEYSET_RANGES_PER_WORKER, RATE_LIMIT_PER_SECOND, SCAN_WORKERS,
+)
+
+BASE_LATENCY = 0.020
+# Segundos extra por cada 1000 filas de OFFSET
+OFFSET_LATENCY = 0.004
+
+class FakeResponse:
+    def __init__(self, content, total):
+        self.status_code = 200
+        self.content = content
+        self.headers = {"X-Total": str(total), "X-Per-Page": str(DEFAULT_PAGE_SIZE)}
+
+class FakeListing:
+    """/v2/cursus/:id/cursus_users en memoria: sort, range[id], page[size] y page[number]"""
+
+    def __init__(self, n_records, updates, seed=42):
+        self.random = random.Random(seed)
+        ids = sorted(self.random.sample(range(1, n_records * 4), n_records))
+        self.rows = {i: {"id": i, "updated_at": k} for k, i in enumerate(ids)}
+        self.clock = n_records
+        self.updates = updates
+        self.requests = 0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        with self._lock:
+            # Hueco del limitador, como RateLimiter.acquire
+            now = time.perf_counter()
+            wait = max(self._next_slot - now, 0)
+            self._next_slot = now + wait + 1.0 / RATE_LIMIT_PER_SECOND
+        time.sleep(wait)
+        with self._lock:
+            self.requests += 1
+            rows = list(self.rows.values())
+            bounds = re.search(r"range\[id\]=(\d+),(\d+)", url)
+            if bounds:
+                lo, hi = int(bounds.group(1)), int(bounds.group(2))
+                rows = [r for r in rows if lo <= r["id"] <= hi]
+            if "sort=-updated_at" in url:
+                rows.sort(key=lambda r: r["updated_at"], reverse=True)
+            else:
+                rows.sort(key=lambda r: r["id"], reverse="sort=-id" in url)
+            size = int(re.search(r"page\[size\]=(\d+)", url).group(1))
+            number = re.search(r"page\[number\]=(\d+)", url)
+            offset = (int(number.group(1)) - 1) * size if number else 0
+            content = json.dumps(rows[offset:offset + size]).encode()
+            total = len(rows)
+            for _ in range(self.updates):
+                self.clock += 1
+                row = self.random.choice(list(self.rows))
+                self.rows[row] = {"id": row, "updated_at": self.clock}
+        time.sleep(BASE_LATENCY + OFFSET_LATENCY * offset / 1000)
+        return FakeResponse(content, total)
+
+def scan_offset(listing):
+    url = "https://fake/v2/cursus/21/cursus_users?sort=-updated_at"
+    records = []
+    for page in iter_pages(url, listing.get, max_pages=10**6, workers=SCAN_WORKERS):
+        records.extend(page.data)
+    return records
+
+def scan_keyset(listing):
+    """Como api.cursus_users._keyset_plan + iter_id_ranges"""
+    url = "https://fake/v2/cursus/21/cursus_users?sort=id"
+    first = listing.get(keyset_url(url, 0))
+    records = json.loads(first.content)
+    total = int(first.headers["X-Total"])
+    remaining = math.ceil(total / DEFAULT_PAGE_SIZE) - 1
+    if len(records) < DEFAULT_PAGE_SIZE:
+        return records
+    start = records[-1]["id"] + 1
+    if remaining < KEYSET_MIN_PAGES:
+        ranges = [(start, KEYSET_END)]
+    else:
+        top = json.loads(listing.get(page_url(url.replace("sort=id", "sort=-id"), 1, page_size=1)).content)[0]["id"]
+        ranges = split_ids(start, max(top, start), min(SCAN_WORKERS * KEYSET_RANGES_PER_WORKER, remaining))
+    for page in iter_id_ranges(url, ranges, listing.get, workers=SCAN_WORKERS, total=total, received=len(records)):
+        records.extend(page.data)
+    return records
+
+def measure(label, scan, n, updates):
+    listing = FakeListing(n, updates)
+    expected = set(listing.rows)
+    start = time.perf_counter()
+    records = scan(listing)
+    seconds = time.perf_counter() - start
+    ids = [r["id"] for r in records]
+    duplicated = len(ids) - len(set(ids))
+    missing = len(expected - set(ids))
+    print(f"  {label:<28} {seconds:6.2f} s · {listing.requests:4d} requests · "
+          f"{duplicated:4d} duplicados · {missing:4d} perdidos")
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    updates = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    print(f"{updates} updates por request · {SCAN_WORKERS} hilos · {RATE_LIMIT_PER_SECOND} req/s · "
+          f"latencia {BASE_LATENCY * 1000:.0f} ms + {OFFSET_LATENCY * 1000:.0f} ms/1000 filas de offset")
+    for size in (n, 300):
+        print(f"Fixture: {size} registros ({math.ceil(size / DEFAULT_PAGE_SIZE)} páginas)")
+        measure("page[number] (-updated_at)", scan_offset, size, updates)
+        measure("range[id] (keyset)", scan_keyset, size, updates)
+
+if __name__ == "__main__":
+    main()
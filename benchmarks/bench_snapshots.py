@@ -0,0 +1,65 @@
+# benchmarks/bench_snapshots.py
+#
+# Snapshot Parquet de un escaneo de cursus_users (api.snapshots): tiempo de
+# escritura y tamaño en disco frente al JSON, lectura completa a DataFrame,
+# lectura solo de level + correction_point (poda de columnas) y reconstrucción
+# del CursusDataset como tras reiniciar la app. Fixture sintético de N
+# registros, en un directorio temporal. Sin red.
+#
+#   python benchmarks/bench_snapshots.py [n_records]
+
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["API42_SNAPSHOT_DIR"] = tempfile.mkdtemp(prefix="api42_bench_snapshots_")
+
+from api import snapshots  # noqa: E402
+from api.cursus_users import CursusDataset, CursusUser, _restore  # noqa: E402
+from api.registry import get_registry  # noqa: E402
+
+def make_record(i):
+    updated_at = f"2024-{1 + i % 12:02d}-{1 + i % 28:02d}T{i % 24:02d}:00:00.000Z"
+    return CursusUser(
+        id=500000 + i, user_id=100000 + i, login=f"user{i:06d}", displayname=f"User Number {i}",
+        kind="student" if i % 9 else "external", active=bool(i % 5), correction_point=i % 17, wallet=i % 900,
+        pool_month=["july", "august", "september"][i % 3], pool_year=str(2016 + i % 9),
+        user_updated_at=updated_at, grade=["Cadet", "Learner", "Member", ""][i % 4], level=round((i % 2100) / 100, 2),
+        begin_at="2023-10-02T07:00:00.000Z", end_at=None, blackholed_at=None if i % 6 else "2025-01-01T00:00:00.000Z",
+        updated_at=updated_at,
+    )
+
+def timed(label, fn):
+    start = time.perf_counter()
+    result = fn()
+    print(f"  {label:<38} {(time.perf_counter() - start) * 1000:8.1f} ms")
+    return result
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    if not snapshots.available():
+        sys.exit("pyarrow no está instalado")
+    dataset = CursusDataset(None, 21)
+    dataset.records = sorted((make_record(i) for i in range(n)), key=lambda r: r.updated_at, reverse=True)
+    dataset.pages = dataset.total_pages = -(-n // 100)
+    dataset.total_records = n
+    dataset.complete = True
+    dataset.mark_fetched(full=True)
+
+    print(f"Fixture: {n} cursus_users · snapshots en {snapshots.SNAPSHOT_DIR}")
+    path = timed("escritura (zstd)", lambda: snapshots.write_snapshot(dataset))
+    raw = len(json.dumps([r._asdict() for r in dataset.records]))
+    print(f"  {'tamaño':<38} {os.path.getsize(path) / 2**20:8.1f} MB (JSON: {raw / 2**20:.1f} MB)")
+    df = timed("lectura completa -> DataFrame", lambda: snapshots.read_snapshot(path).to_pandas())
+    pruned = timed("level + correction_point -> DataFrame",
+                   lambda: snapshots.read_snapshot(path, ["level", "correction_point"]).to_pandas())
+    print(f"  {'columnas':<38} {len(df.columns):8d} / {len(pruned.columns)}")
+    get_registry()._entries.clear()
+    restored = timed("CursusDataset desde el snapshot", lambda: _restore((None, 21)))
+    assert restored.records == dataset.records
+
+if __name__ == "__main__":
+    main()
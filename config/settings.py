@@ -1,15 +1,107 @@
 # config/settings.py
 
+import os
+import tempfile
+
 # API Configuration
 API_BASE_URL = "https://api.intra.42.fr"
 AUTH_URL = f"{API_BASE_URL}/oauth/token"
 
+# OAuth: duración asumida si la respuesta no trae expires_in, y margen con el
+# que se renueva el token en segundo plano antes de que caduque
+TOKEN_DEFAULT_TTL = 7200
+TOKEN_REFRESH_MARGIN = 300
+
 # Default values
 DEFAULT_DAYS_BACK = 7
 DEFAULT_MAX_USERS = 200
 DEFAULT_MAX_PAGES = 20
 DEFAULT_PAGE_SIZE = 100
-DETAIL_LIMIT = 50
+# Cursus principal (42cursus): el nivel que se muestra de cada usuario
+MAIN_CURSUS_ID = 21
+
+# Cliente HTTP compartido (keep-alive)
+HTTP_POOL_SIZE = 16
+DEFAULT_TIMEOUT = 20
+# Hilos para descargar en paralelo las páginas de un escaneo
+SCAN_WORKERS = 4
+# Escaneos completos por rangos de id (keyset) en lugar de por número de página:
+# a partir de cuántas páginas del listado (X-Total) se reparte en rangos, y rangos
+# por hilo (los ids no se reparten uniformes)
+KEYSET_MIN_PAGES = 10
+KEYSET_RANGES_PER_WORKER = 2
+# Campus escaneados a la vez en los escaneos de "Todos los campus" (cada uno con sus SCAN_WORKERS)
+CAMPUS_SCAN_WORKERS = 4
+# Hilos para resolver detalles de usuarios en paralelo
+FANOUT_WORKERS = 8
+# Timeouts por endpoint: (regex sobre el path, segundos). Gana el primero que encaje.
+ENDPOINT_TIMEOUTS = [
+    (r"^/oauth/token$", 10),
+    (r"^/v2/campus$", 15),
+    (r"^/v2/users/[^/]+$", 10),
+]
+# Caché HTTP condicional (ETag / Last-Modified) persistente entre reinicios
+HTTP_CACHE_DB = os.path.join(tempfile.gettempdir(), "api42_http_cache.db")
+# Bytes de cuerpos que guarda cada nivel de esa caché: LRU en memoria y SQLite en disco
+HTTP_CACHE_MEMORY_BYTES = 64 * 2**20
+HTTP_CACHE_DISK_BYTES = 512 * 2**20
+# Segundos durante los que una respuesta cacheada se sirve sin revalidar
+HTTP_CACHE_TTLS = {
+    "campus": 3600,
+    "user": 300,
+    "locations": 60,
+}
+# Segundos durante los que un escaneo de cursus_users se reutiliza entre páginas
+CURSUS_DATASET_TTL = 900
+# Pasado ese TTL se piden solo los cambios (range[updated_at]); si no caben en
+# estas páginas se vuelve a escanear entero
+CURSUS_DELTA_MAX_PAGES = 10
+# Cada cuánto se rehace el escaneo completo para detectar bajas
+CURSUS_FULL_SYNC_INTERVAL = 6 * 3600
+
+# Registro de datasets compartido por las sesiones: memoria máxima y segundos
+# que se conserva una entrada que ninguna sesión usa
+DATASET_REGISTRY_MAX_BYTES = 512 * 2**20
+DATASET_REGISTRY_IDLE_TTL = 3600
+
+# Copia local de los datasets de cursus_users, una fila por registro (api.cursus_store)
+CURSUS_STORE_DB = os.path.join(tempfile.gettempdir(), "api42_cursus_users.db")
+
+# Snapshots Parquet de los escaneos completos (api.snapshots), por
+# campus/cursus/fecha. En Streamlit Community Cloud el temp se borra al dormir:
+# API42_SNAPSHOT_DIR debe apuntar a un disco persistente para que sobrevivan
+SNAPSHOT_DIR = os.environ.get("API42_SNAPSHOT_DIR") or os.path.join(tempfile.gettempdir(), "api42_snapshots")
+SNAPSHOT_COMPRESSION = "zstd"
+SNAPSHOT_RETENTION_DAYS = 90
+
+# Mapa persistente login -> id -> perfil (api.user_directory) y usuarios por request
+# (filter[login] / filter[id]); el máximo de page[size] de la API
+USER_DIRECTORY_DB = os.path.join(tempfile.gettempdir(), "api42_users.db")
+USER_LOOKUP_BATCH = 100
+
+# Historial local de correction_point_historics (api.point_ledger) y segundos
+# durante los que un usuario ya puesto al día no se vuelve a consultar
+POINT_LEDGER_DB = os.path.join(tempfile.gettempdir(), "api42_point_ledger.db")
+POINT_LEDGER_TTL = 3600
+
+# Páginas ya descargadas de escaneos a medias (se reanudan sin volver a pedirlas)
+SCAN_CHECKPOINT_DB = os.path.join(tempfile.gettempdir(), "api42_scan_checkpoints.db")
+# Un escaneo a medias más antiguo que esto se descarta y empieza de cero
+SCAN_CHECKPOINT_TTL = 3600
+
+# Precalentado en segundo plano: datasets que se mantienen frescos aunque nadie
+# pulse nada, (campus_id, cursus_id). Los campus de la lista también precalientan locations.
+WARM_TARGETS = [
+    (46, 21),
+]
+# Cada cuánto se refresca cada tipo de dato (segundos)
+WARM_INTERVALS = {
+    "locations": 60,
+    "cursus_users": CURSUS_DATASET_TTL,
+    "campus": 24 * 3600,
+}
+# Páginas que escanea el precalentado de cursus_users (las páginas piden menos)
+WARM_MAX_PAGES = 100
 
 # CSS Styles
 MAIN_CSS = """
@@ -231,6 +323,18 @@ APP_CONFIG = {
 
 # Rate limiting
 DEFAULT_RETRY_AFTER = 2
+# Límite por segundo de la app hasta que la API mande X-Secondly-RateLimit-Limit
+RATE_LIMIT_PER_SECOND = 2
+# Con tan pocas peticiones horarias restantes se dejan de hacer ráfagas y se
+# reparten hasta que se renueve la cuota
+RATE_LIMIT_HOURLY_RESERVE = 100
+# Las tareas de fondo (precalentado) dejan de pedir con menos de esta cuota
+# horaria restante, para no gastar la de los usuarios
+RATE_LIMIT_BACKGROUND_RESERVE = 400
+# Estado del limitador, compartido por todas las sesiones y procesos de la máquina
+RATE_LIMIT_DB = os.path.join(tempfile.gettempdir(), "api42_ratelimit.db")
+# Reintentos del cliente ante un 429 antes de devolverlo al llamador
+RATE_LIMIT_MAX_RETRIES = 5
 AUTO_REFRESH_INTERVAL = 60
 
 # External app URLs
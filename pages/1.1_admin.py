@@ -1,8 +1,10 @@
 import streamlit as st
-import requests
-import time
 import pandas as pd
-from datetime import datetime, timezone
+from datetime import date, datetime, time, timedelta, timezone
+from api.auth import get_auth_headers
+from api.scheduler import start_scheduler
+from api.cursus_store import get_cursus_store
+from api.cursus_users import cached_cursus_users, load_cursus_users, parse_dt
 
 # ── Page config ───────────────────────────────────────────────────────────────
 st.set_page_config(page_title="42 Cursus Activo / Pendiente", page_icon="📅", layout="wide")
@@ -29,47 +31,14 @@ st.markdown('<div class="page-title">📅 Cursus 42 — Activo vs Pendiente</div
 st.markdown('<div class="page-sub">Separa por begin_at: quién ya está activo en el cursus vs quién tiene fecha de inicio futura (aún no cuenta como estudiante)</div>', unsafe_allow_html=True)
 
 # ── Auth (idéntico a tu app) ───────────────────────────────────────────────────
-def get_token():
-    try:
-        cid  = st.secrets["api42"]["client_id"]
-        csec = st.secrets["api42"]["client_secret"]
-        resp = requests.post("https://api.intra.42.fr/oauth/token", data={
-            "grant_type":    "client_credentials",
-            "client_id":     cid,
-            "client_secret": csec,
-        }, timeout=10)
-        if resp.status_code == 200:
-            return resp.json().get("access_token")
-        st.error(f"❌ Token error {resp.status_code}: {resp.text}")
-    except Exception as e:
-        st.error(f"Auth error: {e}")
-    return None
-
-def get_headers(force=False):
-    token_ts = st.session_state.get("token_ts")
-    now      = datetime.now(timezone.utc)
-    expired  = not token_ts or (now - token_ts).total_seconds() > 5400
-    if force or expired or "api_headers" not in st.session_state:
-        token = get_token()
-        if not token:
-            return None
-        st.session_state["api_headers"] = {"Authorization": f"Bearer {token}"}
-        st.session_state["token_ts"]    = now
-    return st.session_state["api_headers"]
-
-def api_get(url, headers):
-    resp = requests.get(url, headers=headers, timeout=20)
-    if resp.status_code == 401:
-        headers = get_headers(force=True)
-        if headers:
-            resp = requests.get(url, headers=headers, timeout=20)
-    return resp
-
-headers = get_headers()
+headers = get_auth_headers()
 if not headers:
     st.error("❌ No se pudo autenticar. Revisa los secrets.")
     st.stop()
 
+# Precalentado de fondo (una vez por proceso): la próxima visita ya encuentra los datos frescos
+start_scheduler()
+
 # ── Sidebar ───────────────────────────────────────────────────────────────────
 with st.sidebar:
     st.markdown("### 📅 Scan settings")
@@ -83,121 +52,81 @@ with st.sidebar:
     max_pages = st.number_input("Páginas máx (100/pág)", 1, 1000, 20)
     debug     = st.checkbox("🐛 Debug (mostrar URLs)", value=False)
 
+    # Estado a una fecha pasada, desde la historia local de escaneos (sin requests)
+    ver_a_fecha = st.checkbox("🕰️ Ver estado a una fecha pasada", value=False)
+    fecha_as_of = st.date_input("Fecha", value=date.today() - timedelta(days=1), max_value=date.today()) if ver_a_fecha else None
+
     scan_btn = st.button("🚀 Ver activo / pendiente", type="primary", use_container_width=True)
 
-# ── Scan function with progress bar ────────────────────────────────────────────
-def scan_targets(campus_id, scope, cursus_id, headers, max_pages, debug):
+# ── Vista derivada del dataset compartido de cursus_users ──────────────────────
+def build_rows(records, now_utc=None):
     rows = []
-    total = 0
-    page  = 1
-    base  = f"https://api.intra.42.fr/v2/cursus/{cursus_id}/cursus_users"
-    now_utc = datetime.now(timezone.utc)
+    now_utc = now_utc or datetime.now(timezone.utc)
 
-    bar    = st.progress(0, text="Escaneando…")
-    status = st.empty()
+    for cu in records:
+        begin_dt = parse_dt(cu.begin_at)
 
-    while page <= max_pages:
-        if scope == "Solo este campus":
-            url = f"{base}?filter[campus_id]={campus_id}&page[size]=100&page[number]={page}&sort=-updated_at"
+        if begin_dt is None:
+            status_label = "❓ Sin begin_at"
+            days_to_start = None
+        elif begin_dt > now_utc:
+            status_label = "🟡 Pendiente (aún no empieza)"
+            days_to_start = (begin_dt - now_utc).days
         else:
-            url = f"{base}?page[size]=100&page[number]={page}&sort=-updated_at"
-
-        if debug:
-            st.code(url)
-
-        resp = api_get(url, headers)
-
-        if resp.status_code == 429:
-            wait = int(resp.headers.get("Retry-After", 5))
-            status.warning(f"⏳ Rate limit — esperando {wait}s…")
-            time.sleep(wait)
-            continue
-
-        if resp.status_code != 200:
-            status.error(f"❌ Error API {resp.status_code}: {resp.text[:200]}")
-            break
-
-        data = resp.json()
-        if not data:
-            break
-
-        for cu in data:
-            user = cu.get("user") or {}
-            if not user:
-                continue
-            total += 1
-
-            begin_raw = cu.get("begin_at")
-            begin_dt  = None
-            if begin_raw:
-                try:
-                    begin_dt = datetime.fromisoformat(begin_raw.replace("Z", "+00:00"))
-                except Exception:
-                    pass
-
-            if begin_dt is None:
-                status_label = "❓ Sin begin_at"
-                days_to_start = None
-            elif begin_dt > now_utc:
-                status_label = "🟡 Pendiente (aún no empieza)"
-                days_to_start = (begin_dt - now_utc).days
-            else:
-                status_label = "🟢 Activo"
-                days_to_start = None
-
-            raw_grade = (cu.get("grade") or "").strip()
-            bh_raw    = cu.get("blackholed_at")
-            end_raw   = cu.get("end_at")
-            # Blackholeado de verdad = end_at Y blackholed_at ambos presentes.
-            # (blackholed_at solo, sin end_at, es alguien en riesgo/proyectado, no caído aún)
-            es_blackholeado = bool(end_raw) and bool(bh_raw)
-            en_riesgo_bh    = bool(bh_raw) and not es_blackholeado
-
-            rows.append({
-                "Login":          user.get("login", ""),
-                "Display Name":   user.get("displayname", ""),
-                "Kind":           user.get("kind", ""),
-                "Grade (raw)":    raw_grade if raw_grade else "(vacío/null)",
-                "Estado cursus":  status_label,
-                "Begin At":       begin_raw or "—",
-                "Días para empezar": days_to_start,
-                "Level":          round(float(cu.get("level", 0)), 2),
-                "Eval Points":    int(user.get("correction_point", 0) or 0),
-                "Blackholed At":  (end_raw if es_blackholeado and end_raw else bh_raw) or "—",
-                "Blackholeado":   es_blackholeado,
-                "En Riesgo BH":   en_riesgo_bh,
-                "Updated":        cu.get("updated_at", ""),
-            })
-
-        status.text(f"📄 Página {page} · {total} registros escaneados")
-        bar.progress(min(page / max_pages, 1.0), text=f"Página {page}/{max_pages} · {total} registros")
-
-        if len(data) < 100:
-            break
-        page += 1
-
-    bar.empty()
-    status.empty()
+            status_label = "🟢 Activo"
+            days_to_start = None
+
+        # Blackholeado de verdad = end_at Y blackholed_at ambos presentes.
+        # (blackholed_at solo, sin end_at, es alguien en riesgo/proyectado, no caído aún)
+        es_blackholeado = bool(cu.end_at) and bool(cu.blackholed_at)
+        en_riesgo_bh    = bool(cu.blackholed_at) and not es_blackholeado
+
+        rows.append({
+            "Login":          cu.login,
+            "Display Name":   cu.displayname,
+            "Kind":           cu.kind,
+            "Grade (raw)":    cu.grade if cu.grade else "(vacío/null)",
+            "Estado cursus":  status_label,
+            "Begin At":       cu.begin_at or "—",
+            "Días para empezar": days_to_start,
+            "Level":          cu.level,
+            "Eval Points":    cu.correction_point,
+            "Blackholed At":  (cu.end_at if es_blackholeado and cu.end_at else cu.blackholed_at) or "—",
+            "Blackholeado":   es_blackholeado,
+            "En Riesgo BH":   en_riesgo_bh,
+            "Updated":        cu.updated_at,
+        })
 
     return rows
 
-# ── Run scan ────────────────────────────────────────────────────────────────
-if scan_btn:
-    rows = scan_targets(campus_id, scope, cursus_id, headers, max_pages, debug)
-    st.session_state["cursus_status_rows"] = rows
-    st.session_state["scan_ts"] = datetime.now().strftime("%H:%M:%S")
-    st.success(f"✅ Escaneo completo — {len(rows)} registros")
+# ── Run scan (o reutilizar el de otra página) ──────────────────────────────────
+campus_filter = campus_id if scope == "Solo este campus" else None
+as_of = None
+if fecha_as_of is not None:
+    as_of = datetime.combine(fecha_as_of, time.max)
+    dataset = get_cursus_store().as_of(campus_filter, cursus_id, as_of)
+    if dataset is None:
+        st.warning("⚠️ No hay ningún escaneo guardado de este alcance anterior a esa fecha.")
+        st.stop()
+elif scan_btn:
+    dataset = load_cursus_users(campus_filter, cursus_id, headers, max_pages, debug)
+    st.success(f"✅ Escaneo completo — {len(dataset.view(max_pages))} registros")
+else:
+    dataset = cached_cursus_users(campus_filter, cursus_id, max_pages)
 
 # ── Guard ─────────────────────────────────────────────────────────────────────
-if "cursus_status_rows" not in st.session_state:
+if dataset is None:
     st.info("👆 Pulsa **Ver activo / pendiente** en el sidebar para empezar.")
     st.stop()
 
-rows = st.session_state["cursus_status_rows"]
-ts = st.session_state.get("scan_ts", "—")
+rows = build_rows(dataset.view(max_pages), as_of.astimezone(timezone.utc) if as_of else None)
+ts = dataset.scanned_at.strftime("%H:%M:%S" if as_of is None else "%H:%M:%S %d/%m/%Y")
 
 df = pd.DataFrame(rows)
-st.markdown(f"<small style='color:var(--muted)'>Último escaneo: {ts} · {len(df)} registros</small>", unsafe_allow_html=True)
+if as_of is not None:
+    st.markdown(f"<small style='color:var(--muted)'>🕰️ Estado a {fecha_as_of.strftime('%d/%m/%Y')} · según el escaneo del {ts} · {len(df)} registros</small>", unsafe_allow_html=True)
+else:
+    st.markdown(f"<small style='color:var(--muted)'>Último escaneo: {ts} · {len(df)} registros</small>", unsafe_allow_html=True)
 
 # ── Stats ─────────────────────────────────────────────────────────────────────
 pendientes  = df[(df["Estado cursus"] == "🟡 Pendiente (aún no empieza)") & (~df["Blackholeado"])]
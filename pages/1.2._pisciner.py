@@ -1,8 +1,9 @@
 import streamlit as st
-import requests
-import time
 import pandas as pd
-from datetime import datetime, timezone
+from api.auth import get_auth_headers
+from api.scheduler import start_scheduler
+from api.cursus_users import cached_cursus_users, load_cursus_users
+from api.filters import Filter
 
 # ── Page config ───────────────────────────────────────────────────────────────
 st.set_page_config(page_title="42 External / Sin end_at ni BH", page_icon="🧩", layout="wide")
@@ -26,47 +27,14 @@ st.markdown('<div class="page-title">🧩 External / Sin end_at ni Blackhole</di
 st.markdown('<div class="page-sub">Lista quién es el kind="external" y quiénes no tienen end_at ni blackholed_at (activos "en el aire")</div>', unsafe_allow_html=True)
 
 # ── Auth (idéntico a tu app) ───────────────────────────────────────────────────
-def get_token():
-    try:
-        cid  = st.secrets["api42"]["client_id"]
-        csec = st.secrets["api42"]["client_secret"]
-        resp = requests.post("https://api.intra.42.fr/oauth/token", data={
-            "grant_type":    "client_credentials",
-            "client_id":     cid,
-            "client_secret": csec,
-        }, timeout=10)
-        if resp.status_code == 200:
-            return resp.json().get("access_token")
-        st.error(f"❌ Token error {resp.status_code}: {resp.text}")
-    except Exception as e:
-        st.error(f"Auth error: {e}")
-    return None
-
-def get_headers(force=False):
-    token_ts = st.session_state.get("token_ts")
-    now      = datetime.now(timezone.utc)
-    expired  = not token_ts or (now - token_ts).total_seconds() > 5400
-    if force or expired or "api_headers" not in st.session_state:
-        token = get_token()
-        if not token:
-            return None
-        st.session_state["api_headers"] = {"Authorization": f"Bearer {token}"}
-        st.session_state["token_ts"]    = now
-    return st.session_state["api_headers"]
-
-def api_get(url, headers):
-    resp = requests.get(url, headers=headers, timeout=20)
-    if resp.status_code == 401:
-        headers = get_headers(force=True)
-        if headers:
-            resp = requests.get(url, headers=headers, timeout=20)
-    return resp
-
-headers = get_headers()
+headers = get_auth_headers()
 if not headers:
     st.error("❌ No se pudo autenticar. Revisa los secrets.")
     st.stop()
 
+# Precalentado de fondo (una vez por proceso): la próxima visita ya encuentra los datos frescos
+start_scheduler()
+
 # ── Sidebar ───────────────────────────────────────────────────────────────────
 with st.sidebar:
     st.markdown("### 🧩 Scan settings")
@@ -78,104 +46,60 @@ with st.sidebar:
 
     cursus_id = st.number_input("Cursus ID", value=9, min_value=1)
     max_pages = st.number_input("Páginas máx (100/pág)", 1, 1000, 40)
+    only_ext  = st.checkbox(
+        "🧩 Solo external", value=False,
+        help="Filtra kind=external en local: la API no admite ese filtro, así que se descarga igual el listado "
+             "completo del cursus (Páginas máx cuenta páginas de ese listado). Sin él no se puede sacar la lista sin end_at ni BH."
+    )
     debug     = st.checkbox("🐛 Debug (mostrar URLs)", value=False)
 
     scan_btn = st.button("🚀 Buscar external / sin end_at-BH", type="primary", use_container_width=True)
 
-# ── Scan function with progress bar ────────────────────────────────────────────
-def scan_targets(campus_id, scope, cursus_id, headers, max_pages, debug):
+# ── Vistas derivadas del dataset compartido de cursus_users ────────────────────
+def build_targets(records):
     external_rows = []
     no_end_no_bh_rows = []
 
-    total = 0
-    page  = 1
-    base  = f"https://api.intra.42.fr/v2/cursus/{cursus_id}/cursus_users"
-
-    bar    = st.progress(0, text="Escaneando…")
-    status = st.empty()
-
-    while page <= max_pages:
-        if scope == "Solo este campus":
-            url = f"{base}?filter[campus_id]={campus_id}&page[size]=100&page[number]={page}&sort=-updated_at"
-        else:
-            url = f"{base}?page[size]=100&page[number]={page}&sort=-updated_at"
-
-        if debug:
-            st.code(url)
-
-        resp = api_get(url, headers)
-
-        if resp.status_code == 429:
-            wait = int(resp.headers.get("Retry-After", 5))
-            status.warning(f"⏳ Rate limit — esperando {wait}s…")
-            time.sleep(wait)
-            continue
-
-        if resp.status_code != 200:
-            status.error(f"❌ Error API {resp.status_code}: {resp.text[:200]}")
-            break
-
-        data = resp.json()
-        if not data:
-            break
-
-        for cu in data:
-            user = cu.get("user") or {}
-            if not user:
-                continue
-            total += 1
-
-            kind      = user.get("kind", "")
-            raw_grade = (cu.get("grade") or "").strip()
-            has_end   = bool(cu.get("end_at"))
-            has_bh    = bool(cu.get("blackholed_at"))
-
-            row = {
-                "Login":         user.get("login", ""),
-                "Display Name":  user.get("displayname", ""),
-                "Kind":          kind,
-                "Grade (raw)":   raw_grade if raw_grade else "(vacío/null)",
-                "Level":         round(float(cu.get("level", 0)), 2),
-                "Active?":       user.get("active?", ""),
-                "End At":        cu.get("end_at") or "—",
-                "Blackholed At": cu.get("blackholed_at") or "—",
-                "Updated":       cu.get("updated_at", ""),
-            }
-
-            if kind == "external":
-                external_rows.append(row)
-
-            if not has_end and not has_bh:
-                no_end_no_bh_rows.append(row)
-
-        status.text(f"📄 Página {page} · {total} registros escaneados")
-        bar.progress(min(page / max_pages, 1.0), text=f"Página {page}/{max_pages} · {total} registros")
-
-        if len(data) < 100:
-            break
-        page += 1
-
-    bar.empty()
-    status.empty()
+    for cu in records:
+        row = {
+            "Login":         cu.login,
+            "Display Name":  cu.displayname,
+            "Kind":          cu.kind,
+            "Grade (raw)":   cu.grade if cu.grade else "(vacío/null)",
+            "Level":         cu.level,
+            "Active?":       cu.active if cu.active is not None else "",
+            "End At":        cu.end_at or "—",
+            "Blackholed At": cu.blackholed_at or "—",
+            "Updated":       cu.updated_at,
+        }
+
+        if cu.kind == "external":
+            external_rows.append(row)
+
+        if not cu.end_at and not cu.blackholed_at:
+            no_end_no_bh_rows.append(row)
 
     return external_rows, no_end_no_bh_rows
 
-# ── Run scan ────────────────────────────────────────────────────────────────
+# ── Run scan (o reutilizar el de otra página) ──────────────────────────────────
+campus_filter = campus_id if scope == "Solo este campus" else None
+scan_filters  = (Filter("kind", "eq", "external"),) if only_ext else ()
 if scan_btn:
-    external_rows, no_end_no_bh_rows = scan_targets(campus_id, scope, cursus_id, headers, max_pages, debug)
-    st.session_state["external_rows"]      = external_rows
-    st.session_state["no_end_no_bh_rows"]  = no_end_no_bh_rows
-    st.session_state["scan_ts"]            = datetime.now().strftime("%H:%M:%S")
-    st.success(f"✅ Escaneo completo — {len(external_rows)} external · {len(no_end_no_bh_rows)} sin end_at ni BH")
+    dataset = load_cursus_users(campus_filter, cursus_id, headers, max_pages, debug, filters=scan_filters)
+else:
+    dataset = cached_cursus_users(campus_filter, cursus_id, max_pages, filters=scan_filters)
 
 # ── Guard ─────────────────────────────────────────────────────────────────────
-if "external_rows" not in st.session_state:
+if dataset is None:
     st.info("👆 Pulsa **Buscar external / sin end_at-BH** en el sidebar para empezar.")
     st.stop()
 
-external_rows     = st.session_state["external_rows"]
-no_end_no_bh_rows = st.session_state["no_end_no_bh_rows"]
-ts = st.session_state.get("scan_ts", "—")
+external_rows, no_end_no_bh_rows = build_targets(dataset.view(max_pages))
+ts = dataset.scanned_at.strftime("%H:%M:%S")
+if scan_btn and only_ext:
+    st.success(f"✅ Escaneo completo — {len(external_rows)} external")
+elif scan_btn:
+    st.success(f"✅ Escaneo completo — {len(external_rows)} external · {len(no_end_no_bh_rows)} sin end_at ni BH")
 
 st.markdown(f"<small style='color:var(--muted)'>Último escaneo: {ts}</small>", unsafe_allow_html=True)
 
@@ -192,6 +116,10 @@ else:
 st.markdown("---")
 
 # ── Sin end_at ni blackholed_at ────────────────────────────────────────────────
+if only_ext:
+    st.info("Desactiva **Solo external** para listar también los registros sin end_at ni blackholed_at.")
+    st.stop()
+
 st.markdown(f'<div class="section-title">🕳️ SIN end_at NI blackholed_at — {len(no_end_no_bh_rows)}</div>', unsafe_allow_html=True)
 if no_end_no_bh_rows:
     df_no = pd.DataFrame(no_end_no_bh_rows)
@@ -1,9 +1,12 @@
 import streamlit as st
-import requests
-import time
 import math
 import pandas as pd
-from datetime import datetime, timezone
+from datetime import date, datetime, time, timedelta, timezone
+from api.auth import get_auth_headers
+from api.scheduler import start_scheduler
+from api.cursus_store import get_cursus_store
+from api.cursus_users import cached_cursus_users, load_cursus_users, parse_dt, snapshot_frame
+from api.filters import Filter
 
 # ── Page config ───────────────────────────────────────────────────────────────
 st.set_page_config(page_title="42 Cadets por Nivel", page_icon="🪜", layout="wide")
@@ -27,47 +30,14 @@ st.markdown('<div class="page-title">🪜 Cadets por Nivel</div>', unsafe_allow_
 st.markdown('<div class="page-sub">Solo Cadets activos (sin futuros, sin blackhole), agrupados en brackets de nivel de 2 en 2</div>', unsafe_allow_html=True)
 
 # ── Auth (idéntico a tu app) ───────────────────────────────────────────────────
-def get_token():
-    try:
-        cid  = st.secrets["api42"]["client_id"]
-        csec = st.secrets["api42"]["client_secret"]
-        resp = requests.post("https://api.intra.42.fr/oauth/token", data={
-            "grant_type":    "client_credentials",
-            "client_id":     cid,
-            "client_secret": csec,
-        }, timeout=10)
-        if resp.status_code == 200:
-            return resp.json().get("access_token")
-        st.error(f"❌ Token error {resp.status_code}: {resp.text}")
-    except Exception as e:
-        st.error(f"Auth error: {e}")
-    return None
-
-def get_headers(force=False):
-    token_ts = st.session_state.get("token_ts")
-    now      = datetime.now(timezone.utc)
-    expired  = not token_ts or (now - token_ts).total_seconds() > 5400
-    if force or expired or "api_headers" not in st.session_state:
-        token = get_token()
-        if not token:
-            return None
-        st.session_state["api_headers"] = {"Authorization": f"Bearer {token}"}
-        st.session_state["token_ts"]    = now
-    return st.session_state["api_headers"]
-
-def api_get(url, headers):
-    resp = requests.get(url, headers=headers, timeout=20)
-    if resp.status_code == 401:
-        headers = get_headers(force=True)
-        if headers:
-            resp = requests.get(url, headers=headers, timeout=20)
-    return resp
-
-headers = get_headers()
+headers = get_auth_headers()
 if not headers:
     st.error("❌ No se pudo autenticar. Revisa los secrets.")
     st.stop()
 
+# Precalentado de fondo (una vez por proceso): la próxima visita ya encuentra los datos frescos
+start_scheduler()
+
 # ── Sidebar ───────────────────────────────────────────────────────────────────
 with st.sidebar:
     st.markdown("### 🪜 Scan settings")
@@ -81,104 +51,92 @@ with st.sidebar:
     max_pages = st.number_input("Páginas máx (100/pág)", 1, 1000, 20)
     debug     = st.checkbox("🐛 Debug (mostrar URLs)", value=False)
 
+    # Estado a una fecha pasada, desde la historia local de escaneos (sin requests)
+    ver_a_fecha = st.checkbox("🕰️ Ver estado a una fecha pasada", value=False)
+    fecha_as_of = st.date_input("Fecha", value=date.today() - timedelta(days=1), max_value=date.today()) if ver_a_fecha else None
+
     scan_btn = st.button("🚀 Escanear cadets", type="primary", use_container_width=True)
 
-# ── Scan function with progress bar ────────────────────────────────────────────
-def scan_targets(campus_id, scope, cursus_id, headers, max_pages, debug):
+# ── Vista derivada del dataset compartido de cursus_users ──────────────────────
+def build_rows(records, now_utc=None):
     rows = []
-    total = 0
-    page  = 1
-    base  = f"https://api.intra.42.fr/v2/cursus/{cursus_id}/cursus_users"
-    now_utc = datetime.now(timezone.utc)
-
-    bar    = st.progress(0, text="Escaneando…")
-    status = st.empty()
-
-    while page <= max_pages:
-        if scope == "Solo este campus":
-            url = f"{base}?filter[campus_id]={campus_id}&page[size]=100&page[number]={page}&sort=-updated_at"
-        else:
-            url = f"{base}?page[size]=100&page[number]={page}&sort=-updated_at"
-
-        if debug:
-            st.code(url)
-
-        resp = api_get(url, headers)
-
-        if resp.status_code == 429:
-            wait = int(resp.headers.get("Retry-After", 5))
-            status.warning(f"⏳ Rate limit — esperando {wait}s…")
-            time.sleep(wait)
-            continue
-
-        if resp.status_code != 200:
-            status.error(f"❌ Error API {resp.status_code}: {resp.text[:200]}")
-            break
-
-        data = resp.json()
-        if not data:
-            break
-
-        for cu in data:
-            user = cu.get("user") or {}
-            if not user:
-                continue
-            total += 1
-
-            raw_grade = (cu.get("grade") or "").strip()
-            bh_raw    = cu.get("blackholed_at")
-            end_raw   = cu.get("end_at")
-            es_blackholeado = bool(end_raw) and bool(bh_raw)
-
-            begin_raw = cu.get("begin_at")
-            begin_dt  = None
-            if begin_raw:
-                try:
-                    begin_dt = datetime.fromisoformat(begin_raw.replace("Z", "+00:00"))
-                except Exception:
-                    pass
-            es_futuro = begin_dt is not None and begin_dt > now_utc
-
-            rows.append({
-                "Login":         user.get("login", ""),
-                "Display Name":  user.get("displayname", ""),
-                "Kind":          user.get("kind", ""),
-                "Grade (raw)":   raw_grade if raw_grade else "(vacío/null)",
-                "Level":         round(float(cu.get("level", 0)), 2),
-                "Eval Points":   int(user.get("correction_point", 0) or 0),
-                "Es Futuro":     es_futuro,
-                "Blackholeado":  es_blackholeado,
-                "Updated":       cu.get("updated_at", ""),
-            })
-
-        status.text(f"📄 Página {page} · {total} registros escaneados")
-        bar.progress(min(page / max_pages, 1.0), text=f"Página {page}/{max_pages} · {total} registros")
-
-        if len(data) < 100:
-            break
-        page += 1
-
-    bar.empty()
-    status.empty()
+    now_utc = now_utc or datetime.now(timezone.utc)
+
+    for cu in records:
+        es_blackholeado = bool(cu.end_at) and bool(cu.blackholed_at)
+        begin_dt  = parse_dt(cu.begin_at)
+        es_futuro = begin_dt is not None and begin_dt > now_utc
+
+        rows.append({
+            "Login":         cu.login,
+            "Display Name":  cu.displayname,
+            "Kind":          cu.kind,
+            "Grade (raw)":   cu.grade if cu.grade else "(vacío/null)",
+            "Level":         cu.level,
+            "Eval Points":   cu.correction_point,
+            "Es Futuro":     es_futuro,
+            "Blackholeado":  es_blackholeado,
+            "Updated":       cu.updated_at,
+        })
 
     return rows
 
-# ── Run scan ────────────────────────────────────────────────────────────────
-if scan_btn:
-    rows = scan_targets(campus_id, scope, cursus_id, headers, max_pages, debug)
-    st.session_state["cadets_nivel_rows"] = rows
-    st.session_state["scan_ts"] = datetime.now().strftime("%H:%M:%S")
-    st.success(f"✅ Escaneo completo — {len(rows)} registros")
+def build_frame(frame, now_utc=None):
+    """Como build_rows, vectorizado sobre las columnas leídas de un snapshot (sin login ni nombre)"""
+    now_utc = pd.Timestamp(now_utc or datetime.now(timezone.utc))
+    begin_dt = pd.to_datetime(frame["begin_at"], utc=True, errors="coerce")
+    return pd.DataFrame({
+        "Kind":         frame["kind"],
+        "Grade (raw)":  frame["grade"].where(frame["grade"].fillna("") != "", "(vacío/null)"),
+        "Level":        frame["level"],
+        "Eval Points":  frame["correction_point"],
+        "Es Futuro":    begin_dt > now_utc,
+        "Blackholeado": frame["end_at"].fillna("").astype(bool) & frame["blackholed_at"].fillna("").astype(bool),
+        "Updated":      frame["updated_at"],
+    })
+
+# ── Run scan (o reutilizar el de otra página) ──────────────────────────────────
+# Solo se descargan los Cadets (filter[grade] en la API); futuros y blackhole se filtran después
+CADET_FILTERS = (
+    Filter("grade", "eq", "Cadet"),
+    Filter("kind", "eq", "student"),
+)
+# Lo único que necesitan las estadísticas: sin login ni display name
+STATS_COLUMNS = ["kind", "grade", "level", "correction_point", "begin_at", "end_at", "blackholed_at"]
+
+campus_filter = campus_id if scope == "Solo este campus" else None
+as_of = None
+frame = None
+if fecha_as_of is not None:
+    # La historia guarda los escaneos sin filtros: los de Cadets se aplican al leerla
+    as_of = datetime.combine(fecha_as_of, time.max)
+    dataset = get_cursus_store().as_of(campus_filter, cursus_id, as_of, filters=CADET_FILTERS)
+    if dataset is None:
+        st.warning("⚠️ No hay ningún escaneo guardado de este alcance anterior a esa fecha.")
+        st.stop()
+elif scan_btn:
+    dataset = load_cursus_users(campus_filter, cursus_id, headers, max_pages, debug, filters=CADET_FILTERS)
+    st.success(f"✅ Escaneo completo — {len(dataset.view(max_pages))} registros")
+else:
+    # Si el escaneo no está en memoria (app recién arrancada), las estadísticas
+    # salen del último snapshot leyendo solo STATS_COLUMNS
+    frame, snapshot_at = snapshot_frame(campus_filter, cursus_id, max_pages, STATS_COLUMNS, CADET_FILTERS)
+    dataset = None if frame is not None else cached_cursus_users(campus_filter, cursus_id, max_pages, filters=CADET_FILTERS)
 
 # ── Guard ─────────────────────────────────────────────────────────────────────
-if "cadets_nivel_rows" not in st.session_state:
+if dataset is None and frame is None:
     st.info("👆 Pulsa **Escanear cadets** en el sidebar para empezar.")
     st.stop()
 
-rows = st.session_state["cadets_nivel_rows"]
-ts = st.session_state.get("scan_ts", "—")
-
-df = pd.DataFrame(rows)
+if frame is not None:
+    df = build_frame(frame)
+    ts = f"{snapshot_at.strftime('%H:%M:%S %d/%m/%Y')} · 💾 snapshot"
+else:
+    rows = build_rows(dataset.view(max_pages), as_of.astimezone(timezone.utc) if as_of else None)
+    ts = dataset.scanned_at.strftime("%H:%M:%S")
+    if as_of is not None:
+        ts = f"{dataset.scanned_at.strftime('%H:%M:%S %d/%m/%Y')} · 🕰️ estado a {fecha_as_of.strftime('%d/%m/%Y')}"
+    df = pd.DataFrame(rows)
 
 # ── Filtro: solo Cadets, kind=student, sin futuros, sin blackhole ────────────
 cadets = df[
@@ -215,7 +173,7 @@ stats = (
     cadets.groupby(["_bracket_orden", "Nivel (bracket)"], as_index=False)
     .agg(
         **{
-            "Nº Estudiantes": ("Login", "count"),
+            "Nº Estudiantes": ("Level", "size"),
             "Media Level":    ("Level", "mean"),
             "Media Puntos":   ("Eval Points", "mean"),
         }
@@ -253,6 +211,9 @@ st.download_button("⬇️ Exportar CSV (estadísticas por bracket)", csv_stats,
 
 # ── Detalle completo (opcional, plegado) ──────────────────────────────────────
 with st.expander("🪜 Ver detalle de cadets por nivel (tabla completa)"):
+    if frame is not None:
+        st.info("El snapshot se ha leído sin logins: pulsa **Escanear cadets** para ver el detalle.")
+        st.stop()
     tabla_final = cadets[
         ["Nivel (bracket)", "Login", "Display Name", "Level", "Eval Points", "Updated", "_bracket_orden"]
     ].sort_values(["_bracket_orden", "Level"], ascending=[True, False]).drop(columns="_bracket_orden")
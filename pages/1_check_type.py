@@ -1,8 +1,8 @@
 import streamlit as st
-import requests
-import time
 from collections import Counter
-from datetime import datetime, timezone
+from api.auth import get_auth_headers
+from api.scheduler import start_scheduler
+from api.cursus_users import cached_cursus_users, load_cursus_users
 
 # ── Page config ───────────────────────────────────────────────────────────────
 st.set_page_config(page_title="42 Unique States Scanner", page_icon="🔍", layout="wide")
@@ -32,47 +32,14 @@ st.markdown('<div class="page-title">🔍 Unique States Scanner</div>', unsafe_a
 st.markdown('<div class="page-sub">Escanea la API sin filtros y saca todos los valores reales de grade / kind / active?</div>', unsafe_allow_html=True)
 
 # ── Auth (idéntico a tu app) ───────────────────────────────────────────────────
-def get_token():
-    try:
-        cid  = st.secrets["api42"]["client_id"]
-        csec = st.secrets["api42"]["client_secret"]
-        resp = requests.post("https://api.intra.42.fr/oauth/token", data={
-            "grant_type":    "client_credentials",
-            "client_id":     cid,
-            "client_secret": csec,
-        }, timeout=10)
-        if resp.status_code == 200:
-            return resp.json().get("access_token")
-        st.error(f"❌ Token error {resp.status_code}: {resp.text}")
-    except Exception as e:
-        st.error(f"Auth error: {e}")
-    return None
-
-def get_headers(force=False):
-    token_ts = st.session_state.get("token_ts")
-    now      = datetime.now(timezone.utc)
-    expired  = not token_ts or (now - token_ts).total_seconds() > 5400
-    if force or expired or "api_headers" not in st.session_state:
-        token = get_token()
-        if not token:
-            return None
-        st.session_state["api_headers"] = {"Authorization": f"Bearer {token}"}
-        st.session_state["token_ts"]    = now
-    return st.session_state["api_headers"]
-
-def api_get(url, headers):
-    resp = requests.get(url, headers=headers, timeout=20)
-    if resp.status_code == 401:
-        headers = get_headers(force=True)
-        if headers:
-            resp = requests.get(url, headers=headers, timeout=20)
-    return resp
-
-headers = get_headers()
+headers = get_auth_headers()
 if not headers:
     st.error("❌ No se pudo autenticar. Revisa los secrets.")
     st.stop()
 
+# Precalentado de fondo (una vez por proceso): la próxima visita ya encuentra los datos frescos
+start_scheduler()
+
 # ── Sidebar ───────────────────────────────────────────────────────────────────
 with st.sidebar:
     st.markdown("### 🔍 Scan settings")
@@ -91,77 +58,29 @@ with st.sidebar:
 # ── Known values that your app currently filters on ───────────────────────────
 KEEP_GRADES = {"Cadet", "Outercore", "Transcender", "Alumni", "Blackholed"}
 
-# ── Scan function with progress bar ────────────────────────────────────────────
-def scan_unique_states(campus_id, scope, cursus_id, headers, max_pages, debug):
+# ── Vista derivada del dataset compartido de cursus_users ──────────────────────
+def count_unique_states(records):
     grade_counter = Counter()
     kind_counter  = Counter()
     active_counter = Counter()
     end_bh_counter = Counter()
     empty_grade_examples = []
 
-    total = 0
-    page  = 1
-    base  = f"https://api.intra.42.fr/v2/cursus/{cursus_id}/cursus_users"
-
-    bar    = st.progress(0, text="Escaneando…")
-    status = st.empty()
-
-    while page <= max_pages:
-        if scope == "Solo este campus":
-            url = f"{base}?filter[campus_id]={campus_id}&page[size]=100&page[number]={page}&sort=-updated_at"
-        else:
-            url = f"{base}?page[size]=100&page[number]={page}&sort=-updated_at"
-
-        if debug:
-            st.code(url)
-
-        resp = api_get(url, headers)
-
-        if resp.status_code == 429:
-            wait = int(resp.headers.get("Retry-After", 5))
-            status.warning(f"⏳ Rate limit — esperando {wait}s…")
-            time.sleep(wait)
-            continue
-
-        if resp.status_code != 200:
-            status.error(f"❌ Error API {resp.status_code}: {resp.text[:200]}")
-            break
-
-        data = resp.json()
-        if not data:
-            break
-
-        for cu in data:
-            user = cu.get("user") or {}
-            if not user:
-                continue
-            total += 1
+    for cu in records:
+        grade_counter[cu.grade if cu.grade else "(vacío/null)"] += 1
 
-            raw_grade = (cu.get("grade") or "").strip()
-            grade_counter[raw_grade if raw_grade else "(vacío/null)"] += 1
+        kind_counter[cu.kind or "(sin kind)"] += 1
+        active_counter[str(cu.active) if cu.active is not None else "(sin campo)"] += 1
 
-            kind_counter[user.get("kind", "(sin kind)")] += 1
-            active_counter[str(user.get("active?", "(sin campo)"))] += 1
+        has_end = bool(cu.end_at)
+        has_bh  = bool(cu.blackholed_at)
+        end_bh_counter[f"end_at={has_end} / blackholed_at={has_bh}"] += 1
 
-            has_end = bool(cu.get("end_at"))
-            has_bh  = bool(cu.get("blackholed_at"))
-            end_bh_counter[f"end_at={has_end} / blackholed_at={has_bh}"] += 1
-
-            if not raw_grade and len(empty_grade_examples) < 10:
-                empty_grade_examples.append(user.get("login", "?"))
-
-        status.text(f"📄 Página {page} · {total} registros escaneados")
-        bar.progress(min(page / max_pages, 1.0), text=f"Página {page}/{max_pages} · {total} registros")
-
-        if len(data) < 100:
-            break
-        page += 1
-
-    bar.empty()
-    status.empty()
+        if not cu.grade and len(empty_grade_examples) < 10:
+            empty_grade_examples.append(cu.login or "?")
 
     return {
-        "total": total,
+        "total": len(records),
         "grade": grade_counter,
         "kind": kind_counter,
         "active": active_counter,
@@ -169,20 +88,22 @@ def scan_unique_states(campus_id, scope, cursus_id, headers, max_pages, debug):
         "empty_grade_examples": empty_grade_examples,
     }
 
-# ── Run scan ────────────────────────────────────────────────────────────────
+# ── Run scan (o reutilizar el de otra página) ──────────────────────────────────
+campus_filter = campus_id if scope == "Solo este campus" else None
 if scan_btn:
-    result = scan_unique_states(campus_id, scope, cursus_id, headers, max_pages, debug)
-    st.session_state["scan_result"] = result
-    st.session_state["scan_ts"] = datetime.now().strftime("%H:%M:%S")
-    st.success(f"✅ Escaneo completo — {result['total']} registros analizados")
+    dataset = load_cursus_users(campus_filter, cursus_id, headers, max_pages, debug)
+else:
+    dataset = cached_cursus_users(campus_filter, cursus_id, max_pages)
 
 # ── Guard ─────────────────────────────────────────────────────────────────────
-if "scan_result" not in st.session_state:
+if dataset is None:
     st.info("👆 Pulsa **Escanear estados únicos** en el sidebar para empezar.")
     st.stop()
 
-result = st.session_state["scan_result"]
-ts = st.session_state.get("scan_ts", "—")
+result = count_unique_states(dataset.view(max_pages))
+ts = dataset.scanned_at.strftime("%H:%M:%S")
+if scan_btn:
+    st.success(f"✅ Escaneo completo — {result['total']} registros analizados")
 
 st.markdown(f"<small style='color:var(--muted)'>Último escaneo: {ts} · {result['total']} registros</small>", unsafe_allow_html=True)
 
@@ -1,10 +1,10 @@
 import streamlit as st
-import requests
-import time
-import json
-import sqlite3
 import pandas as pd
-from datetime import datetime, timezone
+from datetime import date, datetime, time, timedelta
+from api.auth import get_auth_headers
+from api.scheduler import start_scheduler
+from api.cursus_store import get_cursus_store
+from api.cursus_users import cached_cursus_users, load_cursus_users
 
 # ── Page config ───────────────────────────────────────────────────────────────
 st.set_page_config(page_title="42 Inactividad", page_icon="⏳", layout="wide")
@@ -28,94 +28,15 @@ st.markdown("""
 st.markdown('<div class="page-title">⏳ Inactividad — Última Entrega</div>', unsafe_allow_html=True)
 st.markdown('<div class="page-sub">Estudiantes agrupados por cuánto tiempo llevan sin actividad, con su media de eval points</div>', unsafe_allow_html=True)
 
-# ── Caché local con SQLite ──────────────────────────────────────────────────
-# NOTA sobre persistencia: en Streamlit Community Cloud el disco es efímero —
-# sobrevive mientras la app esté "despierta", pero se borra si la app se
-# duerme por inactividad o si haces un redeploy. Sirve para no re-escanear
-# cada vez que cambias de página o recargas dentro de la misma sesión activa,
-# pero no es una base de datos permanente entre despliegues. Si necesitas eso,
-# lo ideal sería un Postgres/SQLite externo (ej. Supabase, Neon, Turso).
-DB_PATH = "inactividad_cache.db"
-
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS scans (
-            scan_key TEXT PRIMARY KEY,
-            scanned_at TEXT,
-            data_json TEXT
-        )
-    """)
-    conn.commit()
-    conn.close()
-
-def save_scan(scan_key, rows):
-    conn = sqlite3.connect(DB_PATH)
-    conn.execute(
-        "INSERT OR REPLACE INTO scans (scan_key, scanned_at, data_json) VALUES (?, ?, ?)",
-        (scan_key, datetime.now(timezone.utc).isoformat(), json.dumps(rows)),
-    )
-    conn.commit()
-    conn.close()
-
-def load_scan(scan_key, max_age_hours):
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.execute("SELECT scanned_at, data_json FROM scans WHERE scan_key = ?", (scan_key,))
-    row = cur.fetchone()
-    conn.close()
-    if not row:
-        return None, None
-    scanned_at_raw, data_json = row
-    scanned_at = datetime.fromisoformat(scanned_at_raw)
-    age_hours = (datetime.now(timezone.utc) - scanned_at).total_seconds() / 3600
-    if age_hours > max_age_hours:
-        return None, scanned_at
-    return json.loads(data_json), scanned_at
-
-init_db()
-
 # ── Auth (idéntico a tu app) ───────────────────────────────────────────────────
-def get_token():
-    try:
-        cid  = st.secrets["api42"]["client_id"]
-        csec = st.secrets["api42"]["client_secret"]
-        resp = requests.post("https://api.intra.42.fr/oauth/token", data={
-            "grant_type":    "client_credentials",
-            "client_id":     cid,
-            "client_secret": csec,
-        }, timeout=10)
-        if resp.status_code == 200:
-            return resp.json().get("access_token")
-        st.error(f"❌ Token error {resp.status_code}: {resp.text}")
-    except Exception as e:
-        st.error(f"Auth error: {e}")
-    return None
-
-def get_headers(force=False):
-    token_ts = st.session_state.get("token_ts")
-    now      = datetime.now(timezone.utc)
-    expired  = not token_ts or (now - token_ts).total_seconds() > 5400
-    if force or expired or "api_headers" not in st.session_state:
-        token = get_token()
-        if not token:
-            return None
-        st.session_state["api_headers"] = {"Authorization": f"Bearer {token}"}
-        st.session_state["token_ts"]    = now
-    return st.session_state["api_headers"]
-
-def api_get(url, headers):
-    resp = requests.get(url, headers=headers, timeout=20)
-    if resp.status_code == 401:
-        headers = get_headers(force=True)
-        if headers:
-            resp = requests.get(url, headers=headers, timeout=20)
-    return resp
-
-headers = get_headers()
+headers = get_auth_headers()
 if not headers:
     st.error("❌ No se pudo autenticar. Revisa los secrets.")
     st.stop()
 
+# Precalentado de fondo (una vez por proceso): la próxima visita ya encuentra los datos frescos
+start_scheduler()
+
 # ── Sidebar ───────────────────────────────────────────────────────────────────
 with st.sidebar:
     st.markdown("### ⏳ Scan settings")
@@ -132,6 +53,10 @@ with st.sidebar:
     )
     debug = st.checkbox("🐛 Debug (mostrar URLs)", value=False)
 
+    # Estado a una fecha pasada, desde la historia local de escaneos (sin requests)
+    ver_a_fecha = st.checkbox("🕰️ Ver estado a una fecha pasada", value=False)
+    fecha_as_of = st.date_input("Fecha", value=date.today() - timedelta(days=1), max_value=date.today()) if ver_a_fecha else None
+
     st.markdown("---")
     st.markdown("### 💾 Caché")
     usar_cache = st.checkbox("Usar caché si existe", value=True)
@@ -140,137 +65,61 @@ with st.sidebar:
     scan_btn = st.button("🚀 Escanear inactividad", type="primary", use_container_width=True)
     forzar_btn = st.button("🔄 Forzar re-escaneo (ignorar caché)", use_container_width=True)
 
-# ── Scan function with progress bar ────────────────────────────────────────────
-def scan_targets(campus_id, scope, cursus_id, headers, max_pages, debug):
-    rows = []
-    total = 0
-    page  = 1
-    base  = f"https://api.intra.42.fr/v2/cursus/{cursus_id}/cursus_users"
-    now_utc = datetime.now(timezone.utc)
-
-    bar    = st.progress(0, text="Escaneando…")
-    status = st.empty()
-
-    while page <= max_pages:
-        if scope == "Solo este campus":
-            url = f"{base}?filter[campus_id]={campus_id}&page[size]=100&page[number]={page}&sort=-updated_at"
-        else:
-            url = f"{base}?page[size]=100&page[number]={page}&sort=-updated_at"
-
-        if debug:
-            st.code(url)
-
-        resp = api_get(url, headers)
-
-        if resp.status_code == 429:
-            wait = int(resp.headers.get("Retry-After", 5))
-            status.warning(f"⏳ Rate limit — esperando {wait}s…")
-            time.sleep(wait)
-            continue
-
-        if resp.status_code != 200:
-            status.error(f"❌ Error API {resp.status_code}: {resp.text[:200]}")
-            break
-
-        data = resp.json()
-        if not data:
-            break
-
-        for cu in data:
-            user = cu.get("user") or {}
-            if not user:
-                continue
-            total += 1
-
-            raw_grade = (cu.get("grade") or "").strip()
-            bh_raw    = cu.get("blackholed_at")
-            is_active_field = user.get("active?", True)
-            es_blackholeado = (is_active_field is False) and bool(bh_raw)
-
-            updated_raw = user.get("updated_at")
-            updated_dt  = None
-            dias_inactivo = None
-            if updated_raw:
-                try:
-                    updated_dt = datetime.fromisoformat(updated_raw.replace("Z", "+00:00"))
-                    dias_inactivo = (now_utc - updated_dt).days
-                except Exception:
-                    pass
-
-            rows.append({
-                "Login":          user.get("login", ""),
-                "Display Name":   user.get("displayname", ""),
-                "Kind":           user.get("kind", ""),
-                "Grade (raw)":    raw_grade if raw_grade else "(vacío/null)",
-                "Blackholeado":   es_blackholeado,
-                "Level":          round(float(cu.get("level", 0)), 2),
-                "Eval Points":    int(user.get("correction_point", 0) or 0),
-                "Updated At":     updated_raw or "—",
-                "Días sin actividad": dias_inactivo,
-            })
-
-        status.text(f"📄 Página {page} · {total} registros escaneados")
-        bar.progress(min(page / max_pages, 1.0), text=f"Página {page}/{max_pages} · {total} registros")
-
-        if len(data) < 100:
-            break
-        page += 1
-
-    bar.empty()
-    status.empty()
-
-    return rows
-
 # ── Run scan (con caché) ────────────────────────────────────────────────────
-scan_key = f"v2_user_updated_at|{scope}|{cursus_id}|{campus_id}|{max_pages}"
+# Cada escaneo se guarda en el store local (una fila por cursus_user); la
+# página solo recuerda qué alcance mirar y agrega con SQL sobre él.
+store = get_cursus_store()
+campus_filter = campus_id if scope == "Solo este campus" else None
+
+def remember(dataset, source, ts):
+    # Un escaneo que falló a mitad solo cubre las páginas que llegó a bajar
+    store.save(dataset, max_pages if dataset.error is None else dataset.pages)
+    st.session_state["inactividad_scan"] = (campus_filter, cursus_id, max_pages)
+    st.session_state["scan_ts"] = ts
+    st.session_state["scan_source"] = source
 
 if forzar_btn:
-    rows = scan_targets(campus_id, scope, cursus_id, headers, max_pages, debug)
-    save_scan(scan_key, rows)
-    st.session_state["inactividad_rows"] = rows
-    st.session_state["scan_ts"] = datetime.now().strftime("%H:%M:%S")
-    st.session_state["scan_source"] = "API (forzado)"
-    st.success(f"✅ Escaneo completo (forzado) — {len(rows)} registros")
+    dataset = load_cursus_users(campus_filter, cursus_id, headers, max_pages, debug, force=True)
+    remember(dataset, "API (forzado)", datetime.now().strftime("%H:%M:%S"))
+    st.success(f"✅ Escaneo completo (forzado) — {len(dataset.view(max_pages))} registros")
 
 elif scan_btn:
-    cached_rows, cached_at = (None, None)
-    if usar_cache:
-        cached_rows, cached_at = load_scan(scan_key, cache_max_horas)
-
-    if cached_rows is not None:
-        rows = cached_rows
-        st.session_state["inactividad_rows"] = rows
+    if usar_cache and store.covers(campus_filter, cursus_id, max_pages, cache_max_horas):
+        cached_at = store.scan_info(campus_filter, cursus_id)["saved_at"]
+        st.session_state["inactividad_scan"] = (campus_filter, cursus_id, max_pages)
         st.session_state["scan_ts"] = cached_at.strftime("%H:%M:%S %d/%m")
         st.session_state["scan_source"] = "Caché"
-        st.info(f"💾 Usando caché guardada a las {cached_at.strftime('%H:%M %d/%m')} ({len(rows)} registros). Pulsa 'Forzar re-escaneo' para actualizar.")
+        st.info(f"💾 Usando caché guardada a las {cached_at.strftime('%H:%M %d/%m')}. Pulsa 'Forzar re-escaneo' para actualizar.")
     else:
-        rows = scan_targets(campus_id, scope, cursus_id, headers, max_pages, debug)
-        save_scan(scan_key, rows)
-        st.session_state["inactividad_rows"] = rows
-        st.session_state["scan_ts"] = datetime.now().strftime("%H:%M:%S")
-        st.session_state["scan_source"] = "API"
-        st.success(f"✅ Escaneo completo — {len(rows)} registros (guardado en caché)")
+        dataset = load_cursus_users(campus_filter, cursus_id, headers, max_pages, debug)
+        remember(dataset, "API", dataset.scanned_at.strftime("%H:%M:%S"))
+        st.success(f"✅ Escaneo completo — {len(dataset.view(max_pages))} registros (guardado en caché)")
+
+elif "inactividad_scan" not in st.session_state:
+    # Sin pulsar nada: si otra página ya escaneó este (campus, cursus), se reutiliza
+    dataset = cached_cursus_users(campus_filter, cursus_id, max_pages)
+    if dataset is not None:
+        remember(dataset, "Escaneo compartido", dataset.scanned_at.strftime("%H:%M:%S"))
+
+as_of = None
+if fecha_as_of is not None:
+    # Sin escanear: el alcance del sidebar tal como estaba al final de ese día
+    as_of = datetime.combine(fecha_as_of, time.max)
+    first = store.first_scan(campus_filter, cursus_id)
+    if first is None or first.astimezone() > as_of.astimezone():
+        st.warning("⚠️ No hay ningún escaneo guardado de este alcance anterior a esa fecha.")
+        st.stop()
+    st.session_state["inactividad_scan"] = (campus_filter, cursus_id, max_pages)
 
 # ── Guard ─────────────────────────────────────────────────────────────────────
-if "inactividad_rows" not in st.session_state:
+if "inactividad_scan" not in st.session_state:
     st.info("👆 Pulsa **Escanear inactividad** en el sidebar para empezar.")
     st.stop()
 
-rows = st.session_state["inactividad_rows"]
+scan_campus, scan_cursus, scan_pages = st.session_state["inactividad_scan"]
 ts = st.session_state.get("scan_ts", "—")
-
-df = pd.DataFrame(rows)
-df = df[df["Días sin actividad"].notna()]
-
-if solo_estudiantes_validos:
-    df = df[
-        (df["Kind"] == "student")
-        & (df["Grade (raw)"].isin(["Cadet", "Transcender", "Alumni"]))
-        & (~df["Blackholeado"])
-    ]
-
-st.markdown(f"<small style='color:var(--muted)'>Último escaneo: {ts} · fuente: {st.session_state.get('scan_source', '—')} · {len(df)} estudiantes con fecha de actividad válida</small>", unsafe_allow_html=True)
-st.markdown("---")
+if as_of is not None:
+    ts = f"🕰️ estado a {fecha_as_of.strftime('%d/%m/%Y')}"
 
 # ── Categorías de inactividad (mutuamente excluyentes) ────────────────────────
 # Cada estudiante cae SOLO en la categoría más alta que le corresponda:
@@ -288,32 +137,20 @@ CATEGORIAS = [
     ("4 años",  365 * 4),
     ("5 años",  365 * 5),
 ]
-# Umbrales ordenados de mayor a menor para asignar la categoría más alta que aplique
-CATEGORIAS_DESC = sorted(CATEGORIAS, key=lambda x: x[1], reverse=True)
-
-def categorizar(dias):
-    if pd.isna(dias):
-        return None
-    for label, umbral in CATEGORIAS_DESC:
-        if dias >= umbral:
-            return label
-    return None  # menos de 1 mes sin actividad → no entra en ninguna categoría
+# Recuento y medias por categoría, agregados en SQL sobre el store local
+buckets, total_validos = store.activity_buckets(scan_campus, scan_cursus, scan_pages, CATEGORIAS,
+                                                solo_estudiantes_validos, as_of=as_of)
 
-df["Categoría"] = df["Días sin actividad"].apply(categorizar)
-df_categorizado = df[df["Categoría"].notna()]
-
-stats_rows = []
-for label, dias in CATEGORIAS:
-    subset = df_categorizado[df_categorizado["Categoría"] == label]
-    stats_rows.append({
-        "Categoría":            label,
-        "Días (umbral)":        dias,
-        "Nº Estudiantes":       len(subset),
-        "Media Eval Points":    round(subset["Eval Points"].mean(), 3) if not subset.empty else 0,
-        "Media Level":          round(subset["Level"].mean(), 2) if not subset.empty else 0,
-    })
+st.markdown(f"<small style='color:var(--muted)'>Último escaneo: {ts} · fuente: {'Historia local' if as_of is not None else st.session_state.get('scan_source', '—')} · {total_validos} estudiantes con fecha de actividad válida</small>", unsafe_allow_html=True)
+st.markdown("---")
 
-tabla_categorias = pd.DataFrame(stats_rows)
+tabla_categorias = pd.DataFrame({
+    "Categoría":         buckets["label"],
+    "Días (umbral)":     buckets["days"],
+    "Nº Estudiantes":    buckets["n"],
+    "Media Eval Points": buckets["avg_points"].astype(float).round(3).fillna(0),
+    "Media Level":       buckets["avg_level"].astype(float).round(2).fillna(0),
+})
 
 st.markdown('<div class="section-title">📊 ESTADÍSTICAS POR TIEMPO DE INACTIVIDAD</div>', unsafe_allow_html=True)
 st.caption("Categorías mutuamente excluyentes: cada estudiante cuenta solo en la categoría más alta que le corresponde (ej. alguien con 5 años sin actividad solo aparece en '5 años', no en las demás).")
@@ -338,9 +175,11 @@ st.markdown('<div class="section-title">🔍 VER ESTUDIANTES DE UNA CATEGORÍA</
 categoria_elegida = st.selectbox("Elige categoría", [c[0] for c in CATEGORIAS])
 dias_elegidos = dict(CATEGORIAS)[categoria_elegida]
 
-subset_detalle = df_categorizado[df_categorizado["Categoría"] == categoria_elegida][
-    ["Login", "Display Name", "Grade (raw)", "Level", "Eval Points", "Días sin actividad", "Updated At"]
-].sort_values("Días sin actividad", ascending=False)
+# Hasta el umbral siguiente: quien lo alcanza ya cuenta en esa otra categoría
+siguiente = min((d for _, d in CATEGORIAS if d > dias_elegidos), default=None)
+subset_detalle = store.activity_members(
+    scan_campus, scan_cursus, scan_pages, dias_elegidos, siguiente, solo_estudiantes_validos, as_of=as_of
+).set_axis(["Login", "Display Name", "Grade (raw)", "Level", "Eval Points", "Días sin actividad", "Updated At"], axis=1)
 
 st.dataframe(subset_detalle, use_container_width=True, hide_index=True)
 csv_detalle = subset_detalle.to_csv(index=False).encode("utf-8")
@@ -1,8 +1,10 @@
 import streamlit as st
-import requests
 import pandas as pd
-import time
 from datetime import datetime, timezone
+from api.auth import get_auth_headers
+from api.scheduler import start_scheduler
+from api.cursus_users import cached_cursus_users, load_cursus_users, parse_dt, top_n_cursus_users
+from api.filters import Filter
 
 # ── Page config ───────────────────────────────────────────────────────────────
 st.set_page_config(page_title="🕳️ Blackhole Watch", page_icon="🕳️", layout="wide")
@@ -46,47 +48,14 @@ st.markdown('<div class="page-title">🕳️ Blackhole Watch</div>', unsafe_allo
 st.markdown('<div class="page-sub">Últimos estudiantes que cayeron en el blackhole — cursus 21</div>', unsafe_allow_html=True)
 
 # ── Auth ──────────────────────────────────────────────────────────────────────
-def get_token():
-    try:
-        cid  = st.secrets["api42"]["client_id"]
-        csec = st.secrets["api42"]["client_secret"]
-        resp = requests.post("https://api.intra.42.fr/oauth/token", data={
-            "grant_type":    "client_credentials",
-            "client_id":     cid,
-            "client_secret": csec,
-        }, timeout=10)
-        if resp.status_code == 200:
-            return resp.json().get("access_token")
-        st.error(f"❌ Token error {resp.status_code}: {resp.text}")
-    except Exception as e:
-        st.error(f"Auth error: {e}")
-    return None
-
-def get_headers(force=False):
-    token_ts = st.session_state.get("token_ts")
-    now      = datetime.now(timezone.utc)
-    expired  = not token_ts or (now - token_ts).total_seconds() > 5400
-    if force or expired or "api_headers" not in st.session_state:
-        token = get_token()
-        if not token:
-            return None
-        st.session_state["api_headers"] = {"Authorization": f"Bearer {token}"}
-        st.session_state["token_ts"]    = now
-    return st.session_state["api_headers"]
-
-def api_get(url, headers):
-    resp = requests.get(url, headers=headers, timeout=20)
-    if resp.status_code == 401:
-        headers = get_headers(force=True)
-        if headers:
-            resp = requests.get(url, headers=headers, timeout=20)
-    return resp
-
-headers = get_headers()
+headers = get_auth_headers()
 if not headers:
     st.error("❌ No se pudo autenticar. Revisa los secrets.")
     st.stop()
 
+# Precalentado de fondo (una vez por proceso): la próxima visita ya encuentra los datos frescos
+start_scheduler()
+
 # ── Sidebar ───────────────────────────────────────────────────────────────────
 with st.sidebar:
     st.markdown("### 🕳️ Blackhole Watch")
@@ -97,109 +66,83 @@ with st.sidebar:
 
     top_n     = st.number_input("Mostrar últimos N blackholed", 1, 100, 10)
     max_pages = st.number_input("Páginas máx a escanear", 1, 200, 50)
+    topn_mode = st.checkbox(
+        "⚡ Parar al tener los N últimos", value=True,
+        help="Deja de escanear en cuanto los N más recientes son definitivos. Si luego subes N, continúa desde la página donde se quedó."
+    )
     debug     = st.checkbox("🐛 Debug", value=False)
     load_btn  = st.button("🚀 Cargar blackholed", type="primary", use_container_width=True)
 
-# ── Fetch ─────────────────────────────────────────────────────────────────────
-def fetch_blackholed(campus_id, headers, max_pages, debug):
+# ── Vista derivada del dataset compartido de cursus_users (cursus 21) ──────────
+# A la API solo va range[blackholed_at] (los que tienen fecha); que el usuario
+# esté inactivo (active?) se filtra en local
+BH_FILTERS = (
+    Filter("active", "eq", False),
+    Filter("blackholed_at", "present", None),
+)
+
+def es_blackholed(cu):
+    # Solo usuarios marcados como inactivos por 42, con blackholed_at
+    # y con una fecha real (updated_at) válida
+    if cu.active is None or cu.active:
+        return False
+    if not cu.blackholed_at:
+        return False
+    return parse_dt(cu.updated_at or cu.blackholed_at) is not None
+
+def build_blackholed(records, debug):
     results = []
-    bar     = st.progress(0, text="Escaneando…")
-    status  = st.empty()
-    page    = 1
     now_utc = datetime.now(timezone.utc).replace(tzinfo=None)
 
-    while page <= max_pages:
-        url = (
-            f"https://api.intra.42.fr/v2/cursus/21/cursus_users"
-            f"?filter[campus_id]={campus_id}"
-            f"&page[size]=100&page[number]={page}"
-            f"&sort=-updated_at"
-        )
+    for cu in records:
+        if not es_blackholed(cu):
+            continue
 
-        if debug:
-            st.code(url)
+        # updated_at = fecha real en que 42 procesó el blackhole
+        updated_raw = cu.updated_at or cu.blackholed_at
+        real_bh_dt = parse_dt(updated_raw).replace(tzinfo=None)
 
-        resp = api_get(url, headers)
+        # Fecha límite original (informativa)
+        deadline_dt = parse_dt(cu.blackholed_at)
+        deadline_dt = deadline_dt.replace(tzinfo=None) if deadline_dt else real_bh_dt
 
-        if resp.status_code == 429:
-            wait = int(resp.headers.get("Retry-After", 5))
-            status.warning(f"⏳ Rate limit — esperando {wait}s…")
-            time.sleep(wait)
-            continue
+        days_ago = (now_utc - real_bh_dt).days
+
+        if debug and cu.login:
+            st.write(f"{cu.login} | updated_at: {updated_raw} | blackholed_at: {cu.blackholed_at} | active?: {cu.active}")
+
+        results.append({
+            "Login":        cu.login,
+            "Display Name": cu.displayname,
+            "Kind":         cu.kind,
+            "Level":        cu.level,
+            "Blackholed At": real_bh_dt,       # fecha real (updated_at)
+            "BH Deadline":   deadline_dt,       # blackholed_at original
+            "Days Ago":      days_ago,
+            "Eval Points":   cu.correction_point,
+            "Wallet":        cu.wallet,
+            "Pool":          f"{cu.pool_month or ''} {cu.pool_year or ''}".strip(),
+        })
 
-        if resp.status_code != 200:
-            status.error(f"❌ Error API {resp.status_code}: {resp.text[:200]}")
-            break
-
-        data = resp.json()
-        if not data:
-            break
-
-        for cu in data:
-            user = cu.get("user", {})
-            if not user:
-                continue
-
-            # Solo usuarios marcados como inactivos por 42
-            if user.get("active?", True):
-                continue
-
-            # Debe tener blackholed_at
-            bh_raw = cu.get("blackholed_at")
-            if not bh_raw:
-                continue
-
-            # updated_at = fecha real en que 42 procesó el blackhole
-            updated_raw = cu.get("updated_at") or bh_raw
-
-            try:
-                real_bh_dt = datetime.fromisoformat(
-                    updated_raw.replace("Z", "+00:00")
-                ).replace(tzinfo=None)
-            except Exception:
-                continue
-
-            # Fecha límite original (informativa)
-            try:
-                deadline_dt = datetime.fromisoformat(
-                    bh_raw.replace("Z", "+00:00")
-                ).replace(tzinfo=None)
-            except Exception:
-                deadline_dt = real_bh_dt
-
-            days_ago = (now_utc - real_bh_dt).days
-
-            if debug and user.get("login") :
-                st.write(f"{user.get('login')} | updated_at: {updated_raw} | blackholed_at: {bh_raw} | active?: {user.get('active?')}")
-
-            results.append({
-                "Login":        user.get("login", ""),
-                "Display Name": user.get("displayname", ""),
-                "Kind":         user.get("kind", ""),
-                "Level":        round(float(cu.get("level", 0)), 2),
-                "Blackholed At": real_bh_dt,       # fecha real (updated_at)
-                "BH Deadline":   deadline_dt,       # blackholed_at original
-                "Days Ago":      days_ago,
-                "Eval Points":   int(user.get("correction_point", 0) or 0),
-                "Wallet":        int(user.get("wallet", 0) or 0),
-                "Pool":          f"{user.get('pool_month','') or ''} {user.get('pool_year','') or ''}".strip(),
-            })
-
-        status.text(f"📄 Página {page} · {len(results)} blackholed encontrados")
-        bar.progress(min(page / max_pages, 1.0))
-
-        if len(data) < 100:
-            break
-        page += 1
-
-    bar.empty()
-    status.empty()
     return results
 
+def load_top_n(n):
+    # Orden del listado (-updated_at) = orden de "Blackholed At": con N encontrados ya es definitivo
+    matches, stats = top_n_cursus_users(campus_id, 21, headers, n, es_blackholed, max_pages, debug, filters=BH_FILTERS)
+    st.session_state["bh_topn"] = {"n": n, **stats}
+    return build_blackholed(matches, debug)
+
 # ── Load ──────────────────────────────────────────────────────────────────────
+topn_state = st.session_state.get("bh_topn")
+
 if load_btn:
     with st.spinner("Escaneando blackholed…"):
-        rows = fetch_blackholed(campus_id, headers, max_pages, debug)
+        if topn_mode:
+            rows = load_top_n(int(top_n))
+        else:
+            dataset = load_cursus_users(campus_id, 21, headers, max_pages, debug, filters=BH_FILTERS)
+            rows = build_blackholed(dataset.view(max_pages), debug)
+            st.session_state.pop("bh_topn", None)
 
     if not rows:
         st.warning("⚠️ No se encontraron blackholed.")
@@ -211,6 +154,22 @@ if load_btn:
     st.session_state["bh_ts"] = datetime.now().strftime("%H:%M:%S")
     st.success(f"✅ {len(df)} blackholed encontrados en total")
 
+elif topn_mode and topn_state and int(top_n) > topn_state["n"]:
+    # Han subido N: se continúa el escaneo solo lo necesario desde donde se quedó
+    with st.spinner("Buscando más blackholed…"):
+        rows = load_top_n(int(top_n))
+    if rows:
+        st.session_state["bh_df"] = pd.DataFrame(rows).sort_values("Blackholed At", ascending=False)
+        st.session_state["bh_ts"] = datetime.now().strftime("%H:%M:%S")
+
+elif "bh_df" not in st.session_state:
+    # Sin pulsar nada: si otra página ya escaneó el cursus 21 de este campus, se reutiliza
+    dataset = cached_cursus_users(campus_id, 21, max_pages, filters=BH_FILTERS)
+    rows = build_blackholed(dataset.view(max_pages), debug) if dataset is not None else []
+    if rows:
+        st.session_state["bh_df"] = pd.DataFrame(rows).sort_values("Blackholed At", ascending=False)
+        st.session_state["bh_ts"] = dataset.scanned_at.strftime("%H:%M:%S")
+
 # ── Guard ─────────────────────────────────────────────────────────────────────
 if "bh_df" not in st.session_state or st.session_state["bh_df"].empty:
     st.info("👆 Pulsa **Cargar blackholed** en el sidebar para empezar.")
@@ -242,8 +201,16 @@ for col, (val, lbl) in zip(
         unsafe_allow_html=True
     )
 
+topn_state = st.session_state.get("bh_topn")
+topn_info = ""
+if topn_state:
+    topn_info = (
+        f" · ⚡ top-N: {topn_state['pages']}/{topn_state['planned']} páginas escaneadas"
+        f" ({topn_state['saved']} ahorradas; el total cuenta solo esas páginas)"
+    )
+
 st.markdown(
-    f"<br><small style='color:var(--muted)'>Última carga: {ts} · mostrando últimos {int(top_n)} de {len(df)}</small>",
+    f"<br><small style='color:var(--muted)'>Última carga: {ts} · mostrando últimos {int(top_n)} de {len(df)}{topn_info}</small>",
     unsafe_allow_html=True
 )
 st.markdown("---")
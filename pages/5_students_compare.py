@@ -1,8 +1,9 @@
 import streamlit as st
-import requests
 import pandas as pd
-import time
-from datetime import datetime, timezone, date
+from datetime import datetime, date
+from api.auth import get_auth_headers
+from api.point_ledger import get_point_ledger
+from api.user_directory import resolve_logins
 
 # ── Page config ───────────────────────────────────────────────────────────────
 st.set_page_config(page_title="🏫 Campus Eval Points", page_icon="🏫", layout="wide")
@@ -35,43 +36,7 @@ st.markdown('<div class="page-title">🏫 Campus Eval Points</div>', unsafe_allo
 st.markdown('<div class="page-sub">Comparativa de correction points en 4 fechas — solo students</div>', unsafe_allow_html=True)
 
 # ── Auth ──────────────────────────────────────────────────────────────────────
-def get_token():
-    try:
-        cid  = st.secrets["api42"]["client_id"]
-        csec = st.secrets["api42"]["client_secret"]
-        resp = requests.post("https://api.intra.42.fr/oauth/token", data={
-            "grant_type":    "client_credentials",
-            "client_id":     cid,
-            "client_secret": csec,
-        }, timeout=10)
-        if resp.status_code == 200:
-            return resp.json().get("access_token")
-        st.error(f"❌ Token error {resp.status_code}: {resp.text}")
-    except Exception as e:
-        st.error(f"Auth error: {e}")
-    return None
-
-def get_headers(force=False):
-    token_ts = st.session_state.get("token_ts")
-    now      = datetime.now(timezone.utc)
-    expired  = not token_ts or (now - token_ts).total_seconds() > 5400
-    if force or expired or "api_headers" not in st.session_state:
-        token = get_token()
-        if not token:
-            return None
-        st.session_state["api_headers"] = {"Authorization": f"Bearer {token}"}
-        st.session_state["token_ts"]    = now
-    return st.session_state["api_headers"]
-
-def api_get(url, headers):
-    resp = requests.get(url, headers=headers, timeout=20)
-    if resp.status_code == 401:
-        headers = get_headers(force=True)
-        if headers:
-            resp = requests.get(url, headers=headers, timeout=20)
-    return resp
-
-headers = get_headers()
+headers = get_auth_headers()
 if not headers:
     st.error("❌ No se pudo autenticar. Revisa los secrets.")
     st.stop()
@@ -112,51 +77,16 @@ with st.sidebar:
 
     st.markdown("---")
     st.markdown(f"""
-    Se consultará el historial completo de **{len(src_df)} students** para:
+    Se consultará el historial de **{len(src_df)} students** para:
     - 19/02/2026
     - 24/02/2026
     - {date_base.strftime('%d/%m/%Y')}
     - Hoy (puntos actuales de la API)
 
-    ⏱️ Puede tardar varios minutos.
+    ⏱️ La primera vez puede tardar varios minutos; después solo se piden los movimientos nuevos.
     """)
     calc_btn = st.button("🚀 Calcular comparativa", type="primary", use_container_width=True)
 
-# ── Fetch historial completo de un usuario ────────────────────────────────────
-def fetch_full_history(user_id, headers):
-    """Descarga todo el historial de correction_point_historics y devuelve DataFrame."""
-    all_records = []
-    page = 1
-    while True:
-        url = (
-            f"https://api.intra.42.fr/v2/users/{user_id}/correction_point_historics"
-            f"?page[size]=100&page[number]={page}&sort=-created_at"
-        )
-        resp = api_get(url, headers)
-        if resp.status_code == 429:
-            time.sleep(int(resp.headers.get("Retry-After", 5)))
-            continue
-        if resp.status_code != 200:
-            break
-        data = resp.json()
-        if not data:
-            break
-        all_records.extend(data)
-        if len(data) < 100:
-            break
-        page += 1
-
-    if not all_records:
-        return None
-
-    df = pd.DataFrame(all_records)
-    df["created_at_dt"] = pd.to_datetime(
-        df.get("created_at", df.get("updated_at")),
-        utc=True, errors="coerce"
-    ).dt.tz_localize(None)
-    df = df.sort_values("created_at_dt", ascending=False).reset_index(drop=True)
-    return df
-
 # ── Puntos en una fecha dada a partir del historial ya descargado ─────────────
 def pts_on_date(hist_df, target_date):
     """
@@ -208,23 +138,36 @@ if calc_btn:
     pts_d2   = {}
     pts_base_map = {}
 
+    # Perfiles de toda la cohorte a lotes (una request por cada 100 logins)
+    status.text(f"⏳ Resolviendo {total} logins…")
+    profiles = resolve_logins(src_df["Login"], headers)
+    user_ids = [p["id"] for p in profiles.values() if p and p.get("id")]
+
+    # Historial local: solo se piden los movimientos posteriores al último guardado
+    status.text(f"⏳ Poniendo al día el historial de {len(user_ids)} students…")
+    ledger = get_point_ledger()
+    synced = ledger.sync(
+        user_ids, headers,
+        progress=lambda done, n: bar.progress(done / n, text=f"Historial {done}/{n}"),
+    )
+    if debug:
+        st.write(f"🐛 Historial: {synced['users']} students consultados · {synced['requests']} requests · "
+                 f"{synced['errors']} errores")
+    histories = ledger.histories(user_ids)
+
     for i, row in src_df.iterrows():
         login = row["Login"]
         status.text(f"⏳ {i+1}/{total} — {login}")
-        bar.progress((i + 1) / total)
+        bar.progress((i + 1) / total, text="Procesando usuarios…")
 
         # Obtener user_id
-        resp = api_get(f"https://api.intra.42.fr/v2/users/{login}", headers)
-        if resp.status_code != 200:
-            pts_d1[login] = pts_d2[login] = pts_base_map[login] = None
-            continue
-        user_id = resp.json().get("id")
+        profile = profiles.get(str(login).strip().lower())
+        user_id = profile.get("id") if profile else None
         if not user_id:
             pts_d1[login] = pts_d2[login] = pts_base_map[login] = None
             continue
 
-        # Descargar historial completo UNA sola vez
-        hist_df = fetch_full_history(user_id, headers)
+        hist_df = histories.get(user_id)
 
         if hist_df is None:
             pts_d1[login] = pts_d2[login] = pts_base_map[login] = None
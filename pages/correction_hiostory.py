@@ -1,8 +1,10 @@
 import streamlit as st
-import requests
 import pandas as pd
-import time
-from datetime import datetime, timezone, date
+from datetime import datetime, date
+from api import client
+from api.auth import get_auth_headers
+from api.point_ledger import get_point_ledger
+from api.user_directory import resolve_logins
 
 # ── Page config ───────────────────────────────────────────────────────────────
 st.set_page_config(page_title="📅 Generador por Fechas", page_icon="📅", layout="wide")
@@ -25,81 +27,12 @@ st.markdown('<div class="page-title">📅 Generador de Puntos por Fecha</div>',
 st.markdown('<div class="page-sub">Consulta el saldo exacto de puntos de toda la cohorte en una fecha específica</div>', unsafe_allow_html=True)
 
 # ── Auth (API 42) ─────────────────────────────────────────────────────────────
-def get_token():
-    try:
-        cid  = st.secrets["api42"]["client_id"]
-        csec = st.secrets["api42"]["client_secret"]
-        resp = requests.post("https://api.intra.42.fr/oauth/token", data={
-            "grant_type":    "client_credentials",
-            "client_id":      cid,
-            "client_secret": csec,
-        }, timeout=10)
-        if resp.status_code == 200:
-            return resp.json().get("access_token")
-        st.error(f"❌ Token error {resp.status_code}: {resp.text}")
-    except Exception as e:
-        st.error(f"Auth error: {e}")
-    return None
-
-def get_headers(force=False):
-    token_ts = st.session_state.get("token_ts")
-    now      = datetime.now(timezone.utc)
-    expired  = not token_ts or (now - token_ts).total_seconds() > 5400
-    if force or expired or "api_headers" not in st.session_state:
-        token = get_token()
-        if not token:
-            return None
-        st.session_state["api_headers"] = {"Authorization": f"Bearer {token}"}
-        st.session_state["token_ts"]    = now
-    return st.session_state["api_headers"]
-
-def api_get(url, headers):
-    resp = requests.get(url, headers=headers, timeout=20)
-    if resp.status_code == 401:
-        headers = get_headers(force=True)
-        if headers:
-            resp = requests.get(url, headers=headers, timeout=20)
-    return resp
-
-headers = get_headers()
+headers = get_auth_headers()
 if not headers:
     st.error("❌ No se pudo autenticar. Revisa los secrets.")
     st.stop()
 
 # ── Métodos de Inferencia de Puntos Históricos ────────────────────────────────
-def fetch_full_history(user_id, headers):
-    """Descarga todo el historial de puntos de un alumno."""
-    all_records = []
-    page = 1
-    while True:
-        url = f"https://api.intra.42.fr/v2/users/{user_id}/correction_point_historics?page[size]=100&page[number]={page}&sort=-created_at"
-        resp = api_get(url, headers)
-        
-        if resp.status_code == 429:
-            wait = int(resp.headers.get("Retry-After", 5))
-            time.sleep(wait)
-            continue
-            
-        if resp.status_code != 200:
-            break
-            
-        data = resp.json()
-        if not data:
-            break
-            
-        all_records.extend(data)
-        if len(data) < 100:
-            break
-        page += 1
-        
-    if not all_records:
-        return None
-        
-    df = pd.DataFrame(all_records)
-    date_col = "created_at" if "created_at" in df.columns else "updated_at"
-    df["created_at_dt"] = pd.to_datetime(df[date_col], utc=True, errors="coerce").dt.tz_localize(None)
-    return df.sort_values("created_at_dt", ascending=False).reset_index(drop=True)
-
 def pts_on_date(df, target_date):
     """Calcula el saldo exacto al final del día buscado (EOD)."""
     end_of_day = datetime(target_date.year, target_date.month, target_date.day, 23, 59, 59)
@@ -163,19 +96,33 @@ else:
         resultados = []
         total_estudiantes = len(selected_logins)
 
+        # Perfiles de toda la cohorte a lotes (una request por cada 100 logins)
+        status_text.text(f"⏳ Resolviendo {total_estudiantes} logins…")
+        perfiles = resolve_logins(selected_logins, headers)
+
+        historiales = {}
+        if target_date != date.today():
+            # Historial local: solo se piden los movimientos posteriores al último guardado
+            ids = [p["id"] for p in perfiles.values() if p and p.get("id")]
+            status_text.text(f"⏳ Poniendo al día el historial de {len(ids)} alumnos…")
+            ledger = get_point_ledger()
+            ledger.sync(ids, headers,
+                        progress=lambda hechos, n: progress_bar.progress(hechos / n, text=f"Historial {hechos}/{n}"))
+            historiales = ledger.histories(ids)
+
         for idx, login in enumerate(selected_logins):
             login_clean = str(login).strip()
             status_text.text(f"⏳ {idx+1}/{total_estudiantes} — Analizando: {login_clean}")
             progress_bar.progress((idx + 1) / total_estudiantes)
 
-            # 1. Intentar consulta estándar del Perfil del usuario
-            resp_user = api_get(f"https://api.intra.42.fr/v2/users/{login_clean}", headers)
+            # 1. Perfil del usuario (ya resuelto en lote)
+            user_data = perfiles.get(login_clean.lower())
             
             # ── SISTEMA DE FALLBACK ANTE CUALQUIER FALLO DE PERFIL (No encontrado / Caída de API) ──
-            if resp_user.status_code != 200:
+            if user_data is None:
                 # Intentamos atacar directamente la ruta de históricos para recuperar su balance transaccional
                 url_fallback = f"https://api.intra.42.fr/v2/users/{login_clean}/correction_point_historics?page[size]=100&sort=-created_at"
-                resp_fb = api_get(url_fallback, headers)
+                resp_fb = client.get(url_fallback, headers=headers)
                 
                 if resp_fb.status_code == 200 and resp_fb.json():
                     # Si tiene históricos, construimos el dataframe simulado y aplicamos la inferencia temporal de la fecha solicitada
@@ -201,7 +148,6 @@ else:
                 continue
             
             # 2. Si el perfil responde correctamente
-            user_data = resp_user.json()
             user_id = user_data.get("id")
             puntos_actuales = user_data.get("correction_point", 0)
             puntos_actuales = int(puntos_actuales) if puntos_actuales is not None else 0
@@ -214,8 +160,8 @@ else:
             if target_date == date.today():
                 resultados.append({"Login": login_clean, nombre_columna_puntos: puntos_actuales, "Estatus": "OK"})
             else:
-                # Consultar historial completo del estudiante para extraer el balance de la fecha pedida
-                hist_df = fetch_full_history(user_id, headers)
+                # Historial del estudiante (ledger local) para extraer el balance de la fecha pedida
+                hist_df = historiales.get(user_id)
                 if hist_df is None or hist_df.empty:
                     # Si no hay transacciones registradas en su cuenta, su saldo histórico siempre ha sido su saldo actual
                     resultados.append({"Login": login_clean, nombre_columna_puntos: puntos_actuales, "Estatus": "OK (Sin transacciones)"})
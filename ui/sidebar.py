@@ -1,8 +1,13 @@
 # ui/sidebar.py
 
+import time
+
 import streamlit as st
 from api.auth import get_auth_token
 from api.campus import get_campus
+from api.http_cache import get_cache
+from api.registry import get_registry
+from api.scheduler import start_scheduler
 from config.settings import EXTERNAL_APPS, SEARCH_METHODS, DEFAULT_DAYS_BACK, DEFAULT_MAX_USERS
 
 def render_sidebar():
@@ -84,14 +89,15 @@ def render_sidebar():
             st.info("🔍 **Modo:** Solo usuarios actualmente en el campus")
             
             # Botón para limpiar cache si hay problemas
-            if st.button("🗑️ Limpiar Cache", help="Limpiar cache de autenticación"):
-                st.cache_data.clear()
+            if st.button("🗑️ Limpiar Cache", help="Vacía la caché en memoria (las respuestas en disco se revalidan)"):
+                get_cache().clear_memory()
+                get_cache().expire()
                 st.success("✅ Cache limpiado")
                 st.rerun()
             
             # Botón para recargar campus
             if st.button("🔄 Recargar Campus", help="Fuerza la recarga de la lista de campus"):
-                st.cache_data.clear()
+                get_cache().expire()
                 st.rerun()
         
         # Configuración fija para usuarios activos
@@ -111,6 +117,25 @@ def render_sidebar():
             st.markdown("**🏆 Top 5 Países:**")
             for country, count in top_countries:
                 st.markdown(f"- {country}: {count} campus")
+            
+            if debug_mode:
+                cache_stats = get_cache().summary()
+                st.markdown("**💾 Caché HTTP:**")
+                st.markdown(f"- {cache_stats['hits']} hits ({cache_stats['memory_hits']} en memoria) · "
+                            f"{cache_stats['revalidated']} revalidadas (304) · {cache_stats['misses']} misses")
+                st.markdown(f"- Memoria: {cache_stats['memory_entries']} respuestas · {cache_stats['memory_bytes'] / 2**20:.1f} MB · "
+                            f"disco: {cache_stats['disk_bytes'] / 2**20:.1f} MB · "
+                            f"{cache_stats['evictions']} + {cache_stats['disk_evictions']} desalojos")
+                st.markdown(f"- Ahorrado: {cache_stats['bytes_saved'] / 1024:.0f} KB · {cache_stats['seconds_saved']:.1f} s")
+                registry = get_registry().summary()
+                st.markdown("**🗃️ Datasets compartidos:**")
+                st.markdown(f"- {registry['entries']} datasets · {registry['bytes'] / 2**20:.1f} MB · {registry['handles']} handles de sesión")
+                st.markdown(f"- {registry['hits']} hits · {registry['misses']} misses · {registry['evictions']} desalojos")
+                st.markdown("**🔥 Precalentado:**")
+                for name, job in sorted(start_scheduler().status.items()):
+                    age = int(time.time() - job["at"])
+                    outcome = f"❌ {job['error']}" if job["error"] else f"{job['result']} registros"
+                    st.markdown(f"- {name}: hace {age} s · {job['seconds']:.1f} s · {outcome}")
         
         st.markdown("---")
         